@@ -1,14 +1,20 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response
 from flask_cors import CORS
 import torch
 from collections import OrderedDict
 import os
 import requests # <--- ADD THIS IMPORT
 from io import BytesIO # <--- ADD THIS IMPORT
+import uuid
+import zipfile
 
 # Import the model architecture and our universal processor
 from network import U2NET
-from processor import process_image
+from processor import process_image, process_image_multi, GARMENT_CLASSES, RENDERERS, OUTPUT_TYPES, RESOLUTIONS
+from processor import TileSettings, DEFAULT_TILING
+from label_cache import LabelMapCache
+from scheduler import BatchScheduler
+from inference_model import load_backend
 
 # --- 1. SETUP & MODEL LOADING ---
 app = Flask(__name__)
@@ -39,6 +45,55 @@ net = U2NET(in_ch=3, out_ch=4)
 net = load_checkpoint_for_api(net, 'cloth_segm.pth')
 net.eval()
 
+# Requests run an inference build of the network: BatchNorm folded into the
+# convolutions, channels_last, only the fused d0 output. SEGMENT_BACKEND picks
+# how it runs: eager (PyTorch), torchscript (traced and frozen), onnx (ONNX
+# Runtime, exported to SEGMENT_ONNX_PATH on first start) or int8 (the quantized
+# model at SEGMENT_INT8_PATH, made with quantization.py).
+# SEGMENT_BACKEND=original serves the unmodified training network.
+SEGMENT_BACKEND = os.environ.get('SEGMENT_BACKEND', 'eager')
+SEGMENT_ONNX_PATH = os.environ.get('SEGMENT_ONNX_PATH', 'cloth_segm.onnx')
+SEGMENT_INT8_PATH = os.environ.get('SEGMENT_INT8_PATH', 'cloth_segm_int8.pt')
+if SEGMENT_BACKEND != 'original':
+    print(f"Building the '{SEGMENT_BACKEND}' inference backend ...")
+    net = load_backend(
+        SEGMENT_BACKEND, net, onnx_path=SEGMENT_ONNX_PATH,
+        checkpoint_path='cloth_segm.pth', int8_path=SEGMENT_INT8_PATH,
+    )
+
+# Requests don't call `net` directly: the scheduler stacks the inputs of
+# concurrent requests into one batch and runs a single forward pass for all
+# of them. Serve with several threads (the default for app.run, or e.g.
+# `gunicorn --threads 8 app:app`) so there are concurrent requests to batch.
+# SEGMENT_BATCHING=0 calls the network directly, one image at a time.
+SEGMENT_BATCHING = os.environ.get('SEGMENT_BATCHING', '1') != '0'
+SEGMENT_BATCH_MAX_SIZE = int(os.environ.get('SEGMENT_BATCH_MAX_SIZE', '4'))
+SEGMENT_BATCH_MAX_WAIT_MS = float(os.environ.get('SEGMENT_BATCH_MAX_WAIT_MS', '10'))
+if SEGMENT_BATCHING:
+    inference_model = BatchScheduler(net, max_batch_size=SEGMENT_BATCH_MAX_SIZE, max_wait_ms=SEGMENT_BATCH_MAX_WAIT_MS)
+else:
+    inference_model = net
+
+# Label maps of images we've already segmented, keyed by a hash of the image
+# bytes. Any garment of a repeated image is then rendered without re-running
+# the network. LABEL_CACHE_MB bounds memory (0 disables the cache);
+# LABEL_CACHE_DIR adds an on-disk tier that survives restarts.
+LABEL_CACHE_MB = float(os.environ.get('LABEL_CACHE_MB', '256'))
+LABEL_CACHE_DIR = os.environ.get('LABEL_CACHE_DIR', '')
+# The namespace covers every file the served model comes from, so replacing
+# the checkpoint, the ONNX export or the int8 model retires the old maps.
+served_files = ['cloth_segm.pth']
+if SEGMENT_BACKEND == 'onnx':
+    served_files.append(SEGMENT_ONNX_PATH)
+elif SEGMENT_BACKEND == 'int8':
+    served_files.append(SEGMENT_INT8_PATH)
+model_stats = [os.stat(path) for path in served_files]
+label_cache = LabelMapCache(
+    max_bytes=LABEL_CACHE_MB * 1024 * 1024,
+    disk_dir=LABEL_CACHE_DIR,
+    namespace="-".join(f"{stat.st_size}-{stat.st_mtime_ns}" for stat in model_stats) + f"-{SEGMENT_BACKEND}",
+) if LABEL_CACHE_MB > 0 else None
+
 # --- 2. API ENDPOINTS ---
 
 # --- NEW SECTION: IMAGE PROXY ---
@@ -68,8 +123,89 @@ def proxy_image():
 # --- END OF NEW SECTION ---
 
 
+# --- OUTPUT FORMATS ---
+# Every /segment/... endpoint takes an optional 'output' form field:
+#   cutout   (default) the photo with the background transparent, PNG
+#   webp     the same cutout as lossless WebP; 'webp_level' 0-6 (default 0)
+#            trades encode time for size
+#   mask     8-bit grayscale mask PNG
+#   mask1bit 1-bit mask PNG
+#   rle      COCO run-length encoded mask, JSON
+#   polygons simplified outline polygons, JSON; 'tolerance' in pixels (default 2)
+# Clients that already have the photo can ask for a mask and composite it
+# themselves, which avoids re-encoding (and re-downloading) the full image.
+def parse_output_options(form):
+    """Reads 'output' and its settings from the form. Raises ValueError with a message for the client."""
+    output = form.get('output', 'cutout')
+    if output not in RENDERERS:
+        raise ValueError(f"Unknown output '{output}', expected one of {list(RENDERERS)}")
+    options = {}
+    if 'webp_level' in form:
+        try:
+            options['webp_level'] = int(form['webp_level'])
+        except ValueError:
+            raise ValueError("webp_level must be an integer from 0 to 6")
+        if not 0 <= options['webp_level'] <= 6:
+            raise ValueError("webp_level must be an integer from 0 to 6")
+    if 'tolerance' in form:
+        try:
+            options['tolerance'] = float(form['tolerance'])
+        except ValueError:
+            raise ValueError("tolerance must be a number of pixels")
+        if options['tolerance'] < 0:
+            raise ValueError("tolerance must be a number of pixels")
+    return output, options
+
+
+# --- INFERENCE RESOLUTION ---
+# Optional form fields of every /segment/... endpoint:
+#   resolution: model input size, one of SEGMENT_RESOLUTIONS (default
+#               SEGMENT_DEFAULT_RESOLUTION). 320 is plenty for thumbnails and
+#               several times cheaper than 768.
+#   refine:     '1' runs coarse-to-fine: the whole image at 320, then only the
+#               crops along the garment edges at `resolution`.
+#   tiled:      '1' runs large photos as overlapping tiles at their own
+#               resolution (up to SEGMENT_TILED_MAX_SIDE) for full detail;
+#               'resolution' and 'refine' are then ignored. At most
+#               SEGMENT_TILED_WORKERS tiles of a request run at once, fewer if
+#               they wouldn't fit in SEGMENT_TILED_MAX_MEMORY_MB. That cap is
+#               shared by all tiled requests of the process.
+SEGMENT_RESOLUTIONS = [int(r) for r in os.environ.get('SEGMENT_RESOLUTIONS', ','.join(map(str, RESOLUTIONS))).split(',')]
+SEGMENT_DEFAULT_RESOLUTION = int(os.environ.get('SEGMENT_DEFAULT_RESOLUTION', '768'))
+if SEGMENT_DEFAULT_RESOLUTION not in SEGMENT_RESOLUTIONS:
+    # Caught at startup rather than as a 400 on every request without a resolution.
+    raise ValueError(f"SEGMENT_DEFAULT_RESOLUTION={SEGMENT_DEFAULT_RESOLUTION} is not one of SEGMENT_RESOLUTIONS {SEGMENT_RESOLUTIONS}")
+SEGMENT_TILING = TileSettings(
+    tile=int(os.environ.get('SEGMENT_TILE_SIZE', DEFAULT_TILING.tile)),
+    overlap=int(os.environ.get('SEGMENT_TILE_OVERLAP', DEFAULT_TILING.overlap)),
+    max_side=int(os.environ.get('SEGMENT_TILED_MAX_SIDE', DEFAULT_TILING.max_side)),
+    max_memory_mb=float(os.environ.get('SEGMENT_TILED_MAX_MEMORY_MB', DEFAULT_TILING.max_memory_mb)),
+    workers=int(os.environ.get('SEGMENT_TILED_WORKERS', DEFAULT_TILING.workers)),
+)
+
+
+def parse_inference_options(form):
+    """Reads 'resolution', 'refine' and 'tiled' from the form. Raises ValueError with a message for the client."""
+    try:
+        resolution = int(form.get('resolution', SEGMENT_DEFAULT_RESOLUTION))
+    except ValueError:
+        resolution = None
+    if resolution not in SEGMENT_RESOLUTIONS:
+        raise ValueError(f"resolution must be one of {SEGMENT_RESOLUTIONS}")
+    return {
+        'resolution': resolution,
+        'refine': form.get('refine', '0') in ('1', 'true'),
+        'tiling': SEGMENT_TILING if form.get('tiled', '0') in ('1', 'true') else None,
+    }
+
+
 # ... (Your existing handle_request helper function and all /segment/... endpoints) ...
 def handle_request(processing_function):
+    try:
+        output, options = parse_output_options(request.form)
+        options.update(parse_inference_options(request.form))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     file = request.files['file']
@@ -78,13 +214,13 @@ def handle_request(processing_function):
         
     try:
         image_bytes = file.read()
-        segmented_image_bytes = processing_function(image_bytes, net)
+        segmented_image_bytes = processing_function(image_bytes, inference_model, output=output, **options)
 
         if segmented_image_bytes is None:
             print("Image processing failed, returning 500 error to client.")
             return jsonify({'error': 'Image processing failed on the server. The image might be invalid or corrupted.'}), 500
 
-        return send_file(segmented_image_bytes, mimetype='image/png')
+        return send_file(segmented_image_bytes, mimetype=OUTPUT_TYPES[output][0])
         
     except Exception as e:
         print(f"An unhandled error occurred in handle_request: {e}")
@@ -93,34 +229,118 @@ def handle_request(processing_function):
 @app.route('/segment/top', methods=['POST'])
 def segment_top_endpoint():
     print("Request for TOP: using classes [1]")
-    return handle_request(lambda img, model: process_image(img, model, classes_to_keep=[1]))
+    return handle_request(lambda img, model, **kw: process_image(img, model, classes_to_keep=GARMENT_CLASSES['top'], cache=label_cache, **kw))
 
 @app.route('/segment/bottom', methods=['POST'])
 def segment_bottom_endpoint():
     print("Request for BOTTOM: using classes [2]")
-    return handle_request(lambda img, model: process_image(img, model, classes_to_keep=[2]))
+    return handle_request(lambda img, model, **kw: process_image(img, model, classes_to_keep=GARMENT_CLASSES['bottom'], cache=label_cache, **kw))
 
 @app.route('/segment/skirt', methods=['POST'])
 def segment_skirt_endpoint():
     print("Request for SKIRT: using classes [2, 3]")
-    return handle_request(lambda img, model: process_image(img, model, classes_to_keep=[2, 3]))
+    return handle_request(lambda img, model, **kw: process_image(img, model, classes_to_keep=GARMENT_CLASSES['skirt'], cache=label_cache, **kw))
 
 @app.route('/segment/coord', methods=['POST'])
 def segment_coord_endpoint():
     print("Request for COORD: using classes [1, 2]")
-    return handle_request(lambda img, model: process_image(img, model, classes_to_keep=[1, 2]))
+    return handle_request(lambda img, model, **kw: process_image(img, model, classes_to_keep=GARMENT_CLASSES['coord'], cache=label_cache, **kw))
 
 @app.route('/segment/kurta', methods=['POST'])
 def segment_kurta_endpoint():
     print("Request for KURTA: using classes [3]")
-    return handle_request(lambda img, model: process_image(img, model, classes_to_keep=[3]))
+    return handle_request(lambda img, model, **kw: process_image(img, model, classes_to_keep=GARMENT_CLASSES['kurta'], cache=label_cache, **kw))
 
 @app.route('/segment/lehenga', methods=['POST'])
 def segment_lehenga_endpoint():
     print("Request for LEHENGA: using classes [1, 3]")
-    return handle_request(lambda img, model: process_image(img, model, classes_to_keep=[1, 3]))
+    return handle_request(lambda img, model, **kw: process_image(img, model, classes_to_keep=GARMENT_CLASSES['lehenga'], cache=label_cache, **kw))
+
+
+# --- MULTI-GARMENT SEGMENTATION ---
+# Runs the network ONCE per photo and returns several garments from the same
+# prediction, instead of one full forward pass per /segment/<garment> call.
+#
+# Form fields (besides 'file'):
+#   garments: comma-separated names from GARMENT_CLASSES (default: all)
+#   output:   any output format above (default 'cutout'), plus its settings
+#   format:   'zip' (default, one <garment>.<ext> per entry) or 'multipart'
+def build_multipart(parts, output):
+    mimetype, extension = OUTPUT_TYPES[output]
+    boundary = uuid.uuid4().hex
+    body = BytesIO()
+    for name, data in parts:
+        body.write(f"--{boundary}\r\n".encode())
+        body.write(f"Content-Type: {mimetype}\r\n".encode())
+        body.write(f'Content-Disposition: attachment; name="{name}"; filename="{name}.{extension}"\r\n\r\n'.encode())
+        body.write(data.getvalue())
+        body.write(b"\r\n")
+    body.write(f"--{boundary}--\r\n".encode())
+    return Response(body.getvalue(), mimetype=f"multipart/mixed; boundary={boundary}")
+
+
+def build_zip(parts, output):
+    mimetype, extension = OUTPUT_TYPES[output]
+    archive = BytesIO()
+    # Images are already compressed, so store them as they are; JSON isn't.
+    compression = zipfile.ZIP_DEFLATED if mimetype == 'application/json' else zipfile.ZIP_STORED
+    with zipfile.ZipFile(archive, 'w', compression=compression) as zf:
+        for name, data in parts:
+            zf.writestr(f"{name}.{extension}", data.getvalue())
+    archive.seek(0)
+    return send_file(archive, mimetype='application/zip', as_attachment=True, download_name='segments.zip')
+
+
+@app.route('/segment/multi', methods=['POST'])
+def segment_multi_endpoint():
+    requested = request.form.get('garments', '')
+    garments = [g.strip().lower() for g in requested.split(',') if g.strip()] or list(GARMENT_CLASSES)
+    unknown = [g for g in garments if g not in GARMENT_CLASSES]
+    if unknown:
+        return jsonify({'error': f"Unknown garments {unknown}, expected some of {list(GARMENT_CLASSES)}"}), 400
+    try:
+        output, options = parse_output_options(request.form)
+        options.update(parse_inference_options(request.form))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response_format = request.form.get('format', 'zip')
+    if response_format not in ('zip', 'multipart'):
+        return jsonify({'error': f"Unknown format '{response_format}', expected 'zip' or 'multipart'"}), 400
+
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file part'}), 400
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'No selected file'}), 400
+
+    print(f"Request for MULTI: {garments} as {output} ({response_format})")
+    try:
+        parts = process_image_multi(file.read(), inference_model, garments, output=output, cache=label_cache, **options)
+        if parts is None:
+            return jsonify({'error': 'Image processing failed on the server. The image might be invalid or corrupted.'}), 500
+        return build_zip(parts, output) if response_format == 'zip' else build_multipart(parts, output)
+
+    except Exception as e:
+        print(f"An unhandled error occurred in segment_multi_endpoint: {e}")
+        return jsonify({'error': 'An internal server error occurred.'}), 500
+
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats_endpoint():
+    if label_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **label_cache.stats()})
+
+
+@app.route('/scheduler/stats', methods=['GET'])
+def scheduler_stats_endpoint():
+    if not SEGMENT_BATCHING:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **inference_model.stats()})
 
 
 # --- 3. RUN THE SERVER ---
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8001, debug=True)
\ No newline at end of file
+    # The debug reloader imports this module twice (loading the model twice),
+    # so it is opt-in via FLASK_DEBUG=1.
+    app.run(host='0.0.0.0', port=8001, debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True)
\ No newline at end of file
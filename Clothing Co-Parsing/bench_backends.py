@@ -0,0 +1,107 @@
+"""
+Parity check and CPU latency comparison of the inference backends.
+
+Runs the original training network (Conv + BN, all side outputs) and every
+inference backend from inference_model.py on the same inputs, checks that
+each backend's d0 matches the original's (max absolute difference of the
+logits, share of pixels with the same predicted class), then times them.
+
+    python bench_backends.py --checkpoint cloth_segm.pth
+    python bench_backends.py --checkpoint cloth_segm.pth --backends eager onnx --size 512 --batch-size 2
+
+Exits with status 1 if any backend fails the parity check, so it can gate a
+model or dependency upgrade. Without --checkpoint the network gets random
+weights and random BatchNorm statistics (so the folding is not a no-op),
+which is enough for parity and timing.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from inference_model import ARCHITECTURES, BACKENDS, load_backend, load_net
+
+
+def random_net(arch):
+    net = ARCHITECTURES[arch](in_ch=3, out_ch=4)
+    for module in net.modules():
+        if isinstance(module, torch.nn.BatchNorm2d):
+            module.running_mean.uniform_(-0.5, 0.5)
+            module.running_var.uniform_(0.5, 2.0)
+            module.weight.data.uniform_(0.5, 1.5)
+            module.bias.data.uniform_(-0.2, 0.2)
+    return net.eval()
+
+
+def time_model(model, inputs, repeats):
+    with torch.no_grad():
+        model(inputs)  # warm-up, not measured
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            model(inputs)
+            timings.append(time.perf_counter() - started)
+    timings = np.array(timings) * 1000.0
+    return {
+        "mean_ms": round(float(timings.mean()), 1),
+        "p50_ms": round(float(np.percentile(timings, 50)), 1),
+        "images_per_s": round(inputs.shape[0] * 1000.0 / float(timings.mean()), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpoint", default=None)
+    parser.add_argument("--arch", choices=sorted(ARCHITECTURES), default="u2net")
+    # The int8 build is not expected to match fp32 this closely; eval_quantized.py measures it.
+    float_backends = [backend for backend in BACKENDS if backend != "int8"]
+    parser.add_argument("--backends", nargs="+", choices=float_backends, default=float_backends)
+    parser.add_argument("--size", type=int, default=768, help="Model input size")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=None, help="torch / ONNX Runtime intra-op threads")
+    parser.add_argument("--onnx-path", default=None, help="Where to export the ONNX model (default: a temp file)")
+    parser.add_argument("--atol", type=float, default=1e-3, help="Max allowed absolute difference of the logits")
+    parser.add_argument("--min-agreement", type=float, default=0.999, help="Min share of pixels with the same class")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    net = load_net(args.checkpoint, args.arch) if args.checkpoint else random_net(args.arch)
+    inputs = torch.randn(args.batch_size, 3, args.size, args.size)
+
+    with torch.no_grad():
+        reference = net(inputs)[0]
+    results = {"original": time_model(net, inputs, args.repeats)}
+    print(f"original: {results['original']}")
+
+    failed = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        onnx_path = args.onnx_path or os.path.join(tmp_dir, "model.onnx")
+        for backend in args.backends:
+            model = load_backend(backend, net, onnx_path=onnx_path, threads=args.threads, checkpoint_path=args.checkpoint)
+            with torch.no_grad():
+                d0 = model(inputs)
+            max_diff = float((d0 - reference).abs().max())
+            agreement = float((d0.argmax(dim=1) == reference.argmax(dim=1)).float().mean())
+            ok = max_diff <= args.atol and agreement >= args.min_agreement
+            if not ok:
+                failed.append(backend)
+
+            results[backend] = time_model(model, inputs, args.repeats)
+            speedup = results["original"]["mean_ms"] / results[backend]["mean_ms"]
+            print(f"{backend}: {results[backend]}, {speedup:.2f}x")
+            print(f"  parity {'ok' if ok else 'FAILED'}: max |d0 diff| {max_diff:.2e}, class agreement {agreement:.5f}")
+
+    if failed:
+        print(f"Parity check failed for: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
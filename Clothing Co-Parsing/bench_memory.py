@@ -0,0 +1,126 @@
+"""
+Peak memory of one U2NET forward pass: the current model vs the lean
+inference forward.
+
+Variants:
+    original         forward() as trained: all seven outputs
+    d0_only          side_outputs=False: same forward, returns only d0
+    lean             lean=True: activations freed after last use, in-place sums
+    inference_build  inference_model.build_inference_net: BN folded,
+                     channels_last and lean (what the eager backend serves)
+
+For each it reports the peak of PyTorch's CPU allocator during the forward
+(from the torch profiler's memory events) and the process's peak RSS growth,
+measured in a fresh subprocess per variant so earlier runs don't hide it.
+At small sizes the RSS figure can read 0: loading the model already peaked
+higher than the forward does.
+
+    python bench_memory.py --checkpoint cloth_segm.pth --size 768
+    python bench_memory.py --size 512 --batch-size 2
+
+Before measuring, it checks that every variant's d0 matches the original's.
+"""
+import argparse
+import multiprocessing
+import resource
+import time
+
+import torch
+from torch.profiler import ProfilerActivity, profile
+
+from inference_model import ARCHITECTURES, build_inference_net, load_net
+
+VARIANTS = ("original", "d0_only", "lean", "inference_build")
+
+
+def build(variant, checkpoint, arch):
+    if checkpoint:
+        net = load_net(checkpoint, arch)
+    else:
+        torch.manual_seed(0)
+        net = ARCHITECTURES[arch](in_ch=3, out_ch=4).eval()
+    if variant == "d0_only":
+        net.side_outputs = False
+    elif variant == "lean":
+        net.lean = True
+    elif variant == "inference_build":
+        net = build_inference_net(net)
+    return net
+
+
+def allocator_peak(net, inputs):
+    """Peak bytes held by PyTorch's CPU allocator during one forward, above what was held before it."""
+    with torch.no_grad(), profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        net(inputs)
+    events = sorted(
+        (event.start_ns(), event.nbytes())
+        for event in prof.profiler.kineto_results.events()
+        if event.name() == "[memory]"
+    )
+    held = peak = 0
+    for _, nbytes in events:
+        held += nbytes
+        peak = max(peak, held)
+    return peak
+
+
+def max_difference(checkpoint, arch, variants, size=128):
+    """Largest |d0 - original d0| over the variants, on one random input."""
+    inputs = torch.randn(1, 3, size, size)
+    with torch.no_grad():
+        reference = build("original", checkpoint, arch)(inputs)[0]
+        return {variant: float((build(variant, checkpoint, arch)(inputs) - reference).abs().max())
+                for variant in variants if variant != "original"}
+
+
+def measure(variant, checkpoint, arch, size, batch_size):
+    """Runs in a fresh process: peak RSS growth, allocator peak and latency of one forward."""
+    net = build(variant, checkpoint, arch)
+    with torch.no_grad():
+        net(torch.randn(1, 3, 64, 64))  # warm-up at a size too small to matter
+    inputs = torch.randn(batch_size, 3, size, size)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    with torch.no_grad():
+        net(inputs)
+    elapsed = time.perf_counter() - started
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "peak_rss_mb": round((rss_peak - rss_before) / 1024.0, 1),  # ru_maxrss is in KB on Linux
+        "allocator_peak_mb": round(allocator_peak(net, inputs) / 2 ** 20, 1),
+        "forward_ms": round(elapsed * 1000.0, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpoint", default=None, help="Default: random weights (same memory use)")
+    parser.add_argument("--arch", choices=sorted(ARCHITECTURES), default="u2net")
+    parser.add_argument("--size", type=int, default=768)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--variants", nargs="+", choices=VARIANTS, default=list(VARIANTS))
+    args = parser.parse_args()
+
+    for variant, difference in max_difference(args.checkpoint, args.arch, args.variants).items():
+        print(f"{variant}: max |d0 - original| = {difference:.2e}")
+        if difference > 1e-3:
+            raise SystemExit(f"{variant} does not match the original model")
+
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for variant in args.variants:
+        with context.Pool(1) as pool:
+            results[variant] = pool.apply(measure, (variant, args.checkpoint, args.arch, args.size, args.batch_size))
+        print(f"{variant}: {results[variant]}")
+
+    if "original" in results:
+        base = results["original"]
+        print(f"\n{'variant':<18}{'peak RSS MB':>14}{'allocator MB':>14}{'forward ms':>12}")
+        for variant, row in results.items():
+            print(f"{variant:<18}{row['peak_rss_mb']:>14.1f}{row['allocator_peak_mb']:>14.1f}{row['forward_ms']:>12.1f}"
+                  f"   ({row['allocator_peak_mb'] / base['allocator_peak_mb']:.0%} of original)")
+
+
+if __name__ == "__main__":
+    main()
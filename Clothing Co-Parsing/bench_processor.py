@@ -0,0 +1,164 @@
+"""
+Per-stage micro-benchmark of the processor pipeline, before and after the
+NumPy/OpenCV rewrite.
+
+"before" is the previous PIL/torchvision pipeline (kept here verbatim for
+comparison), "after" is processor.py. The network is not run: the stages
+around it are timed on a synthetic d0, so the numbers are the pure
+pre/post-processing cost per request.
+
+    python bench_processor.py                       # synthetic 3000x4000 JPEG
+    python bench_processor.py --image photo.jpg --repeats 50
+
+For every stage it prints the mean time and the peak memory allocated
+while it runs (tracemalloc; NumPy and OpenCV buffers are counted, PIL and
+torch keep theirs outside the Python allocator, so "before" allocation
+figures are a lower bound).
+"""
+import argparse
+import io
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+
+import processor
+from processor import MODEL_INPUT_SIZE
+
+CLASSES = processor.GARMENT_CLASSES["lehenga"]
+
+
+# --- Before: the previous pipeline ---
+def legacy_decode(image_bytes):
+    img_cv2 = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    return Image.fromarray(cv2.cvtColor(img_cv2, cv2.COLOR_BGR2RGB))
+
+
+def legacy_preprocess(original_image):
+    img_for_model = original_image.resize((MODEL_INPUT_SIZE, MODEL_INPUT_SIZE), Image.BICUBIC)
+    transform = transforms.Compose([transforms.ToTensor(), transforms.Normalize([0.5] * 3, [0.5] * 3)])
+    return torch.unsqueeze(transform(img_for_model), 0)
+
+
+def legacy_label_map(d0):
+    pred = torch.max(d0, dim=1, keepdim=True)[1]
+    return torch.squeeze(pred, dim=0).cpu().numpy()[0].astype(np.uint8)
+
+
+def legacy_mask(label_map, size):
+    combined_mask = np.zeros_like(label_map, dtype=np.uint8)
+    for cls in CLASSES:
+        combined_mask[label_map == cls] = 255
+    return np.array(Image.fromarray(combined_mask, mode='L').resize(size, Image.BICUBIC))
+
+
+def legacy_cutout(original_image, alpha_mask_np):
+    original_image_bgr = cv2.cvtColor(np.array(original_image), cv2.COLOR_RGB2BGR)
+    _, img_encoded = cv2.imencode(".png", cv2.merge([original_image_bgr, alpha_mask_np]))
+    return io.BytesIO(img_encoded.tobytes())
+
+
+# --- After: processor.py ---
+def label_map_from_d0(d0):
+    return torch.max(d0[0], dim=0)[1].to(torch.uint8).numpy()
+
+
+def cutout(image, alpha_mask_np):
+    transparent_image_np = cv2.cvtColor(image.pixels, cv2.COLOR_BGR2BGRA)
+    transparent_image_np[:, :, 3] = alpha_mask_np
+    _, img_encoded = cv2.imencode(".png", transparent_image_np)
+    return io.BytesIO(img_encoded.tobytes())
+
+
+def pipelines(image_bytes, d0):
+    """Each pipeline is a list of (stage, fn(state) -> state)."""
+    before = [
+        ("decode", lambda s: dict(s, image=legacy_decode(image_bytes))),
+        ("preprocess", lambda s: dict(s, tensor=legacy_preprocess(s["image"]))),
+        ("label_map", lambda s: dict(s, label_map=legacy_label_map(d0))),
+        ("mask", lambda s: dict(s, mask=legacy_mask(s["label_map"], s["image"].size))),
+        ("cutout_png", lambda s: dict(s, png=legacy_cutout(s["image"], s["mask"]))),
+    ]
+    after = [
+        ("decode", lambda s: dict(s, image=processor.decode_image(image_bytes))),
+        ("preprocess", lambda s: dict(s, tensor=processor.preprocess(s["image"]))),
+        ("label_map", lambda s: dict(s, label_map=label_map_from_d0(d0))),
+        ("mask", lambda s: dict(s, mask=processor.garment_mask(s["label_map"], CLASSES, s["image"].size))),
+        ("cutout_png", lambda s: dict(s, png=cutout(s["image"], s["mask"]))),
+    ]
+    # Mask outputs don't need full-resolution pixels, so they decode reduced.
+    after_mask_only = [
+        ("decode", lambda s: dict(s, image=processor.decode_image(image_bytes, full_resolution=False))),
+    ] + after[1:4]
+    return {"before": before, "after": after, "after (mask output)": after_mask_only}
+
+
+def run_stages(stages, repeats):
+    timings = {name: [] for name, _ in stages}
+    for _ in range(repeats):
+        state = {}
+        for name, fn in stages:
+            started = time.perf_counter()
+            state = fn(state)
+            timings[name].append(time.perf_counter() - started)
+
+    # One more pass under tracemalloc for the allocations (it slows things down).
+    allocated = {}
+    state = {}
+    tracemalloc.start()
+    for name, fn in stages:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        state = fn(state)
+        _, peak = tracemalloc.get_traced_memory()
+        allocated[name] = peak - before
+    tracemalloc.stop()
+    return {name: (float(np.mean(timings[name])) * 1000.0, allocated[name] / 1024.0) for name, _ in stages}
+
+
+def synthetic_jpeg(width, height):
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([(x * 255 // width), (y * 255 // height), ((x + y) % 256)], axis=2).astype(np.uint8)
+    pixels = cv2.add(pixels, np.random.default_rng(0).integers(0, 20, pixels.shape, dtype=np.uint8))
+    return cv2.imencode(".jpg", pixels, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", default=None, help="Image file (default: a synthetic JPEG)")
+    parser.add_argument("--width", type=int, default=3000)
+    parser.add_argument("--height", type=int, default=4000)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            image_bytes = f.read()
+    else:
+        image_bytes = synthetic_jpeg(args.width, args.height)
+    d0 = torch.randn(1, 4, MODEL_INPUT_SIZE, MODEL_INPUT_SIZE)
+
+    results = {}
+    for name, stages in pipelines(image_bytes, d0).items():
+        run_stages(stages, 1)  # warm-up
+        results[name] = run_stages(stages, args.repeats)
+
+    print(f"{'stage':<12}" + "".join(f"{name:>28}" for name in results))
+    for stage in [name for name, _ in pipelines(image_bytes, d0)["before"]]:
+        cells = []
+        for result in results.values():
+            ms, kb = result.get(stage, (None, None))
+            cells.append(f"{ms:9.2f} ms {kb:10.0f} KB" if ms is not None else "-")
+        print(f"{stage:<12}" + "".join(f"{cell:>28}" for cell in cells))
+    print(f"{'total':<12}" + "".join(
+        f"{sum(ms for ms, _ in r.values()):9.2f} ms {sum(kb for _, kb in r.values()):10.0f} KB".rjust(28)
+        for r in results.values()
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Mask quality and latency per inference resolution.
+
+Runs every image in a folder at each resolution tier (and coarse-to-fine at
+the tiers above the coarse size) and compares the label maps with the
+768 baseline: per-class IoU for classes 1 (upper), 2 (lower) and 3 (full),
+computed at the image's own resolution, plus the mean latency of the
+network part (preprocess, forward passes, label map).
+
+    python bench_resolution.py --checkpoint cloth_segm.pth --images eval/
+    python bench_resolution.py --checkpoint cloth_segm.pth --images eval/ --backend onnx --json tiers.json
+
+Use real product photos: how much the coarse-to-fine mode saves depends on
+how long the garment boundaries are.
+"""
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+import processor
+from inference_model import BACKENDS, load_backend, load_net
+from quantization import image_paths
+
+CLASS_NAMES = {1: "upper", 2: "lower", 3: "full"}
+BASELINE = (processor.MODEL_INPUT_SIZE, False)
+
+
+def configurations(resolutions):
+    configs = [(size, False) for size in resolutions]
+    configs += [(size, True) for size in resolutions if size > processor.REFINE_COARSE_SIZE]
+    return configs
+
+
+def label(config):
+    size, refine = config
+    return f"{processor.REFINE_COARSE_SIZE}->{size} refine" if refine else str(size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpoint", default="cloth_segm.pth")
+    parser.add_argument("--backend", choices=("original",) + BACKENDS, default="eager")
+    parser.add_argument("--int8-path", default="cloth_segm_int8.pt")
+    parser.add_argument("--images", required=True, help="Folder of evaluation images")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--resolutions", type=int, nargs="+", default=list(processor.RESOLUTIONS))
+    parser.add_argument("--json", default=None, help="Also write the report here")
+    args = parser.parse_args()
+
+    net = load_net(args.checkpoint)
+    if args.backend != "original":
+        net = load_backend(args.backend, net, onnx_path="cloth_segm.onnx",
+                           checkpoint_path=args.checkpoint, int8_path=args.int8_path)
+    configs = configurations(args.resolutions)
+    if BASELINE not in configs:
+        configs.insert(0, BASELINE)
+
+    intersection = {config: {cls: 0 for cls in CLASS_NAMES} for config in configs}
+    union = {config: {cls: 0 for cls in CLASS_NAMES} for config in configs}
+    seconds = {config: [] for config in configs}
+    paths = image_paths(args.images, args.limit)
+    for i, path in enumerate(paths):
+        with open(path, "rb") as f:
+            image = processor.decode_image(f.read())
+        width, height = image.size
+        maps = {}
+        for config in configs:
+            size, refine = config
+            if i == 0:
+                processor.infer_label_map(image, net, size, refine)  # warm-up, not measured
+            started = time.perf_counter()
+            label_map = processor.infer_label_map(image, net, size, refine)
+            seconds[config].append(time.perf_counter() - started)
+            maps[config] = cv2.resize(label_map, (width, height), interpolation=cv2.INTER_NEAREST)
+
+        reference = maps[BASELINE]
+        for config in configs:
+            for cls in CLASS_NAMES:
+                a, b = reference == cls, maps[config] == cls
+                intersection[config][cls] += int(np.count_nonzero(a & b))
+                union[config][cls] += int(np.count_nonzero(a | b))
+        print(f"[{i + 1}/{len(paths)}] {path}")
+
+    report = {}
+    baseline_ms = float(np.mean(seconds[BASELINE])) * 1000.0
+    for config in configs:
+        # A class absent from both everywhere agrees perfectly.
+        iou = {CLASS_NAMES[c]: round(intersection[config][c] / union[config][c], 4) if union[config][c] else 1.0
+               for c in CLASS_NAMES}
+        ms = float(np.mean(seconds[config])) * 1000.0
+        report[label(config)] = {
+            "iou": iou,
+            "mean_iou": round(float(np.mean(list(iou.values()))), 4),
+            "mean_ms": round(ms, 1),
+            "speedup": round(baseline_ms / ms, 2),
+        }
+
+    print(f"{'tier':<18}{'upper':>8}{'lower':>8}{'full':>8}{'mean ms':>10}{'speedup':>9}")
+    for name, row in report.items():
+        iou = row["iou"]
+        print(f"{name:<18}{iou['upper']:>8.3f}{iou['lower']:>8.3f}{iou['full']:>8.3f}"
+              f"{row['mean_ms']:>10.1f}{row['speedup']:>8.2f}x")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"images": len(paths), "baseline": label(BASELINE), "tiers": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
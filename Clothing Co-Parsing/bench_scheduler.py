@@ -0,0 +1,79 @@
+"""
+Local benchmark: U2NET throughput with and without cross-request batching.
+
+Simulates concurrent requests with threads that each push preprocessed
+tensors through either the network directly (batch size 1, as before) or a
+BatchScheduler, and reports images/sec, latency and the batch sizes formed.
+
+    python bench_scheduler.py --requests 32 --concurrency 8 --max-batch-size 4
+    python bench_scheduler.py --checkpoint cloth_segm.pth --size 768
+
+Without --checkpoint the network has random weights, which doesn't change
+its speed.
+"""
+import argparse
+import concurrent.futures
+import time
+
+import numpy as np
+import torch
+
+from network import U2NET
+from scheduler import BatchScheduler
+
+
+def load_net(checkpoint):
+    net = U2NET(in_ch=3, out_ch=4)
+    if checkpoint:
+        state_dict = torch.load(checkpoint, map_location=torch.device("cpu"))
+        net.load_state_dict({k[7:] if k.startswith("module.") else k: v for k, v in state_dict.items()})
+    return net.eval()
+
+
+def run(model, inputs, concurrency):
+    def one(tensor):
+        started = time.perf_counter()
+        with torch.no_grad():
+            model(tensor)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = np.array(list(pool.map(one, inputs))) * 1000.0
+    elapsed = time.perf_counter() - started
+    return {
+        "images_per_s": round(len(inputs) / elapsed, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpoint", default=None)
+    parser.add_argument("--size", type=int, default=768, help="Model input size")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-batch-size", type=int, default=4)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    args = parser.parse_args()
+
+    net = load_net(args.checkpoint)
+    inputs = [torch.randn(1, 3, args.size, args.size) for _ in range(args.requests)]
+    # Warm-up, not measured.
+    with torch.no_grad():
+        net(inputs[0])
+
+    direct = run(net, inputs, args.concurrency)
+    print(f"direct (batch size 1):  {direct}")
+
+    scheduler = BatchScheduler(net, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    batched = run(scheduler, inputs, args.concurrency)
+    stats = scheduler.stats()
+    print(f"scheduler (max {args.max_batch_size}):     {batched}")
+    print(f"  batch sizes: {stats['batch_sizes']}, queue wait ms: {stats['queue_wait_ms']}")
+    print(f"  throughput gain: {batched['images_per_s'] / direct['images_per_s']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Accuracy-vs-speed evaluation of the int8 model against fp32.
+
+Runs the fp32 checkpoint and the quantized model (from quantization.py) on
+a folder of images and reports:
+
+  - per-class IoU of the int8 masks against the fp32 masks, for classes
+    1 (upper body), 2 (lower body) and 3 (full body), accumulated over all
+    pixels of all images, plus the share of pixels with the same class;
+  - model size on disk;
+  - images/sec of each model, batch size 1.
+
+Use held-out images, not the calibration set:
+
+    python eval_quantized.py --checkpoint cloth_segm.pth --int8 cloth_segm_int8.pt --images eval/
+    python eval_quantized.py ... --json int8_report.json --min-iou 0.95
+
+With --min-iou the script exits with status 1 if any class falls below it.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+from inference_model import ARCHITECTURES, load_net
+from processor import MODEL_INPUT_SIZE
+from quantization import load_images, load_quantized
+
+CLASS_NAMES = {1: "upper", 2: "lower", 3: "full"}
+
+
+def label_map(model, image_tensor):
+    with torch.no_grad():
+        started = time.perf_counter()
+        outputs = model(image_tensor)
+        elapsed = time.perf_counter() - started
+    d0 = outputs[0] if isinstance(outputs, tuple) else outputs
+    return d0.argmax(dim=1)[0].numpy().astype(np.uint8), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpoint", default="cloth_segm.pth")
+    parser.add_argument("--arch", choices=sorted(ARCHITECTURES), default="u2net")
+    parser.add_argument("--int8", default="cloth_segm_int8.pt", help="Quantized model from quantization.py")
+    parser.add_argument("--images", required=True, help="Folder of evaluation images")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--size", type=int, default=MODEL_INPUT_SIZE, help="Model input size")
+    parser.add_argument("--json", default=None, help="Also write the report here")
+    parser.add_argument("--min-iou", type=float, default=None)
+    args = parser.parse_args()
+
+    fp32 = load_net(args.checkpoint, args.arch)
+    int8 = load_quantized(args.int8)
+
+    intersection = {cls: 0 for cls in CLASS_NAMES}
+    union = {cls: 0 for cls in CLASS_NAMES}
+    agree, pixels = 0, 0
+    seconds = {"fp32": 0.0, "int8": 0.0}
+    images = 0
+    for i, (path, image_tensor) in enumerate(load_images(args.images, args.limit, args.size)):
+        if i == 0:
+            # Warm-up, not measured.
+            label_map(fp32, image_tensor)
+            label_map(int8, image_tensor)
+        reference, fp32_s = label_map(fp32, image_tensor)
+        quantized, int8_s = label_map(int8, image_tensor)
+        seconds["fp32"] += fp32_s
+        seconds["int8"] += int8_s
+        images += 1
+
+        for cls in CLASS_NAMES:
+            a, b = reference == cls, quantized == cls
+            intersection[cls] += int(np.count_nonzero(a & b))
+            union[cls] += int(np.count_nonzero(a | b))
+        agree += int(np.count_nonzero(reference == quantized))
+        pixels += reference.size
+        print(f"{os.path.basename(path)}: fp32 {fp32_s * 1000:.0f} ms, int8 {int8_s * 1000:.0f} ms")
+
+    # A class absent from both masks everywhere agrees perfectly.
+    iou = {CLASS_NAMES[cls]: round(intersection[cls] / union[cls], 4) if union[cls] else 1.0 for cls in CLASS_NAMES}
+    report = {
+        "images": images,
+        "size": args.size,
+        "iou": iou,
+        "mean_iou": round(float(np.mean(list(iou.values()))), 4),
+        "pixel_agreement": round(agree / pixels, 4),
+        "model_mb": {
+            "fp32": round(os.path.getsize(args.checkpoint) / 1e6, 1),
+            "int8": round(os.path.getsize(args.int8) / 1e6, 1),
+        },
+        "images_per_s": {name: round(images / total, 3) for name, total in seconds.items()},
+    }
+    report["speedup"] = round(report["images_per_s"]["int8"] / report["images_per_s"]["fp32"], 2)
+    print(json.dumps(report, indent=2))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.min_iou is not None and min(iou.values()) < args.min_iou:
+        print(f"IoU below {args.min_iou}: {iou}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Inference builds of U2NET / U2NETP.
+
+The training graph runs every REBNCONV as Conv2d -> BatchNorm2d -> ReLU and
+returns all seven side outputs. For serving, `build_inference_net` folds each
+BatchNorm into the convolution before it (one conv instead of conv + bn, same
+result up to float rounding), switches the network to channels_last memory
+format, which the CPU convolution kernels prefer, and makes forward() return
+only d0 through the memory-lean forward (network.py), which frees every
+activation after its last use.
+
+`load_backend` wraps the result in one of these backends:
+
+    eager        the folded network, run by PyTorch
+    torchscript  the same network traced and frozen with TorchScript
+    onnx         exported to ONNX and run by ONNX Runtime
+    int8         a statically quantized build made by quantization.py
+
+Every backend is called like the network, with a Nx3xHxW float tensor, and
+returns d0 as a tensor, so it can be handed to the processor or the
+BatchScheduler unchanged. bench_backends.py checks them against the original
+checkpoint and compares their latency.
+"""
+import copy
+import os
+from collections import OrderedDict
+
+import torch
+import torch.nn as nn
+
+from network import REBNCONV, U2NET, U2NETP
+
+ARCHITECTURES = {"u2net": U2NET, "u2netp": U2NETP}
+BACKENDS = ("eager", "torchscript", "onnx", "int8")
+
+
+def load_net(checkpoint_path, arch="u2net", out_ch=4):
+    """The original training network with a checkpoint's weights, in eval mode."""
+    net = ARCHITECTURES[arch](in_ch=3, out_ch=out_ch)
+    state_dict = torch.load(checkpoint_path, map_location=torch.device("cpu"))
+    # Checkpoints saved from DataParallel prefix every key with 'module.'.
+    net.load_state_dict(OrderedDict((k[7:] if k.startswith("module.") else k, v) for k, v in state_dict.items()))
+    return net.eval()
+
+
+def fuse_conv_bn(conv, bn):
+    """A single Conv2d computing bn(conv(x)) with `bn` in eval mode."""
+    fused = nn.Conv2d(
+        conv.in_channels, conv.out_channels, conv.kernel_size,
+        stride=conv.stride, padding=conv.padding, dilation=conv.dilation,
+        groups=conv.groups, bias=True,
+    )
+    scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+    bias = conv.bias if conv.bias is not None else torch.zeros_like(bn.running_mean)
+    with torch.no_grad():
+        fused.weight.copy_(conv.weight * scale.reshape(-1, 1, 1, 1))
+        fused.bias.copy_((bias - bn.running_mean) * scale + bn.bias)
+    return fused
+
+
+def fold_batchnorm(net):
+    """Folds the BatchNorm of every REBNCONV in `net` into its conv, in place."""
+    for module in net.modules():
+        if isinstance(module, REBNCONV) and isinstance(module.bn_s1, nn.BatchNorm2d):
+            module.conv_s1 = fuse_conv_bn(module.conv_s1, module.bn_s1)
+            module.bn_s1 = nn.Identity()
+    return net
+
+
+class InferenceNet(nn.Module):
+    """Runs a folded network in channels_last and returns only d0."""
+
+    def __init__(self, net):
+        super(InferenceNet, self).__init__()
+        self.net = net
+
+    def forward(self, x):
+        return self.net(x.contiguous(memory_format=torch.channels_last))
+
+
+def build_inference_net(net):
+    """A folded, channels_last, d0-only copy of `net`; `net` itself is left as it is."""
+    net = fold_batchnorm(copy.deepcopy(net).eval())
+    net.side_outputs = False
+    net.lean = True
+    net = net.to(memory_format=torch.channels_last)
+    for param in net.parameters():
+        param.requires_grad_(False)
+    return InferenceNet(net).eval()
+
+
+def example_input(size=320):
+    return torch.randn(1, 3, size, size)
+
+
+def build_torchscript(inference_net, size=320):
+    """Traces and freezes the inference network. Traced with dynamic shapes, so any input size works."""
+    with torch.no_grad():
+        traced = torch.jit.trace(inference_net, example_input(size), check_trace=False)
+    return torch.jit.freeze(traced.eval())
+
+
+def export_onnx(net, onnx_path, size=320, opset=17):
+    """Exports the folded, d0-only network to `onnx_path` with dynamic batch and image size."""
+    inference_net = build_inference_net(net)
+    kwargs = {}
+    if "dynamo" in torch.onnx.export.__code__.co_varnames:
+        kwargs["dynamo"] = False
+    tmp_path = f"{onnx_path}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            inference_net, example_input(size), tmp_path,
+            input_names=["image"], output_names=["d0"],
+            dynamic_axes={"image": {0: "batch", 2: "height", 3: "width"}, "d0": {0: "batch", 2: "height", 3: "width"}},
+            opset_version=opset, **kwargs
+        )
+    os.replace(tmp_path, onnx_path)
+    return onnx_path
+
+
+class OnnxNet(object):
+    """Runs an exported network with ONNX Runtime, called like the PyTorch network."""
+
+    def __init__(self, onnx_path, threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, image_tensor):
+        image = image_tensor.detach().cpu().contiguous().numpy()
+        (d0,) = self.session.run(None, {self.input_name: image})
+        return torch.from_numpy(d0)
+
+    def eval(self):
+        return self
+
+
+def load_backend(backend, net, onnx_path=None, threads=None, checkpoint_path=None, int8_path=None):
+    """
+    Wraps the original network `net` for serving with the given backend.
+    For "onnx" the model is exported to `onnx_path` first, unless that file
+    exists and is newer than `checkpoint_path`. "int8" loads `int8_path`,
+    which has to be made beforehand (quantization needs calibration images).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    if backend == "onnx":
+        if not onnx_path:
+            raise ValueError("The onnx backend needs an onnx_path")
+        stale = checkpoint_path and os.path.exists(onnx_path) and os.path.getmtime(onnx_path) < os.path.getmtime(checkpoint_path)
+        if stale or not os.path.exists(onnx_path):
+            print(f"Exporting ONNX model to {onnx_path} ...")
+            export_onnx(net, onnx_path)
+        return OnnxNet(onnx_path, threads=threads)
+    if backend == "int8":
+        if not int8_path or not os.path.exists(int8_path):
+            raise FileNotFoundError(f"Quantized model not found at {int8_path}; create it with quantization.py")
+        from quantization import load_quantized
+        return load_quantized(int8_path)
+
+    inference_net = build_inference_net(net)
+    if backend == "torchscript":
+        return build_torchscript(inference_net)
+    return inference_net
@@ -0,0 +1,170 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+
+class LabelMapCache(object):
+    """
+    Caches the network's per-pixel label map (class id per pixel) by a hash
+    of the uploaded image bytes, so any garment of an image that was seen
+    before is rendered without running U2NET again.
+
+    The memory tier is an LRU bounded by `max_bytes`. With `disk_dir`, maps
+    are also written there as lossless PNGs (a few KB each, since label maps
+    are mostly flat regions) and survive restarts.
+
+    `namespace` should change whenever the model does (app.py uses the
+    checkpoint's size and modification time), so stale maps are never served.
+
+    Requests for a key that is already being computed wait for that result
+    instead of running U2NET again (see get_or_compute). Every map handed
+    out is read-only, since it is shared between requests.
+    """
+
+    def __init__(self, max_bytes, disk_dir=None, namespace=""):
+        self.max_bytes = int(max_bytes)
+        self.disk_dir = disk_dir or None
+        self.namespace = namespace
+        self._entries = OrderedDict()
+        self._inflight = {}  # key -> Future shared by concurrent requests
+        self._lock = threading.Lock()
+        self.bytes_held = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def key(self, image_bytes, variant=""):
+        """`variant` tells apart maps of the same image made differently (e.g. at another resolution)."""
+        return hashlib.sha256(f"{self.namespace}/{variant}/".encode() + image_bytes).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key + ".png")
+
+    def _from_memory(self, key):
+        # Caller holds self._lock.
+        label_map = self._entries.get(key)
+        if label_map is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return label_map
+
+    def _from_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        label_map = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if label_map is None:
+            return None
+        label_map.setflags(write=False)
+        with self._lock:
+            self.disk_hits += 1
+        self._remember(key, label_map)
+        return label_map
+
+    def get(self, key):
+        """Returns the cached label map for `key`, or None."""
+        with self._lock:
+            label_map = self._from_memory(key)
+        if label_map is None:
+            label_map = self._from_disk(key)
+        if label_map is None:
+            with self._lock:
+                self.misses += 1
+        return label_map
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the label map for `key`, calling `compute()` only on a miss.
+        If another thread is already computing it, waits for its result.
+        """
+        with self._lock:
+            label_map = self._from_memory(key)
+            if label_map is not None:
+                return label_map
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+
+        try:
+            label_map = self._from_disk(key)
+            if label_map is None:
+                with self._lock:
+                    self.misses += 1
+                label_map = self.put(key, compute())
+            future.set_result(label_map)
+            return label_map
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def put(self, key, label_map):
+        """Caches a copy of `label_map` and returns that copy (read-only)."""
+        # A copy, so a map sliced out of a larger array doesn't keep it alive.
+        label_map = np.array(label_map, dtype=np.uint8, order="C", copy=True)
+        # Cached maps are shared between requests, so nobody may modify them.
+        label_map.setflags(write=False)
+        self._remember(key, label_map)
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                ok, encoded = cv2.imencode(".png", label_map)
+                if ok:
+                    # Write then rename, so readers never see half a file.
+                    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                    with open(tmp_path, "wb") as f:
+                        f.write(encoded.tobytes())
+                    os.replace(tmp_path, path)
+        return label_map
+
+    def _remember(self, key, label_map):
+        if label_map.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes_held -= previous.nbytes
+            self._entries[key] = label_map
+            self.bytes_held += label_map.nbytes
+            while self.bytes_held > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes_held -= evicted.nbytes
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "bytes_held": self.bytes_held,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "disk_dir": self.disk_dir,
+            }
@@ -29,6 +29,68 @@ def _upsample_like(src, tar):
     return src
 
 
+## Memory-lean inference forwards. Same result as forward() (up to float
+## rounding), but every activation is released right after its last use and
+## the residual / output sums are done in place, so only the skip connections
+## still needed are alive at any point. Inference only: the in-place ops break
+## autograd.
+def _rsu_forward_lean(block, x, depth, pooled=True):
+    """forward() of an RSU-`depth` block (RSU-4F: depth 4, not pooled)."""
+    hxin = block.rebnconvin(x)
+
+    # Encoder: keep each level's output for its decoder skip connection.
+    skips = []
+    hx = hxin
+    for i in range(1, depth):
+        hx = getattr(block, f"rebnconv{i}")(hx)
+        skips.append(hx)
+        if pooled and i < depth - 1:
+            hx = getattr(block, f"pool{i}")(hx)
+    hx = getattr(block, f"rebnconv{depth}")(hx)
+
+    # Decoder: each skip is dropped as soon as it has been concatenated.
+    for i in range(depth - 1, 0, -1):
+        skip = skips.pop()
+        if pooled and i < depth - 1:
+            hx = _upsample_like(hx, skip)
+        hx = getattr(block, f"rebnconv{i}d")(torch.cat((hx, skip), 1))
+        del skip
+
+    hx += hxin
+    return hx
+
+
+def _u2net_forward_lean(net, x):
+    """forward() of U2NET / U2NETP returning only d0."""
+    size = x.shape[2:]
+    out_ch = net.outconv.out_channels
+
+    # outconv(cat(d1, ..., d6)) is a 1x1 conv, i.e. the sum over the side
+    # outputs of outconv's weight slice for each. Applying the slice before
+    # upsampling (both are linear) avoids the 6 * out_ch full-size concat.
+    def side(i, hx):
+        d = F.conv2d(getattr(net, f"side{i}")(hx), net.outconv.weight[:, (i - 1) * out_ch:i * out_ch])
+        return d if i == 1 else F.interpolate(d, size=size, mode="bilinear")
+
+    skips = []
+    hx = x
+    for i in range(1, 6):
+        hx = getattr(net, f"stage{i}").forward_lean(hx)
+        skips.append(hx)
+        hx = getattr(net, f"pool{i}{i + 1}")(hx)
+    hx = net.stage6.forward_lean(hx)
+
+    d0 = side(6, hx)
+    for i in range(5, 0, -1):
+        skip = skips.pop()
+        hx = getattr(net, f"stage{i}d").forward_lean(torch.cat((_upsample_like(hx, skip), skip), 1))
+        del skip
+        d0 += side(i, hx)
+
+    d0 += net.outconv.bias.reshape(1, -1, 1, 1)
+    return d0
+
+
 ### RSU-7 ###
 class RSU7(nn.Module):  # UNet07DRES(nn.Module):
     def __init__(self, in_ch=3, mid_ch=12, out_ch=3):
@@ -111,6 +173,9 @@ class RSU7(nn.Module):  # UNet07DRES(nn.Module):
 
         return hx1d + hxin
 
+    def forward_lean(self, x):
+        return _rsu_forward_lean(self, x, 7)
+
 
 ### RSU-6 ###
 class RSU6(nn.Module):  # UNet06DRES(nn.Module):
@@ -185,6 +250,9 @@ class RSU6(nn.Module):  # UNet06DRES(nn.Module):
 
         return hx1d + hxin
 
+    def forward_lean(self, x):
+        return _rsu_forward_lean(self, x, 6)
+
 
 ### RSU-5 ###
 class RSU5(nn.Module):  # UNet05DRES(nn.Module):
@@ -249,6 +317,9 @@ class RSU5(nn.Module):  # UNet05DRES(nn.Module):
 
         return hx1d + hxin
 
+    def forward_lean(self, x):
+        return _rsu_forward_lean(self, x, 5)
+
 
 ### RSU-4 ###
 class RSU4(nn.Module):  # UNet04DRES(nn.Module):
@@ -303,6 +374,9 @@ class RSU4(nn.Module):  # UNet04DRES(nn.Module):
 
         return hx1d + hxin
 
+    def forward_lean(self, x):
+        return _rsu_forward_lean(self, x, 4)
+
 
 ### RSU-4F ###
 class RSU4F(nn.Module):  # UNet04FRES(nn.Module):
@@ -344,12 +418,22 @@ class RSU4F(nn.Module):  # UNet04FRES(nn.Module):
 
         return hx1d + hxin
 
+    def forward_lean(self, x):
+        return _rsu_forward_lean(self, x, 4, pooled=False)
+
 
 ##### U^2-Net ####
 class U2NET(nn.Module):
-    def __init__(self, in_ch=3, out_ch=1):
+    def __init__(self, in_ch=3, out_ch=1, side_outputs=True, lean=False):
         super(U2NET, self).__init__()
 
+        # The side outputs d1..d6 are only needed for the training loss;
+        # with side_outputs=False forward() returns just the fused map d0.
+        self.side_outputs = side_outputs
+        # lean=True (inference only) returns d0 through the memory-lean
+        # forward, which frees activations as soon as they are used.
+        self.lean = lean
+
         self.stage1 = RSU7(in_ch, 32, 64)
         self.pool12 = nn.MaxPool2d(2, stride=2, ceil_mode=True)
 
@@ -384,6 +468,8 @@ class U2NET(nn.Module):
         self.outconv = nn.Conv2d(6 * out_ch, out_ch, 1)
 
     def forward(self, x):
+        if self.lean:
+            return _u2net_forward_lean(self, x)
 
         hx = x
 
@@ -452,14 +538,24 @@ class U2NET(nn.Module):
         del hx6up, hx5dup, hx4dup, hx3dup, hx2dup
         """
 
+        if not self.side_outputs:
+            return d0
+
         return d0, d1, d2, d3, d4, d5, d6
 
 
 ### U^2-Net small ###
 class U2NETP(nn.Module):
-    def __init__(self, in_ch=3, out_ch=1):
+    def __init__(self, in_ch=3, out_ch=1, side_outputs=True, lean=False):
         super(U2NETP, self).__init__()
 
+        # The side outputs d1..d6 are only needed for the training loss;
+        # with side_outputs=False forward() returns just the fused map d0.
+        self.side_outputs = side_outputs
+        # lean=True (inference only) returns d0 through the memory-lean
+        # forward, which frees activations as soon as they are used.
+        self.lean = lean
+
         self.stage1 = RSU7(in_ch, 16, 64)
         self.pool12 = nn.MaxPool2d(2, stride=2, ceil_mode=True)
 
@@ -494,6 +590,8 @@ class U2NETP(nn.Module):
         self.outconv = nn.Conv2d(6 * out_ch, out_ch, 1)
 
     def forward(self, x):
+        if self.lean:
+            return _u2net_forward_lean(self, x)
 
         hx = x
 
@@ -557,4 +655,7 @@ class U2NETP(nn.Module):
         d0 = self.outconv(torch.cat((d1, d2, d3, d4, d5, d6), 1))
 
 
+        if not self.side_outputs:
+            return d0
+
         return d0, d1, d2, d3, d4, d5, d6
\ No newline at end of file
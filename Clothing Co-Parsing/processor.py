@@ -1,80 +1,611 @@
 import torch
-import torch.nn.functional as F
-import torchvision.transforms as transforms
 from PIL import Image
 import numpy as np
 import cv2
+import functools
+import concurrent.futures
+import contextlib
 import io
+import json
+import threading
+from collections import namedtuple
 
-# Helper class and function (no changes)
-class Normalize_image(object):
-    def __init__(self, mean, std):
-        self.normalize_3 = transforms.Normalize([mean] * 3, [std] * 3)
-    def __call__(self, image_tensor):
-        return self.normalize_3(image_tensor)
+# Class ids kept for each garment type. The network predicts
+# 0 = background, 1 = upper body, 2 = lower body, 3 = full body.
+GARMENT_CLASSES = {
+    "top": [1],
+    "bottom": [2],
+    "skirt": [2, 3],
+    "coord": [1, 2],
+    "kurta": [3],
+    "lehenga": [1, 3],
+}
 
-def apply_transform(img):
-    transforms_list = [transforms.ToTensor(), Normalize_image(0.5, 0.5)]
-    return transforms.Compose(transforms_list)(img)
+MODEL_INPUT_SIZE = 768
+# Inference resolutions a caller can ask for: small tiers are much cheaper
+# (U2NET's cost grows with the pixel count) and plenty for thumbnails.
+RESOLUTIONS = (320, 512, 768)
+
+# Coarse-to-fine refinement: the whole image runs at REFINE_COARSE_SIZE, then
+# only REFINE_CROP_SIZE crops along the coarse mask boundary run again at the
+# requested resolution. Each crop's outer REFINE_CROP_MARGIN pixels are just
+# context and are not used.
+REFINE_COARSE_SIZE = 320
+REFINE_CROP_SIZE = 128
+REFINE_CROP_MARGIN = 16
+
+# Tiled inference: large photos run as overlapping MODEL_INPUT_SIZE tiles at
+# (up to `max_side`) their own resolution instead of squashed to one input.
+# U2NET needs roughly this many bytes of activations per input pixel
+# (measured on the fp32 eager backend), so a 768x768 tile takes ~1.4 GB;
+# `max_memory_mb` caps how many tiles run at once, and their size. The cap
+# holds for the whole process: concurrent tiled requests share it (see
+# MemoryBudget), so the scheduler can never stack more tiles than it allows.
+TileSettings = namedtuple("TileSettings", ["tile", "overlap", "max_side", "max_memory_mb", "workers"])
+DEFAULT_TILING = TileSettings(tile=MODEL_INPUT_SIZE, overlap=128, max_side=2048, max_memory_mb=4096, workers=2)
+ACTIVATION_BYTES_PER_PIXEL = 2500
+MIN_TILE_SIZE = 256
+NUM_CLASSES = 4
+# Threads running tile forward passes, shared by all requests.
+TILE_POOL_THREADS = 4
+
+# JPEG EXIF orientations that swap width and height.
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+# --- Pipeline steps ---
+# process_image is split into decode -> preprocess -> infer -> render so the
+# expensive forward pass can run once and be rendered for several garments.
+#
+# The image stays one BGR uint8 array (as OpenCV decodes it) from start to
+# end: the model's RGB order is produced while normalizing, and the output
+# PNG is BGR(A) again, so there is no colour conversion and no PIL or
+# torchvision round-trip. bench_processor.py times every stage.
+
+# `pixels` is the BGR array, `size` the (width, height) of the uploaded image.
+# They differ when the image was decoded at reduced resolution.
+DecodedImage = namedtuple("DecodedImage", ["pixels", "size"])
+
+
+def _reduction_factor(image_bytes, min_side):
+    """How much the image can be shrunk while decoding (1, 2, 4 or 8), and its full size."""
+    try:
+        header = Image.open(io.BytesIO(image_bytes))  # reads the header only
+        width, height = header.size
+        if header.getexif().get(0x0112) in _TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+    except Exception:
+        return 1, None
+    for factor in (8, 4, 2):
+        if min(width, height) // factor >= min_side:
+            return factor, (width, height)
+    return 1, (width, height)
+
+
+def decode_image(image_bytes, full_resolution=True, min_side=MODEL_INPUT_SIZE):
+    """
+    Decodes uploaded bytes into a DecodedImage (BGR pixels).
+
+    With full_resolution=False a large JPEG is decoded at 1/2, 1/4 or 1/8 of
+    its size (libjpeg scales while decoding, much cheaper than a full decode
+    and resize) as long as both sides stay >= `min_side`. That is enough for
+    the model and for mask outputs, which only need the original size.
+    """
+    # OpenCV is more forgiving than PIL with odd uploads.
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    factor, size = (1, None) if full_resolution else _reduction_factor(image_bytes, min_side)
+    flags = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+             4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}[factor]
+    pixels = cv2.imdecode(nparr, flags)
+    if pixels is None:
+        raise ValueError("Could not decode image from bytes.")
+    if factor == 1:
+        size = (pixels.shape[1], pixels.shape[0])
+    return DecodedImage(pixels, size)
+
+
+# Per-thread scratch buffers, reused by every request a thread serves.
+_scratch = threading.local()
+
+
+def _buffer(name, shape, dtype):
+    buffers = _scratch.__dict__
+    buf = buffers.get(name)
+    if buf is None or buf.shape != shape:
+        buf = buffers[name] = np.empty(shape, dtype)
+    return buf
+
+
+def letterbox_box(width, height, size):
+    """Where a width x height image goes inside a size x size model input: (x, y, w, h)."""
+    scale = size / max(width, height)
+    w, h = max(1, round(width * scale)), max(1, round(height * scale))
+    return (size - w) // 2, (size - h) // 2, w, h
+
+
+def preprocess(image, size=MODEL_INPUT_SIZE):
+    """
+    Resizes and normalizes the image into a 1x3x`size`x`size` model input
+    (RGB, [-1, 1]). The image keeps its aspect ratio and is centred on a
+    mid-grey (0) background; letterbox_box says where it ends up.
+
+    The result is a view of this thread's input buffer: it stays valid until
+    the same thread calls preprocess again, so copy it if you need to keep it.
+    """
+    pixels = image.pixels
+    height, width = pixels.shape[:2]
+    x, y, w, h = letterbox_box(width, height, size)
+    # INTER_AREA when shrinking (antialiased, like PIL's bicubic downscale);
+    # bicubic when enlarging.
+    resized = _buffer(f"resized_{size}", (size * size * 3,), np.uint8)[:h * w * 3].reshape(h, w, 3)
+    cv2.resize(pixels, (w, h), dst=resized, interpolation=cv2.INTER_AREA if height > h else cv2.INTER_CUBIC)
+
+    # (x / 255 - 0.5) / 0.5, written straight into the float32 input buffer;
+    # reading the BGR planes in reverse gives the model its RGB order.
+    model_input = _buffer(f"model_input_{size}", (1, 3, size, size), np.float32)
+    if (w, h) != (size, size):
+        model_input.fill(0.0)
+    _normalize_into(resized, model_input[0, :, y:y + h, x:x + w])
+    return torch.from_numpy(model_input)
+
+
+def _normalize_into(pixels, out):
+    """Writes HxWx3 BGR uint8 `pixels` into the 3xHxW float32 view `out` as RGB in [-1, 1]."""
+    for channel in range(3):
+        np.multiply(pixels[:, :, 2 - channel], 2.0 / 255.0, out=out[channel], casting="unsafe")
+    np.subtract(out, 1.0, out=out)
+
+
+def predict(net, image_tensor):
+    """Runs the network on a Nx3xHxW batch and returns the class ids (NxHxW uint8)."""
+    with torch.no_grad():
+        outputs = net(image_tensor)
+        # The training network returns (d0, d1, ..., d6); inference builds just d0.
+        d0 = outputs[0] if isinstance(outputs, tuple) else outputs
+        # torch.max is several times faster than argmax over the class dim on CPU.
+        return torch.max(d0, dim=1)[1].to(torch.uint8).numpy()
+
+
+def infer_label_map(image, net, size=MODEL_INPUT_SIZE, refine=False, tiling=None):
+    """
+    Runs the network and returns the per-pixel class ids (HxW uint8, the
+    image's aspect ratio, longest side `size`). With `refine`, runs
+    coarse-to-fine (refine_label_map) when `size` is above the coarse size.
+    With `tiling` (a TileSettings), runs tiled (tiled_label_map) instead.
+    """
+    if tiling is not None:
+        return tiled_label_map(image, net, tiling)
+    height, width = image.pixels.shape[:2]
+    x, y, w, h = letterbox_box(width, height, size)
+    if refine and size > REFINE_COARSE_SIZE:
+        label_map = refine_label_map(image, net, REFINE_COARSE_SIZE, size)
+    else:
+        label_map = predict(net, preprocess(image, size))[0]
+    return label_map[y:y + h, x:x + w]
+
+
+def refine_label_map(image, net, coarse_size, size, crop=REFINE_CROP_SIZE, margin=REFINE_CROP_MARGIN):
+    """
+    The full size x size (letterboxed) label map, predicted at `coarse_size`
+    and re-predicted at `size` only around the boundaries between classes.
+
+    The coarse map is scaled up and its class boundaries widened by about a
+    coarse pixel into a band. The band is covered with crop x crop windows of
+    the full-resolution input (only their inner crop - 2 * margin square is
+    used), which run through the network as one batch,
+    and their predictions replace the coarse ones inside the band. Far from
+    any boundary the coarse answer is kept as it is.
+    """
+    height, width = image.pixels.shape[:2]
+    coarse = predict(net, preprocess(image, coarse_size))[0]
+    label_map = cv2.resize(coarse, (size, size), interpolation=cv2.INTER_NEAREST)
+
+    k = 2 * int(np.ceil(size / coarse_size)) + 1
+    kernel = np.ones((k, k), np.uint8)
+    band = cv2.dilate(label_map, kernel) != cv2.erode(label_map, kernel)
+    # The letterbox padding is always background.
+    x, y, w, h = letterbox_box(width, height, size)
+    band[:y] = False
+    band[y + h:] = False
+    band[:, :x] = False
+    band[:, x + w:] = False
+
+    # Cover the band greedily, following it: each window starts at the first
+    # (raster order) band pixel not covered yet.
+    crop = min(crop, size)
+    inner = max(1, crop - 2 * margin)
+    uncovered = band.copy()
+    tiles = []
+    while True:
+        first = int(np.argmax(uncovered))
+        if not uncovered.flat[first]:
+            break
+        row, column = divmod(first, size)
+        top, left = min(row, size - inner), min(max(column - inner // 2, 0), size - inner)
+        uncovered[top:top + inner, left:left + inner] = False
+        tiles.append((top, left))
+        if len(tiles) * crop * crop >= size * size:
+            # Boundaries everywhere: one full pass is cheaper than the crops.
+            return predict(net, preprocess(image, size))[0]
+    if not tiles:
+        return label_map
+
+    fine_input = preprocess(image, size)
+    windows = [(min(max(top - margin, 0), size - crop), min(max(left - margin, 0), size - crop)) for top, left in tiles]
+    batch = torch.cat([fine_input[:, :, wy:wy + crop, wx:wx + crop] for wy, wx in windows], dim=0)
+    predictions = predict(net, batch)
+    for (top, left), (wy, wx), prediction in zip(tiles, windows, predictions):
+        bottom, right = min(top + inner, size), min(left + inner, size)
+        selected = band[top:bottom, left:right]
+        label_map[top:bottom, left:right][selected] = prediction[top - wy:bottom - wy, left - wx:right - wx][selected]
+    return label_map
+
+
+def _tile_starts(length, tile, stride):
+    """Tile offsets along one side: every `stride`, the last one flush with the end."""
+    return list(range(0, length - tile, stride)) + [length - tile]
+
+
+def _blend_weights(tile, overlap):
+    """Tile weights ramping up linearly over the overlap from each edge, so neighbouring tiles cross-fade."""
+    distance = np.minimum(np.arange(1, tile + 1), np.arange(tile, 0, -1)).astype(np.float32)
+    ramp = np.minimum(distance / (overlap + 1), 1.0)
+    return np.outer(ramp, ramp)
+
+
+def tile_plan(tiling, width):
+    """
+    The tile size and number of tiles in flight that fit `tiling.max_memory_mb`,
+    counting the logit accumulator (one tile-high stripe of the image) and
+    ACTIVATION_BYTES_PER_PIXEL for every tile running. Tiles shrink (down to
+    MIN_TILE_SIZE) when even one full-size tile wouldn't fit.
+    """
+    budget = tiling.max_memory_mb * 1024 * 1024
+    tile = tiling.tile
+    while True:
+        available = budget - NUM_CLASSES * tile * width * 4
+        per_tile = tile * tile * ACTIVATION_BYTES_PER_PIXEL
+        if per_tile <= available or tile <= MIN_TILE_SIZE:
+            break
+        tile = max(MIN_TILE_SIZE, tile - 64)
+    workers = int(max(1, min(tiling.workers, available // per_tile)))
+    return tile, workers
+
+
+def tiled_geometry(tiling, width, height):
+    """
+    (width, height, tile, overlap) tiled_label_map works with for a `width`x`height`
+    image: the size after scaling to `tiling.max_side` and the tile_plan tile.
+    """
+    if tiling.max_side and max(height, width) > tiling.max_side:
+        scale = tiling.max_side / max(height, width)
+        width, height = round(width * scale), round(height * scale)
+    tile, _ = tile_plan(tiling, width)
+    return width, height, tile, min(tiling.overlap, tile // 2)
+
+
+class MemoryBudget(object):
+    """
+    Bytes shared by every tiled request in the process. `reserve(nbytes)`
+    blocks until that much is free and holds it for the `with` block.
+
+    A request reserves everything it will use at once (its logit stripe and
+    all its tiles in flight), so requests waiting for memory never hold any
+    and can't deadlock each other. A single request larger than the whole
+    budget (tile_plan still allows one MIN_TILE_SIZE tile) runs on its own.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self.reserved = 0
+        self._condition = threading.Condition()
+
+    @contextlib.contextmanager
+    def reserve(self, nbytes):
+        nbytes = min(int(nbytes), self.max_bytes)
+        with self._condition:
+            self._condition.wait_for(lambda: self.reserved + nbytes <= self.max_bytes)
+            self.reserved += nbytes
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.reserved -= nbytes
+                self._condition.notify_all()
+
+
+_tile_lock = threading.Lock()
+_tile_pool = None
+_budgets = {}  # max_memory_mb -> MemoryBudget
+
+
+def memory_budget(max_memory_mb):
+    """The process-wide MemoryBudget of `max_memory_mb`."""
+    with _tile_lock:
+        if max_memory_mb not in _budgets:
+            _budgets[max_memory_mb] = MemoryBudget(max_memory_mb * 1024 * 1024)
+        return _budgets[max_memory_mb]
+
+
+def _shared_tile_pool():
+    global _tile_pool
+    with _tile_lock:
+        if _tile_pool is None:
+            _tile_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=TILE_POOL_THREADS, thread_name_prefix="u2net-tile"
+            )
+        return _tile_pool
+
+
+def _tile_logits(net, pixels, top, left, tile):
+    """d0 of one tile of the BGR `pixels` (CxTxT float32)."""
+    model_input = _buffer(f"tile_input_{tile}", (1, 3, tile, tile), np.float32)
+    _normalize_into(pixels[top:top + tile, left:left + tile], model_input[0])
+    with torch.no_grad():
+        outputs = net(torch.from_numpy(model_input))
+        d0 = outputs[0] if isinstance(outputs, tuple) else outputs
+        return d0[0].numpy()
+
+
+def tiled_label_map(image, net, tiling=DEFAULT_TILING):
+    """
+    The label map of a large image, predicted on overlapping tiles at the
+    image's own resolution (scaled down to `tiling.max_side` if bigger).
+
+    Tiles run on a thread pool shared by all requests, at most tile_plan's
+    worker count of them at a time. Their logits are weighted by
+    _blend_weights and summed, so seams cross-fade, and the class of every
+    pixel is the argmax of that sum. Only one tile-high stripe of logits is
+    kept: tiles are processed a row at a time, and the rows no later tile can
+    touch are turned into class ids and dropped. Memory therefore grows with
+    the image width, not its area. tile_plan sizes one request to fit
+    `tiling.max_memory_mb`, and memory_budget makes concurrent requests
+    share it.
+
+    Images that fit in a single tile run as one letterboxed input.
+    """
+    pixels = image.pixels
+    width, height, tile, overlap = tiled_geometry(tiling, pixels.shape[1], pixels.shape[0])
+    if (width, height) != (pixels.shape[1], pixels.shape[0]):
+        pixels = cv2.resize(pixels, (width, height), interpolation=cv2.INTER_AREA)
+    _, workers = tile_plan(tiling, width)
+    budget = memory_budget(tiling.max_memory_mb)
+    per_tile = tile * tile * ACTIVATION_BYTES_PER_PIXEL
+    if min(height, width) <= tile:
+        with budget.reserve(per_tile):
+            return infer_label_map(DecodedImage(pixels, (width, height)), net, tile)
+
+    with budget.reserve(NUM_CLASSES * tile * width * 4 + workers * per_tile):
+        return _blend_tiles(net, pixels, tile, overlap, workers)
+
+
+def _blend_tiles(net, pixels, tile, overlap, workers):
+    height, width = pixels.shape[:2]
+    weights = _blend_weights(tile, overlap)
+    label_map = np.empty((height, width), np.uint8)
+    # Summed logits of rows [stripe_top, stripe_top + tile).
+    stripe = np.zeros((NUM_CLASSES, tile, width), np.float32)
+    stripe_top = 0
+
+    def finish_rows(end):
+        rows = end - stripe_top
+        label_map[stripe_top:end] = stripe[:, :rows].argmax(axis=0)
+        stripe[:, :tile - rows] = stripe[:, rows:].copy()
+        stripe[:, tile - rows:] = 0.0
+
+    pool = _shared_tile_pool()
+    columns = _tile_starts(width, tile, tile - overlap)
+    for top in _tile_starts(height, tile, tile - overlap):
+        # Rows above this tile row are final.
+        finish_rows(top)
+        stripe_top = top
+        # At most `workers` tiles of this request in flight, as reserved.
+        for start in range(0, len(columns), workers):
+            lefts = columns[start:start + workers]
+            tiles = [pool.submit(_tile_logits, net, pixels, top, left, tile) for left in lefts]
+            for left, future in zip(lefts, tiles):
+                stripe[:, :, left:left + tile] += future.result() * weights
+    finish_rows(height)
+    return label_map
+
+
+def cached_label_map(image_bytes, original_image, net, cache=None, size=MODEL_INPUT_SIZE, refine=False, tiling=None):
+    """infer_label_map, served from `cache` (a LabelMapCache) when the same image was seen before."""
+    if cache is None:
+        return infer_label_map(original_image, net, size, refine, tiling)
+    if tiling is not None:
+        # What the tiles actually are: tile_plan may shrink them to fit the memory cap.
+        pixels = original_image.pixels
+        width, height, tile, overlap = tiled_geometry(tiling, pixels.shape[1], pixels.shape[0])
+        variant = f"tiled-{width}x{height}-{tile}-{overlap}"
+    else:
+        variant = f"{size}-refine" if refine else str(size)
+    key = cache.key(image_bytes, variant=variant)
+    # Concurrent requests for the same image share one inference.
+    return cache.get_or_compute(key, lambda: infer_label_map(original_image, net, size, refine, tiling))
+
+
+@functools.lru_cache(maxsize=None)
+def _class_lut(classes_to_keep):
+    lut = np.zeros(256, np.uint8)
+    lut[list(classes_to_keep)] = 255
+    lut.setflags(write=False)
+    return lut
+
+
+def garment_mask(label_map, classes_to_keep, size):
+    """Alpha mask (0/255) of the given classes, resized to `size` (width, height)."""
+    # One table lookup per pixel instead of a pass per class.
+    mask = cv2.LUT(label_map, _class_lut(tuple(classes_to_keep)))
+    if (mask.shape[1], mask.shape[0]) != tuple(size):
+        shrinking = size[0] < mask.shape[1] or size[1] < mask.shape[0]
+        mask = cv2.resize(mask, tuple(size), interpolation=cv2.INTER_AREA if shrinking else cv2.INTER_CUBIC)
+    return mask
+
+
+# --- Renderers ---
+# Every renderer takes (image, label_map, classes_to_keep, **options) and
+# returns the encoded output as a BytesIO. Only "cutout" and "webp" re-encode
+# the original pixels; the other outputs are the mask alone, for clients that
+# already have the photo and composite it themselves.
+
+def render_cutout(image, label_map, classes_to_keep, **options):
+    """The original image with everything but the given classes made transparent, as PNG."""
+    alpha_mask_np = garment_mask(label_map, classes_to_keep, image.size)
+    transparent_image_np = cv2.cvtColor(image.pixels, cv2.COLOR_BGR2BGRA)
+    transparent_image_np[:, :, 3] = alpha_mask_np
+    _, img_encoded = cv2.imencode(".png", transparent_image_np)
+    return io.BytesIO(img_encoded.tobytes())
+
+
+def render_webp(image, label_map, classes_to_keep, webp_level=0, **options):
+    """
+    The cutout as lossless WebP (about a third of the PNG's size). `webp_level`
+    0-6 trades encode time for size; 0 is about as fast as PNG. Colours under
+    fully transparent pixels are not kept, which is what lets them compress.
+    """
+    alpha_mask_np = garment_mask(label_map, classes_to_keep, image.size)
+    transparent_image_np = cv2.cvtColor(image.pixels, cv2.COLOR_BGR2RGBA)
+    transparent_image_np[:, :, 3] = alpha_mask_np
+    buffer = io.BytesIO()
+    Image.fromarray(transparent_image_np, mode="RGBA").save(
+        buffer, format="WEBP", lossless=True, method=webp_level, quality=round(webp_level * 100 / 6)
+    )
+    buffer.seek(0)
+    return buffer
+
+
+def render_mask(image, label_map, classes_to_keep, **options):
+    """Just the alpha mask of the given classes, as a grayscale PNG."""
+    alpha_mask_np = garment_mask(label_map, classes_to_keep, image.size)
+    _, img_encoded = cv2.imencode(".png", alpha_mask_np)
+    return io.BytesIO(img_encoded.tobytes())
+
+
+def binary_mask(label_map, classes_to_keep, size):
+    """The garment mask at `size`, thresholded to 0/1."""
+    return (garment_mask(label_map, classes_to_keep, size) >= 128).view(np.uint8)
+
+
+def render_mask_1bit(image, label_map, classes_to_keep, **options):
+    """The mask as a 1-bit PNG: hard edges, typically a few KB."""
+    mask = binary_mask(label_map, classes_to_keep, image.size)
+    _, img_encoded = cv2.imencode(".png", mask, [cv2.IMWRITE_PNG_BILEVEL, 1])
+    return io.BytesIO(img_encoded.tobytes())
+
+
+def rle_counts(mask):
+    """Run lengths of a 0/1 mask in column-major order, starting with a (possibly empty) run of 0s."""
+    pixels = mask.ravel(order="F")
+    changes = np.flatnonzero(pixels[1:] != pixels[:-1]) + 1
+    bounds = np.concatenate(([0], changes, [pixels.size]))
+    counts = np.diff(bounds)
+    if pixels.size and pixels[0]:
+        counts = np.concatenate(([0], counts))
+    return counts.tolist()
+
+
+def rle_string(counts):
+    """COCO's compressed RLE string (what pycocotools.mask.encode produces)."""
+    chars = []
+    for i, count in enumerate(counts):
+        x = count - counts[i - 2] if i > 2 else count
+        more = True
+        while more:
+            c = x & 0x1f
+            x >>= 5
+            more = x != -1 if c & 0x10 else x != 0
+            if more:
+                c |= 0x20
+            chars.append(chr(c + 48))
+    return "".join(chars)
+
+
+def render_rle(image, label_map, classes_to_keep, **options):
+    """
+    The mask as COCO run-length encoding, JSON {"size": [height, width], "counts": "..."}.
+    Decode with pycocotools.mask.decode, or any COCO RLE reader.
+    """
+    mask = binary_mask(label_map, classes_to_keep, image.size)
+    rle = {"size": [mask.shape[0], mask.shape[1]], "counts": rle_string(rle_counts(mask))}
+    return io.BytesIO(json.dumps(rle).encode())
+
+
+def render_polygons(image, label_map, classes_to_keep, tolerance=2.0, **options):
+    """
+    The mask outline as simplified polygons, JSON
+    {"size": [height, width], "polygons": [{"points": [x0, y0, x1, y1, ...], "hole": false}, ...]}.
+    `tolerance` is the largest distance in pixels a simplified edge may be from the true one.
+    """
+    mask = binary_mask(label_map, classes_to_keep, image.size)
+    contours, hierarchy = cv2.findContours(mask, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    polygons = []
+    for contour, (_, _, _, parent) in zip(contours, hierarchy[0] if hierarchy is not None else []):
+        simplified = cv2.approxPolyDP(contour, tolerance, True) if tolerance > 0 else contour
+        if len(simplified) >= 3:
+            polygons.append({"points": simplified.reshape(-1).tolist(), "hole": bool(parent >= 0)})
+    return io.BytesIO(json.dumps({"size": [mask.shape[0], mask.shape[1]], "polygons": polygons}).encode())
+
+
+RENDERERS = {
+    "cutout": render_cutout,
+    "webp": render_webp,
+    "mask": render_mask,
+    "mask1bit": render_mask_1bit,
+    "rle": render_rle,
+    "polygons": render_polygons,
+}
+# Content type and file extension of every output.
+OUTPUT_TYPES = {
+    "cutout": ("image/png", "png"),
+    "webp": ("image/webp", "webp"),
+    "mask": ("image/png", "png"),
+    "mask1bit": ("image/png", "png"),
+    "rle": ("application/json", "json"),
+    "polygons": ("application/json", "json"),
+}
+# Renderers that need the image's own pixels, not just its size.
+FULL_RESOLUTION_RENDERERS = {"cutout", "webp"}
 
 
 # This is our new, more robust processing function
-def process_image(image_bytes, net, classes_to_keep):
+def process_image(image_bytes, net, classes_to_keep, cache=None, output="cutout",
+                  resolution=MODEL_INPUT_SIZE, refine=False, tiling=None, **options):
     """
     Processes an image to segment clothing based on a list of class IDs.
+    `output` is one of RENDERERS; `options` go to the renderer. `resolution`,
+    `refine` and `tiling` are passed on to infer_label_map.
     """
     try:
-        # --- MODIFIED SECTION: More reliable way to open image from bytes ---
-        # 1. Load the uploaded image from memory using OpenCV for robustness
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img_cv2 = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if img_cv2 is None:
-            raise ValueError("Could not decode image from bytes.")
-            
-        # Convert image from BGR (OpenCV default) to RGB (PIL/PyTorch default)
-        img_rgb = cv2.cvtColor(img_cv2, cv2.COLOR_BGR2RGB)
-        
-        # Convert the numpy array to a PIL Image to use existing transforms
-        original_image = Image.fromarray(img_rgb)
-        img_size = original_image.size
-        # --- END OF MODIFIED SECTION ---
-
-        # 2. Pre-process the image for the model (no changes here)
-        img_for_model = original_image.resize((768, 768), Image.BICUBIC)
-        image_tensor = apply_transform(img_for_model)
-        image_tensor = torch.unsqueeze(image_tensor, 0)
-
-        # 3. Get segmentation mask from the model (no changes here)
-        with torch.no_grad():
-            d0, d1, d2, d3, d4, d5, d6 = net(image_tensor.to('cpu'))
-            pred = torch.max(d0, dim=1, keepdim=True)[1]
-            output_tensor = torch.squeeze(pred, dim=0)
-            output_arr = output_tensor.cpu().numpy()
-
-        # 4. Create the alpha mask in memory (no changes here)
-        combined_mask = np.zeros_like(output_arr[0], dtype=np.uint8)
-        for cls in classes_to_keep:
-            combined_mask[output_arr[0] == cls] = 255
-        
-        alpha_mask_arr = combined_mask
-
-        # Resize mask to the original image size
-        alpha_mask_pil = Image.fromarray(alpha_mask_arr, mode='L')
-        alpha_mask_pil = alpha_mask_pil.resize(img_size, Image.BICUBIC)
-        
-        # 5. Combine original image and alpha mask for a transparent result (no changes here)
-        original_image_np = np.array(original_image)
-        original_image_bgr = cv2.cvtColor(original_image_np, cv2.COLOR_RGB2BGR)
-        alpha_mask_np = np.array(alpha_mask_pil)
-        
-        transparent_image_np = cv2.merge([original_image_bgr, alpha_mask_np])
-
-        # 6. Convert the final transparent image to bytes to be sent back (no changes here)
-        _, img_encoded = cv2.imencode(".png", transparent_image_np)
-        return io.BytesIO(img_encoded.tobytes())
+        original_image = decode_image(
+            image_bytes, full_resolution=output in FULL_RESOLUTION_RENDERERS or tiling is not None,
+            min_side=resolution,
+        )
+        label_map = cached_label_map(image_bytes, original_image, net, cache, resolution, refine, tiling)
+        return RENDERERS[output](original_image, label_map, classes_to_keep, **options)
 
     except Exception as e:
         # If any error occurs, print it to the backend console for debugging
         print(f"An error occurred in process_image: {e}")
         # Return None to indicate failure, which will result in a 500 error
-        return None
\ No newline at end of file
+        return None
+
+
+def process_image_multi(image_bytes, net, garments, output="cutout", cache=None,
+                        resolution=MODEL_INPUT_SIZE, refine=False, tiling=None, **options):
+    """
+    Runs the network once and renders every requested garment from the same
+    label map. Returns a list of (garment name, BytesIO), or None on error.
+    """
+    try:
+        original_image = decode_image(
+            image_bytes, full_resolution=output in FULL_RESOLUTION_RENDERERS or tiling is not None,
+            min_side=resolution,
+        )
+        label_map = cached_label_map(image_bytes, original_image, net, cache, resolution, refine, tiling)
+        render = RENDERERS[output]
+        return [(name, render(original_image, label_map, GARMENT_CLASSES[name], **options)) for name in garments]
+
+    except Exception as e:
+        print(f"An error occurred in process_image_multi: {e}")
+        return None
@@ -0,0 +1,116 @@
+"""
+Post-training static int8 quantization of U2NET.
+
+Uses PyTorch's FX graph mode quantization: the network is traced, Conv + BN +
+ReLU are fused, observers record activation ranges while a folder of sample
+images runs through it (calibration), and every convolution is then replaced
+by an int8 one. The result is saved as a frozen TorchScript file, which
+inference_model.py serves as the "int8" backend:
+
+    python quantization.py --checkpoint cloth_segm.pth --images samples/ --out cloth_segm_int8.pt
+    SEGMENT_BACKEND=int8 SEGMENT_INT8_PATH=cloth_segm_int8.pt python app.py
+
+Calibrate on images that look like production uploads (a few dozen are
+enough), at the size the model is served at. eval_quantized.py measures how
+much the masks change.
+"""
+import argparse
+import copy
+import os
+
+import torch
+
+from processor import MODEL_INPUT_SIZE, decode_image, preprocess
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def quantized_engine():
+    """The best int8 kernel library this PyTorch build has (x86 > fbgemm > qnnpack)."""
+    for engine in ("x86", "fbgemm", "qnnpack"):
+        if engine in torch.backends.quantized.supported_engines:
+            return engine
+    raise RuntimeError("This PyTorch build has no quantized CPU engine")
+
+
+def image_paths(folder, limit=None):
+    paths = sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        raise ValueError(f"No images found in {folder}")
+    return paths[:limit] if limit else paths
+
+
+def load_images(folder, limit=None, size=MODEL_INPUT_SIZE):
+    """Yields (path, 1x3xHxW model input) for the images in `folder`, preprocessed like requests."""
+    for path in image_paths(folder, limit):
+        with open(path, "rb") as f:
+            # preprocess returns a reused buffer; callers may hold on to several inputs.
+            yield path, preprocess(decode_image(f.read()), size).clone()
+
+
+def quantize_static(net, calibration_inputs, engine=None):
+    """
+    Returns an int8 copy of `net` (a GraphModule returning only d0),
+    calibrated on the given 1x3xHxW inputs. `net` itself is left as it is.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = engine or quantized_engine()
+    torch.backends.quantized.engine = engine
+    model = copy.deepcopy(net).eval()
+    model.side_outputs = False
+
+    calibration_inputs = iter(calibration_inputs)
+    first = next(calibration_inputs)
+    prepared = prepare_fx(model, get_default_qconfig_mapping(engine), (first,))
+    with torch.no_grad():
+        prepared(first)
+        for image_tensor in calibration_inputs:
+            prepared(image_tensor)
+    return convert_fx(prepared)
+
+
+def save_quantized(quantized, path, size=MODEL_INPUT_SIZE):
+    """Saves the int8 model as a frozen TorchScript file (works for any input size)."""
+    with torch.no_grad():
+        traced = torch.jit.trace(quantized, torch.randn(1, 3, size, size), check_trace=False)
+    frozen = torch.jit.freeze(traced.eval())
+    tmp_path = f"{path}.tmp"
+    torch.jit.save(frozen, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_quantized(path):
+    torch.backends.quantized.engine = quantized_engine()
+    return torch.jit.load(path, map_location="cpu").eval()
+
+
+def main():
+    from inference_model import ARCHITECTURES, load_net
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpoint", default="cloth_segm.pth")
+    parser.add_argument("--arch", choices=sorted(ARCHITECTURES), default="u2net")
+    parser.add_argument("--images", required=True, help="Folder of calibration images")
+    parser.add_argument("--limit", type=int, default=64, help="Use at most this many images")
+    parser.add_argument("--size", type=int, default=MODEL_INPUT_SIZE, help="Model input size")
+    parser.add_argument("--out", default="cloth_segm_int8.pt")
+    args = parser.parse_args()
+
+    net = load_net(args.checkpoint, args.arch)
+    calibrated = []
+    inputs = (calibrated.append(path) or tensor for path, tensor in load_images(args.images, args.limit, args.size))
+    quantized = quantize_static(net, inputs)
+    print(f"Calibrated on {len(calibrated)} images ({torch.backends.quantized.engine} engine)")
+    save_quantized(quantized, args.out, args.size)
+    print(f"Wrote {args.out} ({os.path.getsize(args.out) / 1e6:.1f} MB, "
+          f"checkpoint {os.path.getsize(args.checkpoint) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import collections
+import concurrent.futures
+import queue
+import threading
+import time
+
+import numpy as np
+import torch
+
+
+class BatchScheduler(object):
+    """
+    Batches U2NET calls from concurrent requests.
+
+    Request threads call the scheduler exactly like the network,
+    `d0, d1, ..., d6 = scheduler(image_tensor)` with a 1x3xHxW tensor (or just
+    `d0 = scheduler(image_tensor)` for an inference build of it). The
+    tensors are queued; one worker thread takes up to `max_batch_size` of them
+    (waiting at most `max_wait_ms` after the first for others to arrive),
+    runs a single forward pass on the stacked batch and hands every caller
+    its own slice of each output.
+
+    Only inputs of the same image size can share a batch; a batch is closed
+    early when the next queued tensor has a different one. A caller may also
+    pass several images at once (an Nx3xHxW tensor, e.g. refinement crops);
+    they count towards `max_batch_size` as N images. More than
+    `max_batch_size` of them are split into several jobs, so no forward pass
+    is ever larger than `max_batch_size`.
+    """
+
+    def __init__(self, net, max_batch_size=4, max_wait_ms=10.0, history=1000):
+        self.net = net
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._carry = None
+        self._lock = threading.Lock()
+
+        self.batch_sizes = collections.Counter()
+        self.forward_passes = 0
+        self.images = 0
+        self.jobs = 0
+        self.failed = 0
+        # Recent queue waits in seconds, for percentiles.
+        self._waits = collections.deque(maxlen=history)
+        self._total_wait = 0.0
+
+        self._worker = threading.Thread(target=self._run, name="u2net-scheduler", daemon=True)
+        self._worker.start()
+
+    def __call__(self, image_tensor):
+        enqueued_at = time.perf_counter()
+        futures = []
+        for chunk in torch.split(image_tensor, self.max_batch_size):
+            future = concurrent.futures.Future()
+            self._queue.put((chunk, future, enqueued_at))
+            futures.append(future)
+        results = [future.result() for future in futures]
+        if len(results) == 1:
+            return results[0]
+        if isinstance(results[0], torch.Tensor):
+            return torch.cat(results, dim=0)
+        return tuple(torch.cat(parts, dim=0) for parts in zip(*results))
+
+    def _next_batch(self):
+        first = self._carry or self._queue.get()
+        self._carry = None
+        batch = [first]
+        images = first[0].shape[0]
+        deadline = time.perf_counter() + self.max_wait
+        while images < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job[0].shape[1:] != first[0].shape[1:] or images + job[0].shape[0] > self.max_batch_size:
+                # Runs first in the next batch.
+                self._carry = job
+                break
+            batch.append(job)
+            images += job[0].shape[0]
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+            waits = [started - enqueued_at for _, _, enqueued_at in batch]
+            images = sum(tensor.shape[0] for tensor, _, _ in batch)
+            try:
+                with torch.no_grad():
+                    outputs = self.net(torch.cat([tensor for tensor, _, _ in batch], dim=0))
+                offset = 0
+                for tensor, future, _ in batch:
+                    end = offset + tensor.shape[0]
+                    if isinstance(outputs, torch.Tensor):
+                        future.set_result(outputs[offset:end])
+                    else:
+                        future.set_result(tuple(output[offset:end] for output in outputs))
+                    offset = end
+                failed = 0
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                failed = images
+
+            with self._lock:
+                self.batch_sizes[images] += 1
+                self.forward_passes += 1
+                self.images += images
+                self.failed += failed
+                self._waits.extend(waits)
+                self._total_wait += sum(waits)
+                self.jobs += len(batch)
+
+    def stats(self):
+        with self._lock:
+            waits_ms = np.array(self._waits) * 1000.0
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queued": self._queue.qsize(),
+                "forward_passes": self.forward_passes,
+                "images": self.images,
+                "jobs": self.jobs,
+                "failed": self.failed,
+                "mean_batch_size": round(self.images / self.forward_passes, 2) if self.forward_passes else 0.0,
+                "batch_sizes": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+                "queue_wait_ms": {
+                    "mean": round(self._total_wait * 1000.0 / self.jobs, 2) if self.jobs else 0.0,
+                    "p50": round(float(np.percentile(waits_ms, 50)), 2) if waits_ms.size else 0.0,
+                    "p95": round(float(np.percentile(waits_ms, 95)), 2) if waits_ms.size else 0.0,
+                    "max": round(float(waits_ms.max()), 2) if waits_ms.size else 0.0,
+                },
+            }
@@ -0,0 +1,51 @@
+import pytest
+import torch
+
+from bench_backends import random_net
+from inference_model import build_inference_net, build_torchscript, export_onnx, OnnxNet
+
+
+@pytest.fixture(scope="module")
+def net_and_reference():
+    # Random BatchNorm statistics, so folding them into the convolutions is not a no-op.
+    torch.manual_seed(0)
+    net = random_net("u2netp")
+    inputs = torch.randn(1, 3, 64, 64)
+    with torch.no_grad():
+        reference = net(inputs)[0]
+    return net, inputs, reference
+
+
+def max_difference(model, inputs, reference):
+    with torch.no_grad():
+        return float((model(inputs) - reference).abs().max())
+
+
+def test_inference_net_matches_the_original_d0(net_and_reference):
+    net, inputs, reference = net_and_reference
+    assert max_difference(build_inference_net(net), inputs, reference) < 1e-4
+
+
+def test_torchscript_matches_the_original_d0(net_and_reference):
+    net, inputs, reference = net_and_reference
+    scripted = build_torchscript(build_inference_net(net), size=64)
+    assert max_difference(scripted, inputs, reference) < 1e-4
+    # Traced with dynamic shapes: another size still matches.
+    other = torch.randn(1, 3, 48, 80)
+    with torch.no_grad():
+        assert max_difference(scripted, other, net(other)[0]) < 1e-4
+
+
+def test_onnx_matches_the_original_d0(net_and_reference, tmp_path):
+    pytest.importorskip("onnxruntime")
+    net, inputs, reference = net_and_reference
+    onnx_net = OnnxNet(export_onnx(net, str(tmp_path / "model.onnx"), size=64))
+    assert max_difference(onnx_net, inputs, reference) < 1e-4
+
+
+def test_building_leaves_the_original_network_alone(net_and_reference):
+    net, inputs, reference = net_and_reference
+    build_inference_net(net)
+    with torch.no_grad():
+        outputs = net(inputs)
+    assert len(outputs) == 7 and torch.equal(outputs[0], reference)
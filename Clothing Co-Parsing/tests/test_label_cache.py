@@ -0,0 +1,122 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from label_cache import LabelMapCache
+
+
+def label_map(value, shape=(8, 8)):
+    return np.full(shape, value, dtype=np.uint8)
+
+
+def test_lru_respects_the_byte_bound():
+    cache = LabelMapCache(max_bytes=2 * 64)
+    cache.put("a", label_map(1))
+    cache.put("b", label_map(2))
+    assert cache.get("a") is not None  # "b" is now least recently used
+    cache.put("c", label_map(3))
+
+    assert cache.get("b") is None
+    assert cache.get("a")[0, 0] == 1 and cache.get("c")[0, 0] == 3
+    stats = cache.stats()
+    assert stats["bytes_held"] <= stats["max_bytes"]
+    assert stats["evictions"] == 1
+
+
+def test_maps_larger_than_the_bound_are_not_kept_in_memory():
+    cache = LabelMapCache(max_bytes=10)
+    cache.put("a", label_map(1))
+    assert cache.stats()["entries"] == 0 and cache.get("a") is None
+
+
+def test_put_stores_a_read_only_copy():
+    base = np.zeros((64, 64), dtype=np.uint8)
+    stored = LabelMapCache(max_bytes=1 << 20).put("a", base[:8, :8])
+    assert stored.base is None and stored.nbytes == 64
+    assert not stored.flags.writeable
+    with pytest.raises(ValueError):
+        stored[0, 0] = 1
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    key = LabelMapCache(max_bytes=1 << 20).key(b"image bytes", variant="768")
+    LabelMapCache(max_bytes=1 << 20, disk_dir=str(tmp_path)).put(key, label_map(3))
+
+    cache = LabelMapCache(max_bytes=1 << 20, disk_dir=str(tmp_path))
+    loaded = cache.get(key)
+    np.testing.assert_array_equal(loaded, label_map(3))
+    assert not loaded.flags.writeable
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.get(key) is loaded and cache.stats()["hits"] == 1
+
+
+def test_keys_depend_on_namespace_and_variant():
+    cache = LabelMapCache(max_bytes=0, namespace="model-a")
+    keys = {
+        cache.key(b"image"),
+        cache.key(b"image", variant="512"),
+        LabelMapCache(max_bytes=0, namespace="model-b").key(b"image"),
+    }
+    assert len(keys) == 3
+
+
+def test_concurrent_misses_share_one_compute():
+    cache = LabelMapCache(max_bytes=1 << 20)
+    calls = []
+    start = threading.Barrier(6)
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return label_map(2)
+
+    results = [None] * 6
+
+    def request(i):
+        start.wait()
+        results[i] = cache.get_or_compute("key", compute)
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    stats = cache.stats()
+    assert stats["misses"] == 1 and stats["coalesced"] == 5
+
+
+def test_compute_error_reaches_waiters_and_is_not_cached():
+    cache = LabelMapCache(max_bytes=1 << 20)
+    entered = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        entered.set()
+        release.wait()
+        raise RuntimeError("forward failed")
+
+    errors = []
+
+    def request():
+        try:
+            cache.get_or_compute("key", failing)
+        except RuntimeError as e:
+            errors.append(e)
+
+    owner = threading.Thread(target=request)
+    owner.start()
+    entered.wait()
+    waiter = threading.Thread(target=request)
+    waiter.start()
+    time.sleep(0.05)
+    release.set()
+    owner.join()
+    waiter.join()
+
+    assert len(errors) == 2
+    assert cache.get_or_compute("key", lambda: label_map(1))[0, 0] == 1
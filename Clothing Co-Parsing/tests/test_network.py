@@ -0,0 +1,26 @@
+import pytest
+import torch
+
+from bench_backends import random_net
+
+
+@pytest.fixture(scope="module")
+def net():
+    torch.manual_seed(0)
+    return random_net("u2netp")
+
+
+@pytest.mark.parametrize("shape", [(2, 3, 77, 61), (1, 3, 96, 128)])
+def test_lean_forward_matches_the_default_d0(net, shape):
+    # Odd, non-square sizes: every pooling level rounds and every upsample has to land back on the skip's shape.
+    inputs = torch.randn(*shape)
+    with torch.no_grad():
+        reference = net(inputs)[0]
+        net.lean = True
+        try:
+            lean = net(inputs)
+        finally:
+            net.lean = False
+
+    assert lean.shape == reference.shape == (shape[0], 4, shape[2], shape[3])
+    assert float((lean - reference).abs().max()) < 1e-4
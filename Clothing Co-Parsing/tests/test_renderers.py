@@ -0,0 +1,85 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+import processor
+from processor import DecodedImage
+
+CLASSES = (1, 3)
+
+
+def garment_label_map(width=120, height=90):
+    """Two garments, one with a hole, on background."""
+    label_map = np.zeros((height, width), np.uint8)
+    cv2.rectangle(label_map, (10, 10), (60, 70), 1, thickness=-1)
+    cv2.circle(label_map, (35, 40), 8, 0, thickness=-1)
+    cv2.ellipse(label_map, (90, 50), (20, 30), 15, 0, 360, 3, thickness=-1)
+    cv2.rectangle(label_map, (70, 5), (110, 15), 2, thickness=-1)  # not kept
+    return label_map
+
+
+def image_of(label_map):
+    height, width = label_map.shape
+    return DecodedImage(np.zeros((height, width, 3), np.uint8), (width, height))
+
+
+def render(name, label_map, **options):
+    return processor.RENDERERS[name](image_of(label_map), label_map, CLASSES, **options).getvalue()
+
+
+@pytest.mark.parametrize("mask", [
+    np.zeros((5, 7), np.uint8),
+    np.ones((5, 7), np.uint8),
+    np.eye(6, dtype=np.uint8),
+    (np.random.default_rng(0).random((40, 33)) > 0.5).astype(np.uint8),
+    (garment_label_map() == 1).astype(np.uint8),
+])
+def test_rle_string_matches_pycocotools(mask):
+    coco_mask = pytest.importorskip("pycocotools.mask")
+    expected = coco_mask.encode(np.asfortranarray(mask))["counts"].decode()
+    assert processor.rle_string(processor.rle_counts(mask)) == expected
+
+
+def test_rle_output_decodes_to_the_mask():
+    coco_mask = pytest.importorskip("pycocotools.mask")
+    label_map = garment_label_map()
+    rle = json.loads(render("rle", label_map))
+    assert rle["size"] == list(label_map.shape)
+    decoded = coco_mask.decode({"size": rle["size"], "counts": rle["counts"].encode()})
+    np.testing.assert_array_equal(decoded, processor.binary_mask(label_map, CLASSES, image_of(label_map).size))
+
+
+def rasterize(polygons, size):
+    height, width = size
+    mask = np.zeros((height, width), np.uint8)
+    for polygon in sorted(polygons, key=lambda p: p["hole"]):
+        points = np.asarray(polygon["points"], np.int32).reshape(-1, 1, 2)
+        if polygon["hole"]:
+            # Hole contours run along the garment pixels around the hole.
+            cv2.fillPoly(mask, [points], 0)
+            cv2.polylines(mask, [points], True, 1)
+        else:
+            cv2.fillPoly(mask, [points], 1)
+    return mask
+
+
+@pytest.mark.parametrize("tolerance, min_iou", [(0, 0.999), (2.0, 0.95)])
+def test_polygons_round_trip(tolerance, min_iou):
+    label_map = garment_label_map()
+    result = json.loads(render("polygons", label_map, tolerance=tolerance))
+    assert sum(polygon["hole"] for polygon in result["polygons"]) == 1
+    assert sum(not polygon["hole"] for polygon in result["polygons"]) == 2
+
+    expected = processor.binary_mask(label_map, CLASSES, image_of(label_map).size).astype(bool)
+    restored = rasterize(result["polygons"], result["size"]).astype(bool)
+    iou = (expected & restored).sum() / (expected | restored).sum()
+    assert iou >= min_iou
+
+
+def test_mask_outputs_agree():
+    label_map = garment_label_map()
+    mask = cv2.imdecode(np.frombuffer(render("mask", label_map), np.uint8), cv2.IMREAD_UNCHANGED)
+    one_bit = cv2.imdecode(np.frombuffer(render("mask1bit", label_map), np.uint8), cv2.IMREAD_UNCHANGED)
+    np.testing.assert_array_equal(mask >= 128, one_bit > 0)
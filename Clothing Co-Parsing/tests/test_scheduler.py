@@ -0,0 +1,60 @@
+import threading
+
+import torch
+
+from scheduler import BatchScheduler
+
+
+class RecordingNet(object):
+    """Stands in for U2NET: returns (d0, d1) and records every batch size."""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, x):
+        self.batch_sizes.append(x.shape[0])
+        return x * 2, x * 3
+
+
+def test_single_images_are_batched_and_sliced_back():
+    net = RecordingNet()
+    scheduler = BatchScheduler(net, max_batch_size=4, max_wait_ms=200)
+    inputs = [torch.full((1, 3, 4, 4), float(i)) for i in range(4)]
+    results = [None] * len(inputs)
+    # Submit together, well inside the 200 ms window, so the requests share a forward pass.
+    start = threading.Barrier(len(inputs))
+
+    def request(i):
+        start.wait()
+        results[i] = scheduler(inputs[i])
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(len(inputs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for x, (d0, d1) in zip(inputs, results):
+        assert torch.equal(d0, x * 2) and torch.equal(d1, x * 3)
+    assert 1 < max(net.batch_sizes) <= 4 and sum(net.batch_sizes) == 4
+    stats = scheduler.stats()
+    assert stats["batch_sizes"] == {str(size): net.batch_sizes.count(size) for size in set(net.batch_sizes)}
+    assert stats["forward_passes"] == len(net.batch_sizes) < 4 and stats["images"] == stats["jobs"] == 4
+
+
+def test_oversized_jobs_are_split_across_forward_passes():
+    net = RecordingNet()
+    scheduler = BatchScheduler(net, max_batch_size=4, max_wait_ms=0)
+    crops = torch.arange(11, dtype=torch.float32).reshape(11, 1, 1, 1).expand(11, 3, 4, 4)
+
+    d0, d1 = scheduler(crops)
+
+    assert torch.equal(d0, crops * 2) and torch.equal(d1, crops * 3)
+    assert max(net.batch_sizes) <= 4 and sum(net.batch_sizes) == 11
+    assert scheduler.stats()["images"] == 11
+
+
+def test_single_tensor_outputs():
+    scheduler = BatchScheduler(lambda x: x + 1, max_batch_size=2, max_wait_ms=0)
+    x = torch.zeros(5, 3, 2, 2)
+    assert torch.equal(scheduler(x), x + 1)
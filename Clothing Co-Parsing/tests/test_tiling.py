@@ -0,0 +1,107 @@
+import threading
+
+import cv2
+import numpy as np
+import torch
+
+import processor
+from label_cache import LabelMapCache
+from processor import DecodedImage, TileSettings
+from scheduler import BatchScheduler
+
+TILING = TileSettings(tile=256, overlap=64, max_side=2048, max_memory_mb=4096, workers=2)
+
+
+def pixelwise_net():
+    """A 1x1 convolution: each pixel's logits depend only on that pixel, so tiling can't change them."""
+    torch.manual_seed(0)
+    return torch.nn.Conv2d(3, processor.NUM_CLASSES, 1).eval()
+
+
+def photo(width, height, seed=0):
+    small = np.random.default_rng(seed).integers(0, 256, (height // 20, width // 20, 3), dtype=np.uint8)
+    pixels = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    return DecodedImage(pixels, (width, height))
+
+
+def test_tiled_matches_untiled_at_full_resolution():
+    image = photo(600, 500)
+    net = pixelwise_net()
+    tiled = processor.tiled_label_map(image, net, TILING)
+    untiled = processor.infer_label_map(image, net, size=600)
+    assert tiled.shape == untiled.shape == (500, 600)
+    np.testing.assert_array_equal(tiled, untiled)
+
+
+def test_small_images_run_as_one_input():
+    image = photo(200, 240)
+    net = pixelwise_net()
+    np.testing.assert_array_equal(
+        processor.tiled_label_map(image, net, TILING), processor.infer_label_map(image, net, size=256)
+    )
+
+
+def test_large_images_are_scaled_to_max_side():
+    image = photo(800, 600)
+    label_map = processor.tiled_label_map(image, pixelwise_net(), TILING._replace(max_side=400))
+    assert label_map.shape == (300, 400)
+
+
+def test_memory_cap_shrinks_tiles():
+    tight = TILING._replace(tile=768, max_memory_mb=1200)
+    tile, workers = processor.tile_plan(tight, 2000)
+    assert processor.MIN_TILE_SIZE <= tile < 768 and workers >= 1
+    assert processor.tile_plan(TILING._replace(tile=768), 2000) == (768, 2)
+
+
+def test_concurrent_tiled_requests_share_the_memory_cap():
+    # Room for one request's stripe and two 256 px tiles, across the whole process.
+    tiling = TILING._replace(max_memory_mb=340, workers=4)
+    image = photo(600, 500)
+    tile, workers = processor.tile_plan(tiling, 600)
+    assert (tile, workers) == (256, 2)
+
+    pixelwise = pixelwise_net()
+    batch_sizes = []
+
+    def net(x):
+        batch_sizes.append(x.shape[0])
+        with torch.no_grad():
+            return pixelwise(x)
+
+    scheduler = BatchScheduler(net, max_batch_size=4, max_wait_ms=50)
+    start = threading.Barrier(3)
+    results = [None] * 3
+
+    def request(i):
+        start.wait()
+        results[i] = processor.tiled_label_map(image, scheduler, tiling)
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(batch_sizes) <= workers
+    expected = processor.infer_label_map(image, pixelwise, size=600)
+    for result in results:
+        np.testing.assert_array_equal(result, expected)
+    assert processor.memory_budget(tiling.max_memory_mb).reserved == 0
+
+
+def test_cache_key_follows_the_effective_tile(monkeypatch):
+    image = photo(2000, 1500)
+    cache = LabelMapCache(max_bytes=1 << 20)
+    computed = []
+    monkeypatch.setattr(
+        processor, "infer_label_map",
+        lambda image, net, size, refine, tiling: computed.append(tiling) or np.zeros((1, 1), np.uint8),
+    )
+
+    roomy = TILING._replace(tile=768)
+    for tiling in (roomy, roomy._replace(workers=1), roomy._replace(max_memory_mb=1200)):
+        processor.cached_label_map(b"same image", image, None, cache, tiling=tiling)
+    # Fewer workers tile the same way and hit the cache; a tighter memory cap
+    # shrinks the tiles and is computed again.
+    assert computed == [roomy, roomy._replace(max_memory_mb=1200)]
@@ -0,0 +1,262 @@
+"""
+Approximate nearest-neighbour search with an inverted-file (IVF) index.
+
+Vectors are clustered around `nlist` centroids with spherical k-means. Each
+vector lives in the list of its closest centroid, and a query only scores the
+lists of its `nprobe` closest centroids. A larger nprobe gives better recall
+and costs more time.
+
+Lists are replaced copy-on-write: an insert or delete builds new arrays for
+the lists it touches and swaps them in under a lock. Searches read whatever
+arrays are current and never need the lock.
+
+Build an index from a catalog directory (see catalog.py):
+
+    python ann.py build --catalog catalog --out ann_index
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import threading
+
+import numpy as np
+
+from catalog import VectorCatalog, normalize_rows, top_k
+
+logger = logging.getLogger(__name__)
+
+CENTROIDS_FILE = "centroids.npy"
+VECTORS_FILE = "vectors.npy"
+OFFSETS_FILE = "offsets.npy"
+IDS_FILE = "ids.json"
+
+# Rows assigned to centroids per step, to bound the temporary score matrix.
+ASSIGN_BLOCK = 16384
+
+
+def assign(vectors, centroids):
+    """Returns the index of the most similar centroid for every row."""
+    labels = np.empty(vectors.shape[0], dtype=np.int64)
+    for start in range(0, vectors.shape[0], ASSIGN_BLOCK):
+        block = np.asarray(vectors[start:start + ASSIGN_BLOCK], dtype=np.float32)
+        labels[start:start + ASSIGN_BLOCK] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def kmeans(vectors, n_clusters, iterations=10, max_samples_per_cluster=64, seed=0):
+    """
+    Spherical k-means on unit-length vectors.
+
+    Trains on a random sample of at most `max_samples_per_cluster` rows per
+    cluster, which is plenty for the centroids and keeps training time
+    independent of the catalog size. Returns unit-length centroids.
+    """
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    n_clusters = min(n_clusters, n)
+    if n > n_clusters * max_samples_per_cluster:
+        sample_rows = np.sort(rng.choice(n, n_clusters * max_samples_per_cluster, replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+    else:
+        sample = np.asarray(vectors, dtype=np.float32)
+
+    centroids = sample[rng.choice(sample.shape[0], n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=n_clusters)
+        # Re-seed empty clusters from random samples.
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index over unit-length vectors with string ids.
+
+    `lists[i]` is an (ids, vectors) pair for centroid i; ids is an object
+    array of product ids and vectors a float32 matrix, row-aligned.
+    """
+
+    def __init__(self, centroids, nprobe=8):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        empty_ids = np.empty(0, dtype=object)
+        empty_vectors = np.empty((0, self.dim), dtype=np.float32)
+        self.lists = [(empty_ids, empty_vectors) for _ in range(self.nlist)]
+        self.id_to_list = {}
+        self._write_lock = threading.Lock()
+
+    @property
+    def dim(self):
+        return self.centroids.shape[1]
+
+    @property
+    def nlist(self):
+        return self.centroids.shape[0]
+
+    @property
+    def size(self):
+        return len(self.id_to_list)
+
+    @classmethod
+    def build(cls, ids, vectors, nlist=None, nprobe=8, iterations=10):
+        """Trains centroids on `vectors` and adds all of them to a new index."""
+        if nlist is None:
+            # 4 * sqrt(n) lists is the usual starting point for IVF.
+            nlist = max(1, int(4 * math.sqrt(len(ids))))
+        vectors = normalize_rows(vectors)
+        index = cls(kmeans(vectors, nlist, iterations=iterations), nprobe=nprobe)
+        index.add(ids, vectors)
+        return index
+
+    def add(self, ids, vectors):
+        """
+        Inserts or replaces vectors. An id that is already in the index is
+        moved to its new vector; an id repeated within `ids` keeps its last one.
+        """
+        ids = [str(i) for i in ids]
+        vectors = normalize_rows(vectors)
+        if len(ids) != vectors.shape[0]:
+            raise ValueError(f"{len(ids)} ids for {vectors.shape[0]} vectors")
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Vector dim {vectors.shape[1]} does not match index dim {self.dim}")
+
+        # Every id may appear only once in the lists, or a later remove would
+        # leave a stray copy behind.
+        last_row = {product_id: row for row, product_id in enumerate(ids)}
+        if len(last_row) < len(ids):
+            rows = np.fromiter(sorted(last_row.values()), dtype=np.int64, count=len(last_row))
+            ids, vectors = [ids[row] for row in rows], vectors[rows]
+        ids = np.asarray(ids, dtype=object)
+
+        labels = assign(vectors, self.centroids)
+        with self._write_lock:
+            self._remove_locked(ids)
+            for list_no in np.unique(labels):
+                rows = labels == list_no
+                old_ids, old_vectors = self.lists[list_no]
+                self.lists[list_no] = (
+                    np.concatenate([old_ids, ids[rows]]),
+                    np.concatenate([old_vectors, vectors[rows]]),
+                )
+                for product_id in ids[rows]:
+                    self.id_to_list[product_id] = int(list_no)
+
+    def remove(self, ids):
+        """Deletes ids from the index. Returns how many were present."""
+        with self._write_lock:
+            return self._remove_locked([str(i) for i in ids])
+
+    def _remove_locked(self, ids):
+        by_list = {}
+        for product_id in ids:
+            list_no = self.id_to_list.pop(product_id, None)
+            if list_no is not None:
+                by_list.setdefault(list_no, set()).add(product_id)
+
+        for list_no, doomed in by_list.items():
+            old_ids, old_vectors = self.lists[list_no]
+            keep = np.fromiter((i not in doomed for i in old_ids), dtype=bool, count=len(old_ids))
+            self.lists[list_no] = (old_ids[keep], old_vectors[keep])
+        return sum(len(doomed) for doomed in by_list.values())
+
+    def search(self, queries, k=10, nprobe=None):
+        """
+        Returns, for every query vector, a list of (product id, score) pairs
+        for the approximate top `k`, best first.
+        """
+        queries = normalize_rows(queries)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probe_lists, _ = top_k(queries @ self.centroids.T, nprobe)
+
+        results = []
+        for query, list_nos in zip(queries, probe_lists):
+            # Take a snapshot of the probed lists; writers replace, never mutate.
+            probed = [self.lists[list_no] for list_no in list_nos]
+            cand_ids = np.concatenate([ids for ids, _ in probed])
+            if cand_ids.size == 0:
+                results.append([])
+                continue
+            cand_vectors = np.concatenate([vectors for _, vectors in probed])
+            idx, vals = top_k((cand_vectors @ query)[None, :], k)
+            results.append([(cand_ids[i], float(v)) for i, v in zip(idx[0], vals[0])])
+        return results
+
+    def save(self, path):
+        """Writes the index to a directory; files are renamed into place."""
+        with self._write_lock:
+            lists = list(self.lists)
+        ids = np.concatenate([list_ids for list_ids, _ in lists]).tolist()
+        vectors = np.concatenate([list_vectors for _, list_vectors in lists])
+        offsets = np.cumsum([0] + [len(list_ids) for list_ids, _ in lists]).astype(np.int64)
+
+        os.makedirs(path, exist_ok=True)
+        arrays = {CENTROIDS_FILE: self.centroids, VECTORS_FILE: vectors, OFFSETS_FILE: offsets}
+        for name, array in arrays.items():
+            with open(os.path.join(path, name + ".tmp"), "wb") as f:
+                np.save(f, array)
+        with open(os.path.join(path, IDS_FILE + ".tmp"), "w") as f:
+            json.dump({"nprobe": self.nprobe, "ids": ids}, f)
+        for name in list(arrays) + [IDS_FILE]:
+            os.replace(os.path.join(path, name + ".tmp"), os.path.join(path, name))
+
+    @classmethod
+    def load(cls, path, nprobe=None):
+        """Reads an index written by `save`. `nprobe`, if given, overrides the saved default."""
+        centroids = np.load(os.path.join(path, CENTROIDS_FILE))
+        vectors = np.load(os.path.join(path, VECTORS_FILE))
+        offsets = np.load(os.path.join(path, OFFSETS_FILE))
+        with open(os.path.join(path, IDS_FILE)) as f:
+            meta = json.load(f)
+
+        index = cls(centroids, nprobe=nprobe or meta["nprobe"])
+        ids = np.asarray(meta["ids"], dtype=object)
+        for list_no in range(index.nlist):
+            start, end = offsets[list_no], offsets[list_no + 1]
+            index.lists[list_no] = (ids[start:end], vectors[start:end])
+            for product_id in ids[start:end]:
+                index.id_to_list[product_id] = list_no
+        logger.info(f"Loaded IVF index {path}: {index.size} vectors in {index.nlist} lists")
+        return index
+
+    def stats(self):
+        sizes = np.array([len(ids) for ids, _ in self.lists])
+        return {
+            "size": self.size,
+            "dim": self.dim,
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "largest_list": int(sizes.max()) if sizes.size else 0,
+            "empty_lists": int((sizes == 0).sum()),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build an IVF index from a catalog directory.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build")
+    build.add_argument("--catalog", default="catalog", help="Catalog directory (vectors.npy + ids.json)")
+    build.add_argument("--out", default="ann_index", help="Output index directory")
+    build.add_argument("--nlist", type=int, default=None, help="Number of lists (default 4*sqrt(n))")
+    build.add_argument("--nprobe", type=int, default=8, help="Default lists probed per query")
+    build.add_argument("--iterations", type=int, default=10, help="k-means iterations")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    catalog = VectorCatalog(args.catalog)
+    index = IVFIndex.build(
+        catalog.ids, catalog.vectors, nlist=args.nlist, nprobe=args.nprobe, iterations=args.iterations
+    )
+    index.save(args.out)
+    logger.info(f"Wrote IVF index to {args.out}: {index.stats()}")
+
+
+if __name__ == "__main__":
+    main()
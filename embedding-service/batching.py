@@ -0,0 +1,145 @@
+import asyncio
+import collections
+import logging
+import time
+
+from inference import Overloaded
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent embedding requests into batched encode calls.
+
+    Every call to `submit` queues one text. A single background task waits
+    until either `max_batch_size` texts are pending or `max_wait_ms` has
+    passed since the first one arrived, then hands the whole batch to
+    `encode_batch` and routes each resulting vector back to its caller.
+
+    `encode_batch` is an async callable that takes a list of texts and
+    returns a 2-D NumPy array with one row per text, in the same order.
+
+    Up to `max_inflight` batches are encoded at once (one per model replica).
+    While all of them are busy, new requests keep queueing and go out
+    together in the next batch. At most `max_pending` texts may wait; beyond
+    that `submit` raises Overloaded.
+    """
+
+    def __init__(self, encode_batch, max_batch_size=32, max_wait_ms=5.0, max_inflight=1, max_pending=None):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_inflight = max(1, int(max_inflight))
+        self.max_pending = max_pending
+
+        self._pending = collections.deque()
+        self._has_pending = None
+        self._batch_full = None
+        self._slots = None
+        self._inflight = set()
+        self._worker = None
+
+    async def start(self):
+        # Events must be created inside the running event loop.
+        self._has_pending = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_inflight)
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"Micro-batching enabled (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:g})"
+        )
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for task in list(self._inflight):
+            task.cancel()
+
+        # Fail anything still waiting so no caller hangs on shutdown.
+        while self._pending:
+            _, future, _ = self._pending.popleft()
+            if not future.done():
+                future.set_exception(RuntimeError("Batcher is shutting down"))
+
+    async def submit(self, text):
+        """Queues one text and waits for its embedding vector."""
+        if self._worker is None:
+            raise RuntimeError("Batcher has not been started")
+        if self.max_pending is not None and len(self._pending) >= self.max_pending:
+            raise Overloaded(f"{len(self._pending)} texts are already waiting to be encoded")
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        self._has_pending.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._batch_full.set()
+        return await future
+
+    async def _run(self):
+        while True:
+            # Hold off forming a batch until a replica is free; requests that
+            # arrive meanwhile will join it.
+            await self._slots.acquire()
+            await self._has_pending.wait()
+
+            # Give other requests a short window to join this batch, unless
+            # it is already full.
+            if len(self._pending) < self.max_batch_size and self.max_wait > 0:
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), self.max_wait)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = []
+            now = time.perf_counter()
+            while self._pending and len(batch) < self.max_batch_size:
+                text, future, enqueued_at = self._pending.popleft()
+                # Skip callers that went away while they were queued.
+                if not future.cancelled():
+                    STAGE_SECONDS.observe(now - enqueued_at, stage="batch_wait")
+                    batch.append((text, future))
+
+            if not self._pending:
+                self._has_pending.clear()
+            if len(self._pending) < self.max_batch_size:
+                self._batch_full.clear()
+
+            if not batch:
+                self._slots.release()
+                continue
+
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch):
+        texts = [text for text, _ in batch]
+        try:
+            vectors = await self.encode_batch(texts)
+        except asyncio.CancelledError:
+            # Cancelled by stop(): the callers in this batch must not hang either.
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Batcher is shutting down"))
+            raise
+        except Exception as e:
+            if not isinstance(e, Overloaded):
+                logger.error(f"Batched encode of {len(texts)} texts failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
@@ -0,0 +1,95 @@
+"""
+Local benchmark: IVF recall@k and queries/sec against exact search.
+
+Synthetic data is a mixture of Gaussian clusters in 384 dimensions, which is
+roughly how MiniLM sentence vectors are distributed. Pass --catalog to
+benchmark on real vectors from a catalog directory instead (see catalog.py
+and embed_catalog.py); queries are then noisy copies of catalog rows.
+
+    python bench_ann.py --size 200000
+    python bench_ann.py --catalog catalog --nprobe 4 8 16 32
+"""
+import argparse
+import time
+
+import numpy as np
+
+from ann import IVFIndex
+from bench_utils import print_table
+from catalog import VectorCatalog, normalize_rows, top_k
+
+
+def synthetic_vectors(size, dim, clusters, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=size)
+    return normalize_rows(centers[labels] + 0.6 * rng.normal(size=(size, dim)).astype(np.float32))
+
+
+def make_queries(vectors, count, seed=1):
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(vectors.shape[0], count, replace=False)
+    noise = 0.05 * rng.normal(size=(count, vectors.shape[1])).astype(np.float32)
+    return normalize_rows(np.asarray(vectors[rows]) + noise)
+
+
+def exact_top_k(vectors, queries, k):
+    started = time.perf_counter()
+    idx, _ = top_k(queries @ np.asarray(vectors).T, k)
+    return idx, time.perf_counter() - started
+
+
+def bench(ids, vectors, queries, k, nlist, nprobes):
+    exact_idx, exact_time = exact_top_k(vectors, queries, k)
+    truth = [set(ids[i] for i in row) for row in exact_idx]
+
+    started = time.perf_counter()
+    index = IVFIndex.build(ids, vectors, nlist=nlist)
+    build_time = time.perf_counter() - started
+    print(f"Built IVF index in {build_time:.1f}s: {index.stats()}")
+
+    rows = [{"search": "exact", "nprobe": "-", f"recall@{k}": 1.0, "qps": round(len(queries) / exact_time, 1)}]
+    for nprobe in nprobes:
+        started = time.perf_counter()
+        results = index.search(queries, k=k, nprobe=nprobe)
+        elapsed = time.perf_counter() - started
+        recall = np.mean([len(truth[q] & {i for i, _ in hits}) / k for q, hits in enumerate(results)])
+        rows.append({
+            "search": "ivf",
+            "nprobe": nprobe,
+            f"recall@{k}": round(float(recall), 4),
+            "qps": round(len(queries) / elapsed, 1),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--catalog", default=None, help="Benchmark on a real catalog directory")
+    parser.add_argument("--size", type=int, default=100000, help="Synthetic catalog size")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200, help="Synthetic mixture components")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    if args.catalog:
+        catalog = VectorCatalog(args.catalog)
+        ids, vectors = catalog.ids, catalog.vectors
+        source = f"catalog {args.catalog}"
+    else:
+        vectors = synthetic_vectors(args.size, args.dim, args.clusters)
+        ids = [str(i) for i in range(args.size)]
+        source = "synthetic"
+
+    queries = make_queries(vectors, min(args.queries, len(ids)))
+    rows = bench(ids, vectors, queries, args.k, args.nlist, args.nprobe)
+
+    print(f"\n{source}: {len(ids)} vectors of dim {vectors.shape[1]}, {len(queries)} queries\n")
+    print_table(rows, ["search", "nprobe", f"recall@{args.k}", "qps"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Local benchmark: PyTorch vs ONNX Runtime vs ONNX Runtime int8.
+
+First checks that every backend produces the same vectors as PyTorch (mean
+and worst cosine similarity over a corpus), then measures latency and
+throughput per batch size. Exits non-zero if a backend drifts below
+--min-cosine, so it can gate swapping EMBED_BACKEND.
+
+    python bench_backends.py --threads 4 --batch-sizes 1 8 32
+    python bench_backends.py --corpus product_titles.txt --min-cosine 0.99
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from bench_utils import SAMPLE_QUERIES, make_queries, print_table
+from encoders import BACKENDS, load_encoder
+
+
+def parity(reference, encoder, corpus, batch_size=64):
+    cosines = []
+    for start in range(0, len(corpus), batch_size):
+        texts = corpus[start:start + batch_size]
+        # Both sides are unit length, so the dot product is the cosine.
+        cosines.append((reference.encode(texts) * encoder.encode(texts)).sum(axis=1))
+    cosines = np.concatenate(cosines)
+    return float(cosines.mean()), float(cosines.min())
+
+
+def latency(encoder, batch_size, repeats):
+    texts = make_queries(batch_size)
+    encoder.encode(texts)  # warm-up
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        encoder.encode(texts)
+        timings.append(time.perf_counter() - started)
+    timings = np.asarray(timings) * 1000.0
+    return {
+        "p50_ms": round(float(np.percentile(timings, 50)), 2),
+        "p95_ms": round(float(np.percentile(timings, 95)), 2),
+        "texts_per_s": round(batch_size * repeats / (timings.sum() / 1000.0), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--onnx-dir", default="onnx_model")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--corpus", default=None, help="Text file with one sentence per line for the parity check")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads for every backend")
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    args = parser.parse_args()
+
+    if args.threads:
+        import torch
+
+        torch.set_num_threads(args.threads)
+
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            corpus = [line.strip() for line in f if line.strip()]
+    else:
+        corpus = SAMPLE_QUERIES
+
+    encoders = {
+        backend: load_encoder(backend, args.model, onnx_dir=args.onnx_dir, threads=args.threads)
+        for backend in args.backends
+    }
+    reference = encoders.get("torch") or load_encoder("torch", args.model)
+
+    rows = []
+    failed = []
+    for backend, encoder in encoders.items():
+        mean_cos, min_cos = parity(reference, encoder, corpus)
+        if min_cos < args.min_cosine:
+            failed.append(backend)
+        for batch_size in args.batch_sizes:
+            rows.append({
+                "backend": backend,
+                "batch": batch_size,
+                "mean_cos": round(mean_cos, 5),
+                "min_cos": round(min_cos, 5),
+                **latency(encoder, batch_size, args.repeats),
+            })
+
+    print(f"\nParity over {len(corpus)} texts, {args.repeats} runs per batch size\n")
+    print_table(rows, ["backend", "batch", "mean_cos", "min_cos", "p50_ms", "p95_ms", "texts_per_s"])
+    if failed:
+        print(f"\nBelow --min-cosine {args.min_cosine}: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
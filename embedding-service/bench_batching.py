@@ -0,0 +1,79 @@
+"""
+Local benchmark: /embed latency and throughput with micro-batching on vs off.
+
+Runs in-process against the same code path the endpoint uses, without HTTP,
+so the numbers isolate the effect of batching on the model itself.
+
+    python bench_batching.py --requests 2000 --concurrency 64
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi.concurrency import run_in_threadpool
+from sentence_transformers import SentenceTransformer
+
+from batching import MicroBatcher
+from bench_utils import make_queries, print_table, summarize_latencies
+
+
+async def run_load(embed_one, queries, concurrency):
+    """Fires `queries` through `embed_one` with at most `concurrency` in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(text):
+        async with semaphore:
+            started = time.perf_counter()
+            await embed_one(text)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(text) for text in queries))
+    return summarize_latencies(latencies, time.perf_counter() - started)
+
+
+async def bench(model, queries, concurrency, max_batch_size, max_wait_ms):
+    async def encode_batch(texts):
+        return await run_in_threadpool(model.encode, texts)
+
+    async def unbatched(text):
+        return (await encode_batch([text]))[0]
+
+    batcher = MicroBatcher(encode_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    await batcher.start()
+    try:
+        # Warm up both paths so the first forward pass isn't measured.
+        await run_load(unbatched, queries[:32], concurrency)
+        await run_load(batcher.submit, queries[:32], concurrency)
+
+        off = await run_load(unbatched, queries, concurrency)
+        on = await run_load(batcher.submit, queries, concurrency)
+    finally:
+        await batcher.stop()
+
+    return [dict(mode="batching off", **off), dict(mode="batching on", **on)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    model = SentenceTransformer(args.model)
+    queries = make_queries(args.requests)
+    rows = asyncio.run(bench(model, queries, args.concurrency, args.max_batch_size, args.max_wait_ms))
+
+    print(
+        f"\n{args.requests} requests, concurrency {args.concurrency}, "
+        f"max_batch_size {args.max_batch_size}, max_wait_ms {args.max_wait_ms:g}\n"
+    )
+    print_table(rows, ["mode", "requests", "p50_ms", "p99_ms", "mean_ms", "throughput_rps"])
+
+
+if __name__ == "__main__":
+    main()
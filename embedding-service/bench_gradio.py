@@ -0,0 +1,91 @@
+"""
+Local benchmark: two-step Gradio call/poll vs the one-shot route.
+
+Talks to a running service over HTTP, since the difference between the two
+paths is the extra network round trip:
+
+    uvicorn main:app --port 8000
+    python bench_gradio.py --url http://localhost:8000 --requests 500 --concurrency 16
+
+Queries get a per-request suffix so the embedding cache doesn't hide the
+model time; pass --allow-cache to measure cached responses instead.
+"""
+import argparse
+import asyncio
+import functools
+import time
+
+import httpx
+
+from bench_utils import make_queries, print_table, summarize_latencies
+
+CALL_PATH = "/gradio_api/call/generate_embedding"
+RUN_PATH = "/gradio_api/run/generate_embedding"
+
+
+async def two_step(client, text):
+    response = await client.post(CALL_PATH, json={"data": [text]})
+    response.raise_for_status()
+    event_id = response.json()["event_id"]
+    response = await client.get(f"{CALL_PATH}/{event_id}")
+    response.raise_for_status()
+    if "event: complete" not in response.text:
+        raise RuntimeError(f"Unexpected event stream: {response.text[:80]}")
+
+
+async def one_shot(client, text, dim):
+    response = await client.post(RUN_PATH, json={"data": [text]})
+    response.raise_for_status()
+    vector = response.json()["data"][0]["vector"]
+    if len(vector) != dim:
+        raise RuntimeError(f"Expected a {dim}-dim vector, got {len(vector)}")
+
+
+async def run_load(client, request, queries, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(text):
+        async with semaphore:
+            started = time.perf_counter()
+            await request(client, text)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(text) for text in queries))
+    return summarize_latencies(latencies, time.perf_counter() - started)
+
+
+async def bench(url, queries, concurrency, allow_cache, dim):
+    rows = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    paths = (("call + poll (2 round trips)", two_step), ("one-shot (1 round trip)", functools.partial(one_shot, dim=dim)))
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60.0) as client:
+        for name, request in paths:
+            texts = queries if allow_cache else [f"{text} #{name[:3]}{i}" for i, text in enumerate(queries)]
+            # Warm up connections and the model on texts the measured run
+            # doesn't use, so none of its requests start out cached.
+            warm_up = [f"warm-up #{name[:3]}{i}" for i in range(concurrency)]
+            await run_load(client, request, warm_up, concurrency)
+            rows.append(dict(path=name, **await run_load(client, request, texts, concurrency)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--allow-cache", action="store_true")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding size the one-shot responses must have")
+    args = parser.parse_args()
+
+    queries = make_queries(args.requests)
+    rows = asyncio.run(bench(args.url, queries, args.concurrency, args.allow_cache, args.dim))
+
+    print(f"\n{args.requests} requests per path against {args.url}, concurrency {args.concurrency}\n")
+    print_table(rows, ["path", "requests", "p50_ms", "p95_ms", "p99_ms", "mean_ms", "throughput_rps"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Local benchmark: recall, speed and memory of int8 / PQ compressed search.
+
+Compares exact float32 search with every quantizer, both on the compressed
+scores alone and after re-ranking the shortlist against the float32 rows.
+Uses synthetic MiniLM-like vectors unless --catalog points at a real catalog
+directory (codes are then trained into that directory).
+
+    python bench_quantization.py --size 200000
+    python bench_quantization.py --catalog catalog --m 48 --rerank 4
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from bench_ann import make_queries, synthetic_vectors
+from bench_utils import print_table
+from catalog import VectorCatalog, write_catalog
+from quantization import KINDS, train_quantizer
+
+
+def run_search(catalog, queries, k):
+    started = time.perf_counter()
+    results = catalog.search(queries, k=k)
+    elapsed = time.perf_counter() - started
+    return [{product_id for product_id, _ in hits} for hits in results], len(queries) / elapsed
+
+
+def bench(catalog_dir, queries, k, m, rerank):
+    exact = VectorCatalog(catalog_dir)
+    truth, exact_qps = run_search(exact, queries, k)
+    float_mb = exact.memory_stats()["float32_bytes"] / 1e6
+    rows = [{"search": "exact float32", f"recall@{k}": 1.0, "qps": round(exact_qps, 1), "resident_mb": round(float_mb, 1)}]
+
+    for kind in KINDS:
+        quantizer = train_quantizer(catalog_dir, kind, m=m)
+        for rerank_factor in (0, rerank):
+            catalog = VectorCatalog(catalog_dir, quantizer=quantizer, rerank=rerank_factor)
+            found, qps = run_search(catalog, queries, k)
+            recall = np.mean([len(t & f) / k for t, f in zip(truth, found)])
+            stats = catalog.memory_stats()
+            rows.append({
+                "search": f"{kind}" + (f" + rerank x{rerank_factor}" if rerank_factor else ""),
+                f"recall@{k}": round(float(recall), 4),
+                "qps": round(qps, 1),
+                "resident_mb": round(stats["code_bytes"] / 1e6, 1),
+                "saved_mb": round(stats["bytes_saved"] / 1e6, 1),
+                "ratio": stats["compression_ratio"],
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--catalog", default=None)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--m", type=int, default=48, help="PQ sub-vectors per vector")
+    parser.add_argument("--rerank", type=int, default=4, help="Shortlist size as a multiple of k")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        catalog_dir = args.catalog
+        if catalog_dir is None:
+            vectors = synthetic_vectors(args.size, args.dim, clusters=200)
+            catalog_dir = scratch
+            write_catalog(catalog_dir, range(args.size), vectors)
+
+        vectors = VectorCatalog(catalog_dir).vectors
+        queries = make_queries(vectors, min(args.queries, vectors.shape[0]))
+        rows = bench(catalog_dir, queries, args.k, args.m, args.rerank)
+
+    print(f"\n{vectors.shape[0]} vectors of dim {vectors.shape[1]}, {len(queries)} queries\n")
+    print_table(rows, ["search", f"recall@{args.k}", "qps", "resident_mb", "saved_mb", "ratio"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Load-testing and regression benchmark for the whole embedding service.
+
+Replays a query mix (unique short queries, unique long product
+descriptions and repeated strings that hit the cache) against /embed at
+several concurrency levels and against /embed_batch at several batch sizes.
+Reports throughput, p50/p95/p99 latency, error count, peak RSS and CPU use
+of the service process, and writes everything to a JSON file.
+
+The service is started for the run, on localhost in a subprocess (default),
+or in this process through ASGI without HTTP. An already running service
+can be used with --url; RSS/CPU are then only reported when --pid is given.
+
+    python bench_service.py --out bench.json
+    python bench_service.py --in-process --concurrency 1 8 32 --batch-sizes 8 64
+    python bench_service.py --out new.json --baseline bench.json --tolerance 10
+
+With --baseline, scenarios whose p95 latency rose or whose throughput fell by
+more than --tolerance percent are listed and the script exits with status 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+
+from bench_utils import SAMPLE_QUERIES, print_table, summarize_latencies
+
+try:
+    import psutil
+except ImportError:
+    # Falls back to /proc, so RSS/CPU are then Linux-only.
+    psutil = None
+
+LONG_DESCRIPTION = (
+    "{} with a regular fit, round neck and three-quarter sleeves. Crafted from a soft cotton "
+    "blend with intricate thread work along the yoke and hem, finished with a contrast "
+    "piping. Machine wash cold, do not bleach, dry in shade. Pairs well with palazzos, "
+    "juttis and statement earrings for festive occasions."
+)
+
+
+def query_mix(count, short=0.5, long=0.3, seed=0):
+    """
+    `count` texts: a `short` share of unique short queries, a `long` share of
+    unique long descriptions and the rest drawn from a small repeated set.
+    """
+    rng = np.random.default_rng(seed)
+    kinds = rng.choice(3, size=count, p=[short, long, max(0.0, 1.0 - short - long)])
+    base = rng.integers(0, len(SAMPLE_QUERIES), size=count)
+    texts = []
+    for i, (kind, pick) in enumerate(zip(kinds, base)):
+        if kind == 0:
+            texts.append(f"{SAMPLE_QUERIES[pick]} #{seed}-{i}")
+        elif kind == 1:
+            texts.append(LONG_DESCRIPTION.format(SAMPLE_QUERIES[pick]) + f" Style #{seed}-{i}.")
+        else:
+            texts.append(SAMPLE_QUERIES[pick])
+    return texts
+
+
+class ProcessSampler:
+    """Samples RSS and CPU time of a process while a scenario runs."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.peak_rss = 0
+        self._task = None
+
+    def _rss_and_cpu(self):
+        if psutil is not None:
+            process = psutil.Process(self.pid)
+            times = process.cpu_times()
+            return process.memory_info().rss, times.user + times.system
+        with open(f"/proc/{self.pid}/status") as f:
+            rss = next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS:"))
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return rss, (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    async def _poll(self):
+        while True:
+            self.peak_rss = max(self.peak_rss, self._rss_and_cpu()[0])
+            await asyncio.sleep(0.05)
+
+    async def __aenter__(self):
+        self.peak_rss, self._cpu = self._rss_and_cpu()
+        self._started = time.perf_counter()
+        self._task = asyncio.create_task(self._poll())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+        rss, cpu = self._rss_and_cpu()
+        self.peak_rss = max(self.peak_rss, rss)
+        elapsed = time.perf_counter() - self._started
+        # 100% = one core fully busy.
+        self.cpu_percent = round(100.0 * (cpu - self._cpu) / elapsed, 1) if elapsed > 0 else 0.0
+
+
+async def replay(client, requests, concurrency, sampler=None):
+    """Sends (path, body) pairs with at most `concurrency` in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(path, body):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, json=body)
+                response.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - started)
+
+    async def run_all():
+        started = time.perf_counter()
+        await asyncio.gather(*(one(path, body) for path, body in requests))
+        return time.perf_counter() - started
+
+    if sampler is None:
+        elapsed = await run_all()
+        usage = {}
+    else:
+        async with sampler:
+            elapsed = await run_all()
+        usage = {"peak_rss_mb": round(sampler.peak_rss / 1e6, 1), "cpu_percent": sampler.cpu_percent}
+
+    summary = summarize_latencies(latencies or [0.0], elapsed)
+    summary["requests"] = len(latencies)
+    return {**summary, "errors": errors, **usage}
+
+
+async def run_scenarios(client, args, pid):
+    scenarios = []
+    sampler = ProcessSampler(pid) if pid else None
+    seed = 1
+
+    # Warm-up: connections, model and allocator, not measured.
+    await replay(client, [("/embed", {"text": text}) for text in query_mix(64, seed=0)], 8)
+
+    for concurrency in args.concurrency:
+        texts = query_mix(args.requests, args.short, args.long, seed=seed)
+        seed += 1
+        result = await replay(client, [("/embed", {"text": text}) for text in texts], concurrency, sampler)
+        scenarios.append({"name": f"embed c={concurrency}", "endpoint": "/embed", "concurrency": concurrency, **result})
+        print(f"  {scenarios[-1]['name']}: {result['throughput_rps']} req/s, p95 {result['p95_ms']} ms")
+
+    for batch_size in args.batch_sizes:
+        calls = max(1, args.requests // batch_size)
+        texts = query_mix(calls * batch_size, args.short, args.long, seed=seed)
+        seed += 1
+        requests = [
+            ("/embed_batch", {"texts": texts[i:i + batch_size], "encoding": "f32"})
+            for i in range(0, len(texts), batch_size)
+        ]
+        result = await replay(client, requests, args.batch_concurrency, sampler)
+        result["texts_per_s"] = round(result["throughput_rps"] * batch_size, 1)
+        scenarios.append({
+            "name": f"embed_batch b={batch_size}",
+            "endpoint": "/embed_batch",
+            "batch_size": batch_size,
+            "concurrency": args.batch_concurrency,
+            **result,
+        })
+        print(f"  {scenarios[-1]['name']}: {result['texts_per_s']} texts/s, p95 {result['p95_ms']} ms")
+    return scenarios
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_ready(client, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/readyz")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"Service was not ready after {timeout}s")
+
+
+async def bench_subprocess(args):
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120.0, limits=_limits(args)) as client:
+            await wait_ready(client, args.startup_timeout)
+            return await run_scenarios(client, args, server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def bench_url(args):
+    async with httpx.AsyncClient(base_url=args.url, timeout=120.0, limits=_limits(args)) as client:
+        await wait_ready(client, args.startup_timeout)
+        return await run_scenarios(client, args, args.pid)
+
+
+async def bench_in_process(args):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import main
+
+    # Requests go straight into the ASGI app; no sockets involved.
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120.0) as client:
+            await wait_ready(client, args.startup_timeout)
+            return await run_scenarios(client, args, os.getpid())
+
+
+def _limits(args):
+    connections = max(args.concurrency + [args.batch_concurrency])
+    return httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+
+
+def compare(results, baseline, tolerance):
+    """Returns rows describing every scenario that regressed against the baseline."""
+    previous = {scenario["name"]: scenario for scenario in baseline["scenarios"]}
+    regressions = []
+    for scenario in results["scenarios"]:
+        before = previous.get(scenario["name"])
+        if before is None:
+            continue
+        p95_change = 100.0 * (scenario["p95_ms"] - before["p95_ms"]) / max(before["p95_ms"], 1e-9)
+        rps_change = 100.0 * (scenario["throughput_rps"] - before["throughput_rps"]) / max(before["throughput_rps"], 1e-9)
+        if p95_change > tolerance or rps_change < -tolerance or scenario["errors"] > before["errors"]:
+            regressions.append({
+                "name": scenario["name"],
+                "p95_ms": f"{before['p95_ms']} -> {scenario['p95_ms']} ({p95_change:+.1f}%)",
+                "throughput_rps": f"{before['throughput_rps']} -> {scenario['throughput_rps']} ({rps_change:+.1f}%)",
+                "errors": f"{before['errors']} -> {scenario['errors']}",
+            })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default=None, help="Benchmark an already running service")
+    target.add_argument("--in-process", action="store_true", help="Call the ASGI app directly, without HTTP")
+    parser.add_argument("--pid", type=int, default=None, help="Service process id for RSS/CPU with --url")
+    parser.add_argument("--requests", type=int, default=1000, help="Texts per scenario")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--batch-concurrency", type=int, default=4)
+    parser.add_argument("--short", type=float, default=0.5, help="Share of unique short queries")
+    parser.add_argument("--long", type=float, default=0.3, help="Share of unique long descriptions")
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--out", default="bench_service.json")
+    parser.add_argument("--baseline", default=None, help="Earlier --out file to compare against")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="Allowed regression in percent")
+    args = parser.parse_args()
+
+    if args.in_process:
+        mode, runner = "in-process", bench_in_process
+    elif args.url:
+        mode, runner = f"url {args.url}", bench_url
+    else:
+        mode, runner = "localhost subprocess", bench_subprocess
+
+    print(f"Benchmarking ({mode})...")
+    scenarios = asyncio.run(runner(args))
+    results = {
+        "meta": {
+            "mode": mode,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "requests_per_scenario": args.requests,
+            "mix": {"short": args.short, "long": args.long, "repeated": round(1.0 - args.short - args.long, 3)},
+            "env": {key: value for key, value in os.environ.items() if key.startswith(("EMBED", "CATALOG", "ANN"))},
+        },
+        "scenarios": scenarios,
+    }
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print()
+    print_table(scenarios, ["name", "requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mb", "cpu_percent"])
+    print(f"\nWrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressions beyond {args.tolerance:g}% against {args.baseline}:\n")
+            print_table(regressions, ["name", "p95_ms", "throughput_rps", "errors"])
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:g}% against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
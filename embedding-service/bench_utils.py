@@ -0,0 +1,56 @@
+"""
+Small helpers shared by the local benchmark scripts.
+"""
+import numpy as np
+
+
+# A mix of the texts the backend controllers actually send: short category
+# strings, Gemini-style sub-queries and longer product descriptions.
+SAMPLE_QUERIES = [
+    "Kurta",
+    "Lehenga",
+    "Co-ord set",
+    "Cream or Off-white Kurta",
+    "Gold-toned jhumka earrings",
+    "Beige block heels for a wedding",
+    "Pastel floral print maxi skirt",
+    "Navy blue slim fit chinos",
+    "Women Cream-Coloured Ethnic Motifs Embroidered Straight Kurta with "
+    "Thread Work, round neck, three-quarter regular sleeves, calf length",
+    "Maroon and gold-toned lehenga choli with embroidered blouse and net "
+    "dupatta, suitable for festive and wedding occasions",
+    "Brass table lamp with a fabric shade for a cosy reading corner",
+    "Macrame wall hanging in off-white cotton for a boho living room",
+]
+
+
+def make_queries(count, seed=0):
+    """Returns `count` queries sampled from SAMPLE_QUERIES with repeats."""
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(SAMPLE_QUERIES), size=count)
+    return [SAMPLE_QUERIES[i] for i in picks]
+
+
+def summarize_latencies(latencies, elapsed):
+    """
+    Turns a list of per-request latencies (seconds) and the wall-clock time
+    of the whole run into a summary dict with milliseconds and requests/sec.
+    """
+    arr = np.asarray(latencies, dtype=np.float64) * 1000.0
+    return {
+        "requests": int(arr.size),
+        "p50_ms": round(float(np.percentile(arr, 50)), 2),
+        "p95_ms": round(float(np.percentile(arr, 95)), 2),
+        "p99_ms": round(float(np.percentile(arr, 99)), 2),
+        "mean_ms": round(float(arr.mean()), 2),
+        "throughput_rps": round(arr.size / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+
+def print_table(rows, columns):
+    """Prints a list of dicts as a fixed-width table."""
+    widths = [max(len(col), *(len(str(row.get(col, ""))) for row in rows)) for col in columns]
+    print("  ".join(col.ljust(w) for col, w in zip(columns, widths)))
+    print("  ".join("-" * w for w in widths))
+    for row in rows:
+        print("  ".join(str(row.get(col, "")).ljust(w) for col, w in zip(columns, widths)))
@@ -0,0 +1,314 @@
+import asyncio
+import collections
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry bookkeeping cost (dict slot, tuple, array header) on top of
+# the vector and key themselves. Only used for the memory bound.
+ENTRY_OVERHEAD_BYTES = 200
+
+# Bumped whenever normalize_text changes, so a persistent store written with
+# the old keys is cleared instead of served.
+KEY_VERSION = 2
+
+# SQLite's default limit on bound parameters is 999.
+STORE_READ_CHUNK = 500
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text, lowercase=False):
+    """
+    Builds the cache key for a text.
+
+    Whitespace runs are collapsed and the ends stripped; the tokenizer
+    splits on whitespace, so this doesn't change the tokens. With
+    `lowercase` (only for models whose tokenizer lower-cases its input,
+    see encoders.is_uncased) the key is lower-cased as well. The key is only
+    used for lookups: the model always encodes the text as it was sent.
+    """
+    text = _WHITESPACE.sub(" ", text).strip()
+    return text.lower() if lowercase else text
+
+
+class PersistentStore:
+    """
+    SQLite-backed second tier for the embedding cache.
+
+    Vectors are stored as raw float32 blobs next to the time they were
+    written. The model name is recorded in a meta table and the store is
+    wiped if it changes, so vectors from a different model are never served.
+    """
+
+    def __init__(self, path, model_name):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, created REAL NOT NULL)"
+        )
+
+        identity = f"{model_name} (keys v{KEY_VERSION})"
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'model'").fetchone()
+        if row is not None and row[0] != identity:
+            logger.info(f"Embedding store {path} was built with '{row[0]}', clearing it.")
+            self._conn.execute("DELETE FROM embeddings")
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('model', ?)", (identity,))
+        self._conn.commit()
+
+    def get(self, key, min_created=0.0):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector, created FROM embeddings WHERE key = ? AND created >= ?",
+                (key, min_created),
+            ).fetchone()
+        if row is None:
+            return None, None
+        return np.frombuffer(row[0], dtype=np.float32), row[1]
+
+    def get_many(self, keys, min_created=0.0):
+        """Returns {key: (vector, created)} for the keys stored no earlier than `min_created`."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), STORE_READ_CHUNK):
+                chunk = keys[start:start + STORE_READ_CHUNK]
+                rows = self._conn.execute(
+                    f"SELECT key, vector, created FROM embeddings "
+                    f"WHERE created >= ? AND key IN ({', '.join('?' * len(chunk))})",
+                    (min_created, *chunk),
+                ).fetchall()
+                for key, blob, created in rows:
+                    found[key] = (np.frombuffer(blob, dtype=np.float32), created)
+        return found
+
+    def put_many(self, items, created):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes(), created) for key, vector in items],
+            )
+            self._conn.commit()
+
+    def recent(self, limit, min_created=0.0):
+        """Yields up to `limit` (key, vector, created) rows, newest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, vector, created FROM embeddings WHERE created >= ? "
+                "ORDER BY created DESC LIMIT ?",
+                (min_created, limit),
+            ).fetchall()
+        for key, blob, created in rows:
+            yield key, np.frombuffer(blob, dtype=np.float32), created
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class EmbeddingCache:
+    """
+    In-process LRU cache of embeddings keyed by normalized text.
+
+    - `max_bytes` bounds the memory held by cached vectors; the least
+      recently used entries are evicted first.
+    - `ttl_seconds` (optional) expires entries after a fixed age.
+    - Concurrent requests for the same key while it is being encoded share
+      one encode ("single-flight") instead of each running the model. The
+      encode runs as its own task, so a caller that is cancelled (client
+      gone, expired Gradio event) doesn't fail the others.
+    - `store` (optional) is a PersistentStore consulted on memory misses and
+      written on every encode, so a restarted process is not cold. It is
+      read and written on the default executor, once per batch of misses.
+    - `lowercase` lower-cases the keys; only set it for uncased models.
+
+    The cache is only touched from the event loop thread, so it needs no
+    locking of its own.
+    """
+
+    def __init__(self, max_bytes, ttl_seconds=0, store=None, lowercase=False):
+        self.max_bytes = int(max_bytes)
+        self.ttl = float(ttl_seconds) or None
+        self.store = store
+        self.lowercase = lowercase
+
+        self._entries = collections.OrderedDict()  # key -> (vector, created)
+        self._inflight = {}  # key -> Future shared by concurrent callers
+        self._tasks = set()  # running _fill tasks, referenced until done
+        self.bytes_used = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+        self.persistent_hits = 0
+
+    def _entry_size(self, key, vector):
+        return vector.nbytes + len(key) + ENTRY_OVERHEAD_BYTES
+
+    def _min_created(self):
+        return time.time() - self.ttl if self.ttl else 0.0
+
+    def _insert(self, key, vector, created):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes_used -= self._entry_size(key, old[0])
+
+        self._entries[key] = (vector, created)
+        self.bytes_used += self._entry_size(key, vector)
+
+        while self.bytes_used > self.max_bytes and self._entries:
+            old_key, (old_vector, _) = self._entries.popitem(last=False)
+            self.bytes_used -= self._entry_size(old_key, old_vector)
+            self.evictions += 1
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            vector, created = entry
+            if self.ttl and created < self._min_created():
+                del self._entries[key]
+                self.bytes_used -= self._entry_size(key, vector)
+                self.expirations += 1
+            else:
+                self._entries.move_to_end(key)
+                return vector
+        return None
+
+    async def get_many(self, texts, compute):
+        """
+        Returns one vector per text, encoding only the ones not yet cached.
+
+        `compute` is an async callable that takes a list of texts and
+        returns their vectors in order. It gets the text as sent by the
+        first caller that missed on each key, not the normalized key.
+        """
+        loop = asyncio.get_running_loop()
+        keys = [normalize_text(text, self.lowercase) for text in texts]
+        results = [None] * len(keys)
+        waiting = []
+        owned = {}  # key -> text to encode for it
+
+        for i, (key, text) in enumerate(zip(keys, texts)):
+            vector = self._lookup(key)
+            if vector is not None:
+                self.hits += 1
+                results[i] = vector
+                continue
+
+            future = self._inflight.get(key)
+            if future is None:
+                future = loop.create_future()
+                self._inflight[key] = future
+                owned[key] = text
+            else:
+                self.coalesced += 1
+            waiting.append((i, future))
+
+        if owned:
+            task = asyncio.create_task(self._fill(owned, compute))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        for i, future in waiting:
+            # The future is shared with coalesced callers: this caller being
+            # cancelled must not cancel it for them.
+            results[i] = await asyncio.shield(future)
+        return results
+
+    async def _fill(self, owned, compute):
+        """Resolves the in-flight futures of `owned` from the store, then the model."""
+        loop = asyncio.get_running_loop()
+        futures = {key: self._inflight[key] for key in owned}
+        try:
+            missing = list(owned)
+            if self.store is not None:
+                try:
+                    found = await loop.run_in_executor(None, self.store.get_many, missing, self._min_created())
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to read {len(missing)} embeddings from the store: {e}")
+                    found = {}
+                for key, (vector, created) in found.items():
+                    self.hits += 1
+                    self.persistent_hits += 1
+                    self._insert(key, vector, created)
+                    futures[key].set_result(vector)
+                missing = [key for key in missing if key not in found]
+            self.misses += len(missing)
+            if not missing:
+                return
+
+            vectors = await compute([owned[key] for key in missing])
+            created = time.time()
+            stored = []
+            for key, vector in zip(missing, vectors):
+                vector = np.array(vector, dtype=np.float32)
+                vector.setflags(write=False)
+                self._insert(key, vector, created)
+                stored.append((key, vector))
+                futures[key].set_result(vector)
+
+            if self.store is not None:
+                try:
+                    await loop.run_in_executor(None, self.store.put_many, stored, created)
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to persist {len(stored)} embeddings: {e}")
+        except BaseException as e:
+            # Callers are waiting on these keys; never leave them hanging,
+            # even if this task was cancelled.
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(
+                        e if isinstance(e, Exception) else RuntimeError("Embedding request was cancelled")
+                    )
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            for key in owned:
+                self._inflight.pop(key, None)
+
+    def warm_from_store(self):
+        """Loads the newest persisted entries until the memory bound is hit."""
+        if self.store is None:
+            return 0
+
+        rows = []
+        budget = self.max_bytes - self.bytes_used
+        for key, vector, created in self.store.recent(limit=max(1, budget // 1024), min_created=self._min_created()):
+            budget -= self._entry_size(key, vector)
+            if budget < 0:
+                break
+            rows.append((key, vector, created))
+
+        # Insert oldest-first so the newest entries end up most recently used.
+        for key, vector, created in reversed(rows):
+            self._insert(key, vector, created)
+        return len(rows)
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "bytes_used": self.bytes_used,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl or 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "persistent_hits": self.persistent_hits,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "persistent_store": self.store.path if self.store is not None else None,
+        }
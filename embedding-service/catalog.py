@@ -0,0 +1,269 @@
+"""
+Exact nearest-neighbour search over the product catalog.
+
+A catalog is a set of two files:
+
+- vectors.npy: float32 matrix with one L2-normalized row per product, so a
+  dot product with a normalized query is the cosine similarity. It is
+  memory-mapped, so only the pages that are touched are read from disk and
+  several worker processes share one copy in the page cache.
+- ids.json:    list of product ids, one per row of vectors.npy.
+
+`write_catalog` writes each catalog into its own directory under
+versions/ and then points the CURRENT file at it. That single rename is the
+switch-over: a reload sees either the old pair of files or the new one,
+never new vectors with old ids. A directory holding the two files directly
+(no CURRENT) is still read as a catalog.
+
+A catalog can also carry compressed codes (see quantization.py). With a
+quantizer attached, full scans score the codes and only a shortlist is
+re-ranked against the float32 rows.
+"""
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "ids.json"
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+# Versions kept besides the current one, so a process still reading the
+# previous catalog doesn't lose its files.
+KEEP_OLD_VERSIONS = 1
+
+# Rows scored per block. Bounds the temporary score matrix to
+# (queries x ROWS_PER_BLOCK) floats no matter how large the catalog is.
+ROWS_PER_BLOCK = 65536
+
+
+def normalize_rows(vectors):
+    """Returns a float32 copy of `vectors` with every row scaled to unit length."""
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors /= norms
+    return vectors
+
+
+def top_k(scores, k):
+    """
+    Returns the (indices, scores) of the `k` largest values in every row of
+    `scores`, best first.
+
+    Uses argpartition to find the top k in linear time and only sorts those
+    k, instead of sorting the whole row.
+    """
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(scores.dtype)
+    if k < scores.shape[1]:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    vals = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-vals, axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(vals, order, axis=1)
+
+
+def blocked_top_k(n_rows, n_queries, score_block, k, rows_per_block=ROWS_PER_BLOCK):
+    """
+    Runs `score_block(start, end)` over consecutive row blocks and keeps a
+    running top `k` per query. Returns (row indices, scores), best first.
+    """
+    best_idx = np.empty((n_queries, 0), dtype=np.int64)
+    best_vals = np.empty((n_queries, 0), dtype=np.float32)
+
+    for start in range(0, n_rows, rows_per_block):
+        end = min(start + rows_per_block, n_rows)
+        idx, vals = top_k(score_block(start, end), k)
+        # Merge this block's winners with the running top k.
+        merged_idx = np.concatenate([best_idx, idx + start], axis=1)
+        merged_vals = np.concatenate([best_vals, vals], axis=1)
+        keep, best_vals = top_k(merged_vals, k)
+        best_idx = np.take_along_axis(merged_idx, keep, axis=1)
+
+    return best_idx, best_vals
+
+
+def resolve_catalog(path):
+    """The directory holding the current vectors.npy and ids.json of the catalog at `path`."""
+    try:
+        with open(os.path.join(path, CURRENT_FILE)) as f:
+            version = json.load(f)["version"]
+    except FileNotFoundError:
+        return path
+    return os.path.join(path, VERSIONS_DIR, version)
+
+
+def new_version(path):
+    """Creates and returns an empty directory for the next version of the catalog at `path`."""
+    version_dir = os.path.join(path, VERSIONS_DIR, f"v{time.time_ns()}")
+    os.makedirs(version_dir)
+    return version_dir
+
+
+def publish_version(path, version_dir):
+    """Makes `version_dir` the current catalog with one atomic rename, then prunes old versions."""
+    version = os.path.basename(version_dir)
+    current_tmp = os.path.join(path, CURRENT_FILE + ".tmp")
+    with open(current_tmp, "w") as f:
+        json.dump({"version": version}, f)
+    os.replace(current_tmp, os.path.join(path, CURRENT_FILE))
+
+    versions_dir = os.path.join(path, VERSIONS_DIR)
+    # Names are creation timestamps, so they sort oldest first.
+    older = sorted(name for name in os.listdir(versions_dir) if name < version)
+    for name in older[:max(0, len(older) - KEEP_OLD_VERSIONS)]:
+        shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+
+
+def write_catalog(path, ids, vectors):
+    """
+    Writes a new version of the catalog at `path`. Rows are normalized on
+    the way out.
+
+    Both files go into a fresh version directory that only becomes current
+    once they are complete, so a running service that reloads mid-write
+    keeps reading the previous version.
+    """
+    ids = [str(i) for i in ids]
+    vectors = normalize_rows(vectors)
+    if len(ids) != vectors.shape[0]:
+        raise ValueError(f"{len(ids)} ids for {vectors.shape[0]} vectors")
+
+    version_dir = new_version(path)
+    with open(os.path.join(version_dir, VECTORS_FILE), "wb") as f:
+        np.save(f, vectors)
+    with open(os.path.join(version_dir, IDS_FILE), "w") as f:
+        json.dump(ids, f)
+    publish_version(path, version_dir)
+
+
+class VectorCatalog:
+    """
+    Memory-mapped catalog matrix plus its product ids.
+
+    Instances are read-only once loaded. To pick up a new catalog, build a
+    new instance and swap the reference; searches already running keep
+    using the old one. `path` is the version directory that was read.
+
+    `quantizer` (optional) scores compressed codes instead of the float32
+    rows; the best `k * rerank` candidates are then re-scored exactly. With
+    `rerank=0` the approximate scores are returned as they are.
+    """
+
+    def __init__(self, path, quantizer=None, rerank=4):
+        path = resolve_catalog(path)
+        self.path = path
+        self.quantizer = quantizer
+        self.rerank = rerank
+        self.vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+        if self.vectors.ndim != 2 or self.vectors.dtype != np.float32:
+            raise ValueError(
+                f"{VECTORS_FILE} must be a 2-D float32 matrix, "
+                f"got {self.vectors.dtype} {self.vectors.shape}"
+            )
+
+        with open(os.path.join(path, IDS_FILE)) as f:
+            self.ids = json.load(f)
+        if len(self.ids) != self.vectors.shape[0]:
+            raise ValueError(f"{IDS_FILE} has {len(self.ids)} ids for {self.vectors.shape[0]} rows")
+        self.id_to_row = {product_id: row for row, product_id in enumerate(self.ids)}
+
+        # Spot-check that rows were normalized when the file was written;
+        # otherwise scores are not cosine similarities.
+        sample = np.asarray(self.vectors[: min(len(self.ids), 256)])
+        if sample.size and not np.allclose(np.linalg.norm(sample, axis=1), 1.0, atol=1e-3):
+            logger.warning(f"Catalog {path} has rows that are not unit length; scores will be off.")
+
+        logger.info(f"Loaded catalog {path}: {self.size} vectors of dim {self.dim}")
+
+    @property
+    def size(self):
+        return self.vectors.shape[0]
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    def rows_for_ids(self, ids):
+        """Maps product ids to row numbers, dropping ids that are not in the catalog."""
+        rows = [self.id_to_row[i] for i in ids if i in self.id_to_row]
+        return np.unique(np.asarray(rows, dtype=np.int64))
+
+    def score_rows(self, queries, rows, k):
+        """Exact top-k of `queries` against a subset of rows."""
+        idx, vals = top_k(queries @ self.vectors[rows].T, k)
+        return rows[idx], vals
+
+    def score_all(self, queries, k):
+        """Exact top-k of `queries` against every row, one block at a time."""
+        return blocked_top_k(
+            self.size, queries.shape[0], lambda start, end: queries @ self.vectors[start:end].T, k
+        )
+
+    def score_quantized(self, queries, k):
+        """Top-k from the compressed codes, re-ranked on the float32 rows."""
+        state = self.quantizer.prepare(queries)
+        shortlist, approx = blocked_top_k(
+            self.size,
+            queries.shape[0],
+            lambda start, end: self.quantizer.score_block(state, start, end),
+            k * max(1, self.rerank),
+        )
+        if not self.rerank:
+            return shortlist, approx
+
+        best_idx, best_vals = [], []
+        for query, rows in zip(queries, shortlist):
+            # Sorted rows turn the memmap reads into one forward pass.
+            rows = np.sort(rows)
+            idx, vals = top_k((self.vectors[rows] @ query)[None, :], k)
+            best_idx.append(rows[idx[0]])
+            best_vals.append(vals[0])
+        return np.array(best_idx), np.array(best_vals)
+
+    def memory_stats(self):
+        """Bytes needed for the float32 matrix vs the compressed codes."""
+        float_bytes = self.vectors.size * self.vectors.itemsize
+        stats = {"size": self.size, "dim": self.dim, "float32_bytes": float_bytes, "quantization": None}
+        if self.quantizer is not None:
+            code_bytes = self.quantizer.nbytes
+            stats.update({
+                "quantization": self.quantizer.kind,
+                "code_bytes": code_bytes,
+                "compression_ratio": round(float_bytes / code_bytes, 1) if code_bytes else None,
+                "bytes_saved": float_bytes - code_bytes,
+                "rerank": self.rerank,
+            })
+        return stats
+
+    def search(self, queries, k=10, allowed_ids=None):
+        """
+        Returns, for every query vector, a list of (product id, score) pairs
+        for the `k` most similar products, best first.
+
+        If `allowed_ids` is given, only those products are considered.
+        """
+        queries = normalize_rows(queries)
+        if queries.shape[1] != self.dim:
+            raise ValueError(f"Query dim {queries.shape[1]} does not match catalog dim {self.dim}")
+
+        if allowed_ids is not None:
+            idx, vals = self.score_rows(queries, self.rows_for_ids(allowed_ids), k)
+        elif self.quantizer is not None:
+            idx, vals = self.score_quantized(queries, k)
+        else:
+            idx, vals = self.score_all(queries, k)
+
+        return [
+            [(self.ids[row], float(score)) for row, score in zip(row_idx, row_vals)]
+            for row_idx, row_vals in zip(idx, vals)
+        ]
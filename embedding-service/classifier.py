@@ -0,0 +1,248 @@
+"""
+Zero-shot tagging of product texts against a label taxonomy.
+
+Every label is embedded once (averaged over its synonyms, through a
+per-facet prompt template) into one normalized matrix. Classifying a batch
+of texts is then a single matrix multiply against that matrix, followed by
+a temperature softmax per facet. The temperature turns cosine similarities
+into probabilities that can be thresholded: results whose best probability
+is under the facet's `min_confidence` are flagged as not confident, and only
+those need the slower external LLM.
+
+The taxonomy is JSON, keyed by facet:
+
+    {
+      "category": {
+        "template": "{label}",
+        "labels": {"Kurta": ["kurta", "kurti"], "Lehenga": ["lehenga choli"]},
+        "temperature": 0.03,
+        "min_confidence": 0.5
+      }
+    }
+
+"labels" may also be a plain list. Temperatures are fitted on labelled
+examples (JSON lines of {"text": ..., "<facet>": "<label>"}) with:
+
+    python classifier.py calibrate --data labelled.jsonl --out taxonomy.json
+"""
+import argparse
+import copy
+import json
+import logging
+import os
+
+import numpy as np
+
+from catalog import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPERATURE = 0.05
+DEFAULT_MIN_CONFIDENCE = 0.5
+
+DEFAULT_TAXONOMY = {
+    "category": {
+        "template": "{label}",
+        "labels": {
+            "Kurta": ["kurta", "kurti", "straight kurta"],
+            "Lehenga": ["lehenga", "lehenga choli"],
+            "Co-ord set": ["co-ord set", "matching top and trousers set"],
+            "Skirt": ["skirt", "maxi skirt", "mini skirt"],
+            "Saree": ["saree", "sari"],
+            "Dress": ["dress", "maxi dress", "midi dress"],
+            "Top": ["top", "blouse", "crop top"],
+            "Shirt": ["shirt", "button-down shirt"],
+            "T-shirt": ["t-shirt", "tee"],
+            "Jeans": ["jeans", "denim jeans"],
+            "Trousers": ["trousers", "chinos", "pants"],
+            "Jacket": ["jacket", "blazer", "coat"],
+            "Dupatta": ["dupatta", "stole"],
+            "Footwear": ["heels", "sandals", "sneakers", "juttis"],
+            "Jewellery": ["earrings", "jhumka", "necklace", "bangles"],
+            "Bag": ["handbag", "sling bag", "clutch"],
+            "Home decor": ["lamp", "wall hanging", "cushion cover", "vase"],
+        },
+    },
+    "colour": {
+        "template": "{label} coloured clothing",
+        "labels": {
+            "Black": ["black"],
+            "White": ["white", "off-white"],
+            "Cream": ["cream", "beige", "ivory"],
+            "Red": ["red", "maroon"],
+            "Pink": ["pink", "peach"],
+            "Orange": ["orange", "rust"],
+            "Yellow": ["yellow", "mustard"],
+            "Green": ["green", "olive"],
+            "Blue": ["blue", "navy blue"],
+            "Purple": ["purple", "lavender"],
+            "Brown": ["brown", "tan"],
+            "Grey": ["grey", "charcoal"],
+            "Gold": ["gold", "gold-toned"],
+            "Silver": ["silver", "silver-toned"],
+            "Multicolour": ["multicoloured", "printed multicolour"],
+        },
+    },
+    "occasion": {
+        "template": "outfit for {label}",
+        "labels": {
+            "Casual": ["casual everyday wear", "daily wear"],
+            "Office": ["office wear", "work"],
+            "Party": ["party wear", "a night out"],
+            "Wedding": ["a wedding", "bridal wear"],
+            "Festive": ["festive wear", "Diwali", "a festival"],
+            "Vacation": ["a beach vacation", "holiday travel"],
+            "Sports": ["the gym", "sports and workout"],
+        },
+    },
+}
+
+
+def load_taxonomy(path=None):
+    """Reads a taxonomy JSON file, or returns a copy of DEFAULT_TAXONOMY."""
+    if not path:
+        return copy.deepcopy(DEFAULT_TAXONOMY)
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _label_prompts(facet):
+    labels = facet["labels"]
+    if isinstance(labels, list):
+        labels = {label: [label] for label in labels}
+    template = facet.get("template", "{label}")
+    return {label: [template.format(label=synonym) for synonym in synonyms or [label]] for label, synonyms in labels.items()}
+
+
+def _softmax(scores, temperature):
+    logits = scores / temperature
+    logits -= logits.max(axis=1, keepdims=True)
+    probabilities = np.exp(logits)
+    probabilities /= probabilities.sum(axis=1, keepdims=True)
+    return probabilities
+
+
+class LabelClassifier:
+    """
+    Holds the normalized label matrix of every facet, stacked into one
+    (labels x dim) array, and the slice of rows that belongs to each facet.
+    """
+
+    def __init__(self, taxonomy, label_vectors):
+        self.taxonomy = taxonomy
+        self.facets = {}
+        self.labels = []
+        start = 0
+        for name, facet in taxonomy.items():
+            labels = list(_label_prompts(facet))
+            self.facets[name] = (start, start + len(labels))
+            self.labels.extend(labels)
+            start += len(labels)
+        if label_vectors.shape[0] != len(self.labels):
+            raise ValueError(f"{label_vectors.shape[0]} label vectors for {len(self.labels)} labels")
+        self.label_vectors = normalize_rows(label_vectors)
+
+    @staticmethod
+    def prompts(taxonomy):
+        """Every prompt to embed, and for each label the range of its prompts."""
+        texts, ranges = [], []
+        for facet in taxonomy.values():
+            for prompts in _label_prompts(facet).values():
+                ranges.append((len(texts), len(texts) + len(prompts)))
+                texts.extend(prompts)
+        return texts, ranges
+
+    @classmethod
+    def from_prompt_vectors(cls, taxonomy, prompt_vectors):
+        """Averages the prompt embeddings of every label into its prototype."""
+        _, ranges = cls.prompts(taxonomy)
+        prototypes = np.stack([np.asarray(prompt_vectors[start:end]).mean(axis=0) for start, end in ranges])
+        return cls(taxonomy, prototypes)
+
+    @classmethod
+    def build(cls, taxonomy, encode):
+        """`encode(texts)` returns one embedding row per text."""
+        texts, _ = cls.prompts(taxonomy)
+        return cls.from_prompt_vectors(taxonomy, encode(texts))
+
+    def scores(self, vectors):
+        """Cosine similarity of every vector against every label: one matrix multiply."""
+        return normalize_rows(vectors) @ self.label_vectors.T
+
+    def classify(self, vectors, k=3, facets=None):
+        """
+        Returns, per vector, {facet: {"labels": [(label, probability)], "confident": bool}}
+        with the `k` most likely labels of every facet, best first.
+        """
+        scores = self.scores(vectors)
+        results = [{} for _ in range(scores.shape[0])]
+        for name in facets or self.facets:
+            start, end = self.facets[name]
+            facet = self.taxonomy[name]
+            probabilities = _softmax(scores[:, start:end], facet.get("temperature", DEFAULT_TEMPERATURE))
+            order = np.argsort(-probabilities, axis=1)[:, :k]
+            threshold = facet.get("min_confidence", DEFAULT_MIN_CONFIDENCE)
+            for result, row, best in zip(results, probabilities, order):
+                result[name] = {
+                    "labels": [(self.labels[start + j], float(row[j])) for j in best],
+                    "confident": bool(row[best[0]] >= threshold),
+                }
+        return results
+
+    def fit_temperature(self, name, vectors, gold_labels, grid=None):
+        """
+        Picks the temperature of facet `name` that minimizes the negative
+        log-likelihood of the gold labels, and stores it in the taxonomy.
+        """
+        start, end = self.facets[name]
+        facet_labels = self.labels[start:end]
+        gold = np.array([facet_labels.index(label) for label in gold_labels])
+        scores = self.scores(vectors)[:, start:end]
+        grid = np.geomspace(0.005, 1.0, 60) if grid is None else grid
+
+        def nll(temperature):
+            probabilities = _softmax(scores, temperature)
+            return -np.log(np.maximum(probabilities[np.arange(len(gold)), gold], 1e-12)).mean()
+
+        losses = [nll(t) for t in grid]
+        best = float(grid[int(np.argmin(losses))])
+        self.taxonomy[name]["temperature"] = round(best, 5)
+        accuracy = float((scores.argmax(axis=1) == gold).mean())
+        return {"temperature": best, "nll": float(min(losses)), "accuracy": accuracy, "examples": len(gold)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    calibrate = sub.add_parser("calibrate")
+    calibrate.add_argument("--data", required=True, help="JSON lines with a text and gold labels per facet")
+    calibrate.add_argument("--taxonomy", default=None, help="Taxonomy JSON (default: the built-in one)")
+    calibrate.add_argument("--out", default="taxonomy.json")
+    calibrate.add_argument("--model", default=os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2"))
+    args = parser.parse_args()
+
+    from encoders import load_encoder
+
+    logging.basicConfig(level=logging.INFO)
+    encoder = load_encoder("torch", args.model)
+    taxonomy = load_taxonomy(args.taxonomy)
+    classifier = LabelClassifier.build(taxonomy, encoder.encode)
+
+    with open(args.data, encoding="utf-8") as f:
+        examples = [json.loads(line) for line in f if line.strip()]
+    for name in classifier.facets:
+        start, end = classifier.facets[name]
+        labelled = [e for e in examples if e.get(name) in classifier.labels[start:end]]
+        if not labelled:
+            logger.info(f"No examples for facet '{name}', keeping its temperature")
+            continue
+        vectors = encoder.encode([e["text"] for e in labelled])
+        logger.info(f"Facet '{name}': {classifier.fit_temperature(name, vectors, [e[name] for e in labelled])}")
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(taxonomy, f, indent=2)
+    logger.info(f"Wrote calibrated taxonomy to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
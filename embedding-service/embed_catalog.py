@@ -0,0 +1,247 @@
+"""
+Offline bulk embedding of the product catalog.
+
+Replaces one-POST-per-product backfills with a local batch job:
+
+    python embed_catalog.py products.jsonl --out embeddings
+    python embed_catalog.py products.csv --out embeddings --export-catalog catalog
+
+Input is JSONL (e.g. `mongoexport --collection myntra`) or CSV. The id and text
+columns are picked with --id-field / --text-field. Mongo's {"$oid": ...}
+ids are unwrapped.
+
+Output directory layout:
+
+- shard_NNNNN.npy       float32 (rows, dim) matrix, memory-mappable
+- shard_NNNNN.ids.json  [[product id, content hash], ...] for each row
+- manifest.json         model name, dim and the list of finished shards
+
+A shard is only added to the manifest once both of its files are fully
+written. Re-running the command therefore resumes after the last finished
+shard. Products whose text hash is unchanged are skipped, so a rerun after
+a catalog update only embeds new and edited products.
+
+--export-catalog writes the latest vector of every product in the input as a
+catalog directory for the service's /search (see catalog.py). It streams the
+shards into a memory-mapped output, so it never holds the whole matrix in RAM.
+"""
+import argparse
+import csv
+import hashlib
+import inspect
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from catalog import IDS_FILE, VECTORS_FILE, new_version, normalize_rows, publish_version
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+
+
+def _unwrap_id(value):
+    if isinstance(value, dict) and "$oid" in value:
+        return value["$oid"]
+    return str(value)
+
+
+def read_products(path, id_field, text_field):
+    """Yields (product id, text) pairs from a JSONL or CSV file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            product_id, text = row.get(id_field), row.get(text_field)
+            if product_id is None or not text or not str(text).strip():
+                continue
+            yield _unwrap_id(product_id), str(text)
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _write_json_atomic(path, payload):
+    with open(path + ".tmp", "w") as f:
+        json.dump(payload, f)
+    os.replace(path + ".tmp", path)
+
+
+def load_manifest(out_dir, model_name):
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"model": model_name, "dim": None, "shards": []}
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest["model"] != model_name:
+        raise SystemExit(
+            f"{out_dir} holds embeddings from '{manifest['model']}', not '{model_name}'. "
+            "Use a different --out directory."
+        )
+    return manifest
+
+
+def iter_shard_rows(out_dir, manifest):
+    """Yields (shard number, ids-and-hashes) for every finished shard, in order."""
+    for shard_no, shard in enumerate(manifest["shards"]):
+        with open(os.path.join(out_dir, shard["ids"])) as f:
+            yield shard_no, json.load(f)
+
+
+def embedded_hashes(out_dir, manifest):
+    """Maps every product id in the finished shards to its latest content hash."""
+    latest = {}
+    for _, rows in iter_shard_rows(out_dir, manifest):
+        for product_id, digest in rows:
+            latest[product_id] = digest
+    return latest
+
+
+def token_lengths(model, texts, chunk=4096):
+    """Token count of every text, computed with the model's own tokenizer."""
+    lengths = np.empty(len(texts), dtype=np.int32)
+    for start in range(0, len(texts), chunk):
+        encoded = model.tokenizer(texts[start:start + chunk], add_special_tokens=False)["input_ids"]
+        lengths[start:start + chunk] = [len(ids) for ids in encoded]
+    return lengths
+
+
+def write_shard(out_dir, manifest, shard_rows, vectors):
+    shard_no = len(manifest["shards"])
+    vectors_name = f"shard_{shard_no:05d}.npy"
+    ids_name = f"shard_{shard_no:05d}.ids.json"
+
+    with open(os.path.join(out_dir, vectors_name + ".tmp"), "wb") as f:
+        np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+    os.replace(os.path.join(out_dir, vectors_name + ".tmp"), os.path.join(out_dir, vectors_name))
+    _write_json_atomic(os.path.join(out_dir, ids_name), shard_rows)
+
+    # The manifest is written last: a shard only counts once it is listed.
+    manifest["dim"] = int(vectors.shape[1])
+    manifest["shards"].append({"vectors": vectors_name, "ids": ids_name, "count": len(shard_rows)})
+    _write_json_atomic(os.path.join(out_dir, MANIFEST_FILE), manifest)
+
+
+def export_catalog(out_dir, manifest, product_ids, catalog_dir):
+    """
+    Writes the newest vector of every id in `product_ids` to a catalog
+    directory, reading one shard at a time.
+    """
+    latest = {}
+    for shard_no, rows in iter_shard_rows(out_dir, manifest):
+        for row, (product_id, _) in enumerate(rows):
+            latest[product_id] = (shard_no, row)
+
+    ids = [product_id for product_id in product_ids if product_id in latest]
+    version_dir = new_version(catalog_dir)
+    out = np.lib.format.open_memmap(
+        os.path.join(version_dir, VECTORS_FILE), mode="w+", dtype=np.float32, shape=(len(ids), manifest["dim"])
+    )
+
+    # Group destination rows by source shard so each shard is read once.
+    by_shard = {}
+    for dest, product_id in enumerate(ids):
+        shard_no, row = latest[product_id]
+        by_shard.setdefault(shard_no, ([], []))
+        by_shard[shard_no][0].append(row)
+        by_shard[shard_no][1].append(dest)
+
+    for shard_no, (rows, dests) in sorted(by_shard.items()):
+        shard = np.load(os.path.join(out_dir, manifest["shards"][shard_no]["vectors"]), mmap_mode="r")
+        out[np.asarray(dests)] = normalize_rows(shard[np.asarray(rows)])
+
+    out.flush()
+    del out
+    with open(os.path.join(version_dir, IDS_FILE), "w") as f:
+        json.dump(ids, f)
+    publish_version(catalog_dir, version_dir)
+    logger.info(f"Exported {len(ids)} vectors to catalog {catalog_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Products as .jsonl or .csv")
+    parser.add_argument("--out", default="embeddings", help="Shard output directory")
+    parser.add_argument("--model", default=os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2"))
+    parser.add_argument("--id-field", default="_id")
+    parser.add_argument("--text-field", default="description")
+    parser.add_argument("--shard-size", type=int, default=50000, help="Products per shard (checkpoint interval)")
+    parser.add_argument("--batch-size", type=int, default=256, help="Texts per forward pass")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Encoder processes. Each gets cpu_count/workers torch threads.",
+    )
+    parser.add_argument("--export-catalog", default=None, help="Also write a catalog directory for /search")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    os.makedirs(args.out, exist_ok=True)
+    manifest = load_manifest(args.out, args.model)
+
+    products = dict(read_products(args.input, args.id_field, args.text_field))
+    hashes = {product_id: content_hash(text) for product_id, text in products.items()}
+    done = embedded_hashes(args.out, manifest)
+    todo = [product_id for product_id, digest in hashes.items() if done.get(product_id) != digest]
+    logger.info(
+        f"{len(products)} products in {args.input}, {len(products) - len(todo)} up to date, "
+        f"{len(todo)} to embed"
+    )
+
+    if todo:
+        cores = os.cpu_count() or 1
+        workers = max(1, args.workers)
+        # Split the cores between worker processes instead of letting every
+        # process start one thread per core. Must be set before torch loads.
+        os.environ.setdefault("OMP_NUM_THREADS", str(max(1, cores // workers)))
+
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        torch.set_num_threads(max(1, cores // workers))
+        model = SentenceTransformer(args.model)
+
+        # Sorting by token length puts texts of similar length in the same
+        # batch, so almost no forward-pass work is spent on padding.
+        texts = [products[product_id] for product_id in todo]
+        order = np.argsort(token_lengths(model, texts), kind="stable")
+        todo = [todo[i] for i in order]
+
+        pool = model.start_multi_process_pool(["cpu"] * workers) if workers > 1 else None
+        try:
+            for start in range(0, len(todo), args.shard_size):
+                shard_ids = todo[start:start + args.shard_size]
+                shard_texts = [products[product_id] for product_id in shard_ids]
+                started = time.perf_counter()
+                if pool is None:
+                    vectors = model.encode(shard_texts, batch_size=args.batch_size)
+                elif "pool" in inspect.signature(model.encode).parameters:
+                    vectors = model.encode(shard_texts, batch_size=args.batch_size, pool=pool)
+                else:
+                    # sentence-transformers < 5 only has the separate method.
+                    vectors = model.encode_multi_process(shard_texts, pool, batch_size=args.batch_size)
+                elapsed = time.perf_counter() - started
+
+                write_shard(args.out, manifest, [[i, hashes[i]] for i in shard_ids], vectors)
+                logger.info(
+                    f"Shard {len(manifest['shards']) - 1}: {len(shard_ids)} texts in {elapsed:.1f}s "
+                    f"({len(shard_ids) / elapsed:.0f} texts/s), "
+                    f"{min(start + args.shard_size, len(todo))}/{len(todo)} done"
+                )
+        finally:
+            if pool is not None:
+                model.stop_multi_process_pool(pool)
+
+    if args.export_catalog:
+        if not manifest["shards"]:
+            raise SystemExit("Nothing has been embedded yet, cannot export a catalog.")
+        export_catalog(args.out, manifest, list(products), args.export_catalog)
+
+
+if __name__ == "__main__":
+    main()
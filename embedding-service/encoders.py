@@ -0,0 +1,291 @@
+"""
+Encoder backends for the embedding service.
+
+Every encoder exposes the same three methods:
+
+- tokenize(texts) -> model inputs
+- forward(inputs) -> float32 NumPy array, one unit-length row per text
+- encode(texts)   -> forward(tokenize(texts))
+
+Backends:
+
+- "torch":     the SentenceTransformer model on eager PyTorch.
+- "onnx":      the same transformer exported to ONNX and run with ONNX
+               Runtime. Mean pooling and L2 normalization are done in NumPy
+               exactly as the SentenceTransformer Pooling/Normalize modules
+               do them.
+- "onnx-int8": the ONNX export with dynamic int8 quantization of the
+               weights (onnxruntime.quantization.quantize_dynamic).
+
+Export once (the service also exports on first start if the files are
+missing):
+
+    python encoders.py export --out onnx_model --quantize
+"""
+import argparse
+import copy
+import inspect
+import json
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+CONFIG_FILE = "encoder_config.json"
+
+
+class TorchEncoder:
+    name = "torch"
+
+    def __init__(self, model):
+        self.model = model
+        self.dim = model.get_sentence_embedding_dimension()
+
+    @classmethod
+    def load(cls, model_name_or_path):
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(model_name_or_path, device="cpu")
+        model.eval()
+        return cls(model)
+
+    def clone(self):
+        return TorchEncoder(copy.deepcopy(self.model))
+
+    def tokenize(self, texts):
+        # Newer sentence-transformers releases renamed tokenize to preprocess.
+        tokenize = getattr(self.model, "preprocess", self.model.tokenize)
+        return tokenize(list(texts))
+
+    def forward(self, features):
+        import torch
+
+        with torch.inference_mode():
+            # Runs Transformer -> Pooling -> Normalize, same as model.encode.
+            output = self.model(features)["sentence_embedding"]
+        return output.float().cpu().numpy()
+
+    def encode(self, texts):
+        return self.forward(self.tokenize(texts))
+
+
+class OnnxEncoder:
+    def __init__(self, model_dir, quantized=False, threads=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, CONFIG_FILE)) as f:
+            self.config = json.load(f)
+        self.model_dir = model_dir
+        self.quantized = quantized
+        self.threads = threads
+        self.name = "onnx-int8" if quantized else "onnx"
+        self.dim = self.config["dim"]
+        self.max_seq_length = self.config["max_seq_length"]
+        self.normalize = self.config["normalize"]
+        self.do_lower_case = self.config.get("do_lower_case", False)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        path = os.path.join(model_dir, ONNX_INT8_FILE if quantized else ONNX_FILE)
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def clone(self):
+        return OnnxEncoder(self.model_dir, quantized=self.quantized, threads=self.threads)
+
+    def tokenize(self, texts):
+        # Same preprocessing as sentence_transformers.models.Transformer.
+        texts = [str(text).strip() for text in texts]
+        if self.do_lower_case:
+            texts = [text.lower() for text in texts]
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation="longest_first",
+            max_length=self.max_seq_length,
+            return_tensors="np",
+        )
+        return {name: value.astype(np.int64) for name, value in encoded.items() if name in self.input_names}
+
+    def forward(self, features):
+        token_embeddings = self.session.run(["last_hidden_state"], features)[0]
+
+        # Mean pooling over real (non-padding) tokens, as in models.Pooling.
+        mask = features["attention_mask"][:, :, None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        embeddings = summed / counts
+
+        if self.normalize:
+            # torch.nn.functional.normalize(p=2, dim=1) uses eps=1e-12.
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.maximum(norms, 1e-12)
+        return embeddings.astype(np.float32)
+
+    def encode(self, texts):
+        return self.forward(self.tokenize(texts))
+
+
+def export_onnx(model_name_or_path, out_dir, quantize=True):
+    """
+    Exports the transformer of a SentenceTransformer model to ONNX, writes
+    the tokenizer and pooling settings next to it and optionally a
+    dynamically int8-quantized copy.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st_model = SentenceTransformer(model_name_or_path, device="cpu")
+    # Matched by class name: the module paths moved between
+    # sentence-transformers releases.
+    modules = {type(module).__name__: module for module in st_model}
+    transformer = st_model[0]
+    pooling = modules.get("Pooling")
+    if type(transformer).__name__ != "Transformer" or pooling is None:
+        raise ValueError("Only Transformer + Pooling sentence-transformer models can be exported")
+    pooling_mode = pooling.get_pooling_mode_str() if hasattr(pooling, "get_pooling_mode_str") else pooling.pooling_mode
+    if pooling_mode != "mean":
+        raise ValueError(f"Only mean pooling is supported, model uses '{pooling_mode}'")
+
+    os.makedirs(out_dir, exist_ok=True)
+    transformer.tokenizer.save_pretrained(out_dir)
+    config = {
+        "source_model": str(model_name_or_path),
+        "dim": st_model.get_sentence_embedding_dimension(),
+        "max_seq_length": transformer.max_seq_length,
+        "do_lower_case": bool(getattr(transformer, "do_lower_case", False)),
+        "normalize": "Normalize" in modules,
+    }
+    with open(os.path.join(out_dir, CONFIG_FILE), "w") as f:
+        json.dump(config, f, indent=2)
+
+    class LastHiddenState(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.auto_model(
+                input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+            ).last_hidden_state
+
+    sample = transformer.tokenizer(["a sample sentence"], return_tensors="pt")
+    inputs = (sample["input_ids"], sample["attention_mask"], sample.get("token_type_ids", torch.zeros_like(sample["input_ids"])))
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # The TorchScript-based exporter handles dynamic_axes without extra deps.
+        export_kwargs["dynamo"] = False
+    wrapper = LastHiddenState(transformer.auto_model).eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper,
+            inputs,
+            os.path.join(out_dir, ONNX_FILE),
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+            do_constant_folding=True,
+            **export_kwargs,
+        )
+    logger.info(f"Exported {model_name_or_path} to {os.path.join(out_dir, ONNX_FILE)}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(
+            os.path.join(out_dir, ONNX_FILE),
+            os.path.join(out_dir, ONNX_INT8_FILE),
+            weight_type=QuantType.QInt8,
+        )
+        logger.info(f"Wrote int8 model to {os.path.join(out_dir, ONNX_INT8_FILE)}")
+
+
+def resolve_local_model(name_or_path):
+    """
+    Returns a local directory for the model without touching the network:
+    either `name_or_path` itself or its snapshot in the Hugging Face cache.
+    """
+    if os.path.isdir(name_or_path):
+        return name_or_path
+
+    from huggingface_hub import snapshot_download
+
+    candidates = [name_or_path]
+    if "/" not in name_or_path:
+        # Short names like "all-MiniLM-L6-v2" live under the
+        # sentence-transformers organisation.
+        candidates.append(f"sentence-transformers/{name_or_path}")
+    for repo_id in candidates:
+        try:
+            return snapshot_download(repo_id, local_files_only=True)
+        except Exception:
+            continue
+    raise FileNotFoundError(
+        f"Model '{name_or_path}' is not a local directory and is not in the Hugging Face cache. "
+        f"Download it once and point EMBEDDING_MODEL at the directory."
+    )
+
+
+def is_uncased(encoder):
+    """True if the encoder's tokenizer lower-cases its input, so case never changes an embedding."""
+    upper, lower = encoder.tokenize(["Hello World"]), encoder.tokenize(["hello world"])
+    return np.array_equal(np.asarray(upper["input_ids"]), np.asarray(lower["input_ids"]))
+
+
+def import_backend(backend):
+    """Imports the runtime libraries of a backend, so their cost can be timed on its own."""
+    import torch
+    import transformers
+
+    if backend == "torch":
+        import sentence_transformers
+    else:
+        import onnxruntime
+
+
+def load_encoder(backend, model_name_or_path, onnx_dir="onnx_model", threads=None):
+    """Builds the encoder for `backend`, exporting to ONNX first if needed."""
+    if backend == "torch":
+        return TorchEncoder.load(model_name_or_path)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown encoder backend '{backend}', expected one of {BACKENDS}")
+
+    quantized = backend == "onnx-int8"
+    wanted = os.path.join(onnx_dir, ONNX_INT8_FILE if quantized else ONNX_FILE)
+    if not os.path.exists(wanted) or not os.path.exists(os.path.join(onnx_dir, CONFIG_FILE)):
+        logger.info(f"{wanted} not found, exporting {model_name_or_path} to ONNX...")
+        export_onnx(model_name_or_path, onnx_dir, quantize=quantized)
+    return OnnxEncoder(onnx_dir, quantized=quantized, threads=threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export")
+    export.add_argument("--model", default=os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2"))
+    export.add_argument("--out", default="onnx_model")
+    export.add_argument("--quantize", action="store_true", help="Also write a dynamic int8 model")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    export_onnx(args.model, args.out, quantize=args.quantize)
+
+
+if __name__ == "__main__":
+    main()
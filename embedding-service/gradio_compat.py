@@ -0,0 +1,56 @@
+"""
+Server side of the two-step Gradio call protocol used by the backend
+controllers:
+
+    POST /gradio_api/call/generate_embedding  {"data": [text]} -> {"event_id": ...}
+    GET  /gradio_api/call/generate_embedding/{event_id}
+         -> "event: complete\\ndata: [{\\"text\\": ..., \\"vector\\": [...]}]\\n\\n"
+
+The embedding starts as soon as the POST arrives, so it runs while the
+client makes its second round trip. Results nobody collects are dropped
+after `ttl_seconds`.
+"""
+import asyncio
+import time
+import uuid
+
+from inference import Overloaded
+
+
+def _consume_exception(task):
+    # Keeps asyncio from logging errors of results that were never fetched.
+    if not task.cancelled():
+        task.exception()
+
+
+class EventStore:
+    def __init__(self, ttl_seconds=60.0, max_events=1024):
+        self.ttl = ttl_seconds
+        self.max_events = max_events
+        self._events = {}
+
+    def add(self, coroutine):
+        """Starts `coroutine` and returns the event id its result is stored under."""
+        self._expire()
+        if len(self._events) >= self.max_events:
+            coroutine.close()
+            raise Overloaded(f"{len(self._events)} Gradio events are waiting to be fetched")
+        event_id = uuid.uuid4().hex
+        task = asyncio.create_task(coroutine)
+        task.add_done_callback(_consume_exception)
+        self._events[event_id] = (task, time.monotonic())
+        return event_id
+
+    async def pop(self, event_id):
+        """Waits for and returns the result of an event. Raises KeyError for unknown ids."""
+        task, _ = self._events.pop(event_id)
+        return await task
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for event_id in [key for key, (_, created) in self._events.items() if created < cutoff]:
+            task, _ = self._events.pop(event_id)
+            task.cancel()
+
+    def __len__(self):
+        return len(self._events)
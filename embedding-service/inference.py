@@ -0,0 +1,159 @@
+"""
+Dedicated inference threads for the embedding model.
+
+Each replica is one thread that owns one model instance and a fixed number
+of torch intra-op threads, so replicas don't fight each other for cores.
+Work goes through one bounded queue: when it is full, `submit` raises
+`Overloaded` immediately instead of letting latency grow without limit, and
+the API turns that into 503 + Retry-After.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import os
+import queue
+import threading
+import time
+
+from metrics import BATCH_SIZE, STAGE_SECONDS, TEXTS_ENCODED
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class Overloaded(Exception):
+    """Raised when the service cannot accept more work right now."""
+
+
+class InferencePool:
+    """
+    `load_replica(i)` is called once per replica, on that replica's own
+    thread, and must return an encoder with `tokenize(texts)` and
+    `forward(features)` methods (see encoders.py).
+    """
+
+    def __init__(self, load_replica, replicas=1, threads_per_replica=None, max_queue=64):
+        self.replicas = max(1, int(replicas))
+        self.threads_per_replica = threads_per_replica or max(1, (os.cpu_count() or 1) // self.replicas)
+        self.max_queue = max(1, int(max_queue))
+        self._load_replica = load_replica
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._threads = []
+        self._ready = threading.Barrier(self.replicas + 1)
+        self._load_errors = []
+        self._counter_lock = threading.Lock()
+
+        self.busy = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        for i in range(self.replicas):
+            thread = threading.Thread(target=self._worker, args=(i,), name=f"inference-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        # Wait until every replica has its model, so the first requests
+        # don't pay for loading.
+        self._ready.wait()
+        if self._load_errors:
+            self.stop()
+            raise RuntimeError(f"Failed to load inference replica: {self._load_errors[0]}")
+        logger.info(
+            f"Inference pool started: {self.replicas} replica(s) x "
+            f"{self.threads_per_replica} torch thread(s), queue size {self.max_queue}"
+        )
+
+    def stop(self):
+        alive = [thread for thread in self._threads if thread.is_alive()]
+        for _ in alive:
+            self._queue.put(_STOP)
+        for thread in alive:
+            thread.join()
+        self._threads = []
+
+    def _count(self, name, delta=1):
+        with self._counter_lock:
+            setattr(self, name, getattr(self, name) + delta)
+
+    def _worker(self, index):
+        import torch
+
+        # Set per thread: each replica keeps to its own share of the cores.
+        torch.set_num_threads(self.threads_per_replica)
+        try:
+            replica = self._load_replica(index)
+        except Exception as e:
+            logger.error(f"Replica {index} failed to load: {e}")
+            self._load_errors.append(e)
+            replica = None
+        self._ready.wait()
+        if replica is None:
+            return
+
+        while True:
+            job = self._queue.get()
+            if job is _STOP:
+                return
+            fn, future, enqueued_at = job
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            STAGE_SECONDS.observe(time.perf_counter() - enqueued_at, stage="queue_wait")
+            self._count("busy")
+            try:
+                future.set_result(fn(replica))
+                self._count("completed")
+            except Exception as e:
+                self._count("failed")
+                future.set_exception(e)
+            finally:
+                self._count("busy", -1)
+
+    @staticmethod
+    def encode_on(replica, texts):
+        """Tokenizes and runs one batch on `replica`, timing each stage."""
+        started = time.perf_counter()
+        features = replica.tokenize(texts)
+        tokenized = time.perf_counter()
+        vectors = replica.forward(features)
+        STAGE_SECONDS.observe(tokenized - started, stage="tokenize")
+        STAGE_SECONDS.observe(time.perf_counter() - tokenized, stage="forward")
+        BATCH_SIZE.observe(len(texts))
+        TEXTS_ENCODED.inc(len(texts))
+        return vectors
+
+    def submit(self, texts):
+        """Queues a batch of texts. Raises Overloaded if the queue is full."""
+        return self.call(lambda replica: self.encode_on(replica, texts))
+
+    def call(self, fn):
+        """
+        Queues `fn(replica)` to run on the next free replica thread and
+        returns a Future. Raises Overloaded if the queue is full.
+        """
+        future = concurrent.futures.Future()
+        try:
+            self._queue.put_nowait((fn, future, time.perf_counter()))
+        except queue.Full:
+            self._count("rejected")
+            raise Overloaded(f"Inference queue is full ({self.max_queue} batches waiting)")
+        return future
+
+    async def encode(self, texts):
+        """Async wrapper: the event loop waits on the result without blocking."""
+        return await asyncio.wrap_future(self.submit(texts))
+
+    def stats(self):
+        return {
+            "replicas": self.replicas,
+            "threads_per_replica": self.threads_per_replica,
+            "queue_depth": self._queue.qsize(),
+            "max_queue": self.max_queue,
+            "busy": self.busy,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
@@ -1,13 +1,303 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+import asyncio
 import logging
+import os
+import random
+import time
+
+import numpy as np
+
+from batching import MicroBatcher
+from cache import EmbeddingCache, PersistentStore
+from ann import IVFIndex
+from catalog import VectorCatalog
+from classifier import LabelClassifier, load_taxonomy
+from encoders import import_backend, is_uncased, load_encoder, resolve_local_model
+from inference import InferencePool, Overloaded
+import metrics
+from metrics import ERRORS, REQUEST_SECONDS, STAGE_SECONDS
+from profiling import run_profiled
+from quantization import load_quantizer
+from similar import SimilarityGraph
+from gradio_compat import EventStore
+from serialization import encode_json, encode_sse, encode_vectors
+from startup import ModelLoader, sample_texts, warm_up
 
 # Setup basic logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# --- 1. Initialize FastAPI App ---
+# The model is only ever read from local files: a directory, or a snapshot
+# already in the Hugging Face cache. No hub lookups at startup.
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+# --- Configuration ---
+# All tunables come from environment variables so the same image can be
+# deployed with different settings.
+# Local model directory (or the name of a model in the local HF cache).
+MODEL_NAME = os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# Load the model after the server is up (1) or before it accepts requests (0).
+LOAD_IN_BACKGROUND = os.environ.get("EMBED_LOAD_IN_BACKGROUND", "1") != "0"
+# Runtime that executes the model: "torch", "onnx" or "onnx-int8" (see
+# encoders.py). ONNX files are exported into EMBED_ONNX_DIR on first start.
+ENCODER_BACKEND = os.environ.get("EMBED_BACKEND", "torch")
+ONNX_DIR = os.environ.get("EMBED_ONNX_DIR", "onnx_model")
+# Set EMBED_BATCHING=0 to encode every request on its own.
+BATCHING_ENABLED = os.environ.get("EMBED_BATCHING", "1") != "0"
+# Largest number of texts encoded together in one forward pass.
+BATCH_MAX_SIZE = int(os.environ.get("EMBED_BATCH_MAX_SIZE", "32"))
+# How long the first request of a batch waits for others to join it.
+BATCH_MAX_WAIT_MS = float(os.environ.get("EMBED_BATCH_MAX_WAIT_MS", "5"))
+# Number of model copies encoding in parallel, each on its own thread.
+REPLICAS = int(os.environ.get("EMBED_REPLICAS", "1"))
+# Intra-op threads per replica. Defaults to an even share of the cores.
+THREADS_PER_REPLICA = int(os.environ.get("EMBED_THREADS_PER_REPLICA", "0")) or max(1, (os.cpu_count() or 1) // max(1, REPLICAS))
+# Batch sizes encoded once per replica before the service reports ready.
+WARMUP_BATCH_SIZES = [int(size) for size in os.environ.get("EMBED_WARMUP_BATCH_SIZES", "1,8,32").split(",") if size.strip()]
+# Texts allowed to wait for the model before requests are turned away with
+# 503 + Retry-After.
+MAX_PENDING = int(os.environ.get("EMBED_MAX_PENDING", "1024"))
+RETRY_AFTER_SECONDS = int(os.environ.get("EMBED_RETRY_AFTER_SECONDS", "1"))
+# Memory bound of the embedding cache in MB. Set to 0 to disable caching.
+CACHE_MAX_MB = float(os.environ.get("EMBED_CACHE_MAX_MB", "64"))
+# Optional age limit for cached vectors. 0 means they never expire.
+CACHE_TTL_SECONDS = float(os.environ.get("EMBED_CACHE_TTL_SECONDS", "0"))
+# Optional SQLite file that keeps the cache across restarts.
+CACHE_DB_PATH = os.environ.get("EMBED_CACHE_DB", "")
+# Upper limit on the number of texts accepted by one /embed_batch call.
+EMBED_BATCH_MAX_TEXTS = int(os.environ.get("EMBED_BATCH_MAX_TEXTS", "512"))
+# Fraction of /embed requests whose text is written to the log. Logging
+# every query is expensive at volume, so only a sample is kept.
+LOG_SAMPLE_RATE = float(os.environ.get("EMBED_LOG_SAMPLE_RATE", "0.01"))
+# Set EMBED_PROFILING=1 to enable POST /debug/profile. Profiles are also
+# written to EMBED_PROFILE_DIR.
+PROFILING_ENABLED = os.environ.get("EMBED_PROFILING", "0") == "1"
+PROFILE_DIR = os.environ.get("EMBED_PROFILE_DIR", "profiles")
+# Gradio-style results not fetched within this many seconds are dropped.
+GRADIO_EVENT_TTL_SECONDS = float(os.environ.get("GRADIO_EVENT_TTL_SECONDS", "60"))
+# Directory holding the catalog matrix used by /search (see catalog.py).
+CATALOG_DIR = os.environ.get("CATALOG_DIR", "catalog")
+# Compressed codes scanned by /search: "none", "int8" or "pq". Codes are
+# trained with `python quantization.py train`.
+CATALOG_QUANTIZATION = os.environ.get("CATALOG_QUANTIZATION", "none")
+# With quantization on, k * CATALOG_RERANK candidates are re-scored exactly.
+CATALOG_RERANK = int(os.environ.get("CATALOG_RERANK", "4"))
+# Directory of the approximate (IVF) index, built with `python ann.py build`.
+ANN_INDEX_DIR = os.environ.get("ANN_INDEX_DIR", "ann_index")
+# Default number of IVF lists probed per query; higher means better recall.
+# Unset keeps the value the index was built with.
+ANN_NPROBE = int(os.environ["ANN_NPROBE"]) if os.environ.get("ANN_NPROBE") else None
+# Label taxonomy for /classify (see classifier.py). Empty uses the built-in
+# category / colour / occasion labels.
+CLASSIFIER_TAXONOMY = os.environ.get("CLASSIFIER_TAXONOMY", "")
+# Precomputed similar-products graph, built with `python similar.py build`.
+SIMILAR_DIR = os.environ.get("SIMILAR_DIR", "similar")
+
+
+# --- 1. Load the AI Model ---
+# We load the model ONCE per process, never per request. Loading runs in the
+# background after the server starts, so /healthz answers immediately while
+# /readyz and the embedding endpoints return 503 until the model is loaded
+# and warmed up. See load_model() and lifespan() below.
+model = None
+loader = ModelLoader()
+
+
+# Encoding runs on dedicated inference threads rather than FastAPI's shared
+# threadpool. Replica 0 uses the model loaded by load_model(); extra replicas
+# get their own copy (or ONNX Runtime session) so they never contend for the
+# same module. Each replica is warmed up on its own thread.
+def load_replica(index):
+    encoder = model if index == 0 else model.clone()
+    seconds = warm_up(encoder, WARMUP_BATCH_SIZES)
+    logger.info(f"Replica {index} warmed up on batch sizes {WARMUP_BATCH_SIZES} in {seconds:.2f}s")
+    return encoder
+
+
+inference_pool = InferencePool(
+    load_replica,
+    replicas=REPLICAS,
+    threads_per_replica=THREADS_PER_REPLICA,
+    # Unbatched requests queue one batch per text; batched ones are held
+    # back in the batcher until a replica frees up.
+    max_queue=MAX_PENDING if not BATCHING_ENABLED else REPLICAS * 2,
+)
+
+
+def load_model():
+    """Blocking: imports the runtime, loads the weights and starts the warmed-up replicas."""
+    global model
+    with loader.step("import"):
+        import_backend(ENCODER_BACKEND)
+    with loader.step("weight_load"):
+        logger.info(f"Loading the sentence-transformer model ({ENCODER_BACKEND} backend)...")
+        model = load_encoder(
+            ENCODER_BACKEND,
+            resolve_local_model(MODEL_NAME),
+            onnx_dir=ONNX_DIR,
+            threads=THREADS_PER_REPLICA,
+        )
+        if cache is not None:
+            # Cache keys may only ignore case if the model does.
+            cache.lowercase = is_uncased(model)
+    with loader.step("warmup"):
+        inference_pool.start()
+
+
+async def encode_batch(texts):
+    """Encodes a list of texts in one call, off the event loop."""
+    return await inference_pool.encode(texts)
+
+
+# --- 2. Request Batching ---
+# Concurrent /embed calls are collected for a few milliseconds and encoded
+# together. One forward pass over 32 sentences costs far less than 32
+# single-sentence passes.
+batcher = MicroBatcher(
+    encode_batch,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    max_inflight=REPLICAS,
+    max_pending=MAX_PENDING,
+)
+
+
+# --- 3. Embedding Cache ---
+# The same category strings and Gemini sub-queries come back all day, so
+# vectors are cached by normalized text (whitespace collapsed; lower-cased too
+# once load_model has found the model to be uncased). Identical requests that
+# arrive while one is still being encoded wait for that encode instead of
+# starting another.
+cache = None
+if CACHE_MAX_MB > 0:
+    store = None
+    if CACHE_DB_PATH:
+        try:
+            store = PersistentStore(CACHE_DB_PATH, MODEL_NAME)
+        except Exception as e:
+            logger.error(f"Failed to open embedding store {CACHE_DB_PATH}: {e}")
+    cache = EmbeddingCache(
+        max_bytes=CACHE_MAX_MB * 1024 * 1024,
+        ttl_seconds=CACHE_TTL_SECONDS,
+        store=store,
+    )
+
+
+# --- 4. Product Catalog ---
+# The catalog matrix is memory-mapped from CATALOG_DIR. It is optional: the
+# embedding endpoints work without it, /search returns 503 until a catalog
+# or an ANN index exists.
+def open_catalog():
+    current = VectorCatalog(CATALOG_DIR, rerank=CATALOG_RERANK)
+    if CATALOG_QUANTIZATION != "none":
+        # current.path is the version that was loaded; CURRENT may have moved on since.
+        current.quantizer = load_quantizer(current.path, CATALOG_QUANTIZATION, expected_rows=current.size)
+    return current
+
+
+def load_catalog():
+    try:
+        return open_catalog()
+    except FileNotFoundError:
+        logger.info(f"No catalog found in '{CATALOG_DIR}', /search is disabled.")
+    except Exception as e:
+        logger.error(f"Failed to load catalog from '{CATALOG_DIR}': {e}")
+    return None
+
+
+catalog = load_catalog()
+
+
+# Once the catalog is too large to score every vector per query, searches go
+# through the IVF index instead. It also takes inserts and deletes, so new
+# products show up without a rebuild.
+def load_ann_index():
+    try:
+        return IVFIndex.load(ANN_INDEX_DIR, nprobe=ANN_NPROBE)
+    except FileNotFoundError:
+        logger.info(f"No ANN index found in '{ANN_INDEX_DIR}', searches will be exact.")
+    except Exception as e:
+        logger.error(f"Failed to load ANN index from '{ANN_INDEX_DIR}': {e}")
+    return None
+
+
+ann_index = load_ann_index()
+
+
+# "More like this" lists are precomputed offline for every product, so
+# /similar/{product_id} is a plain array lookup with no model or scan.
+def load_similar_graph():
+    try:
+        return SimilarityGraph.load(SIMILAR_DIR)
+    except FileNotFoundError:
+        logger.info(f"No similar-products graph found in '{SIMILAR_DIR}', /similar is disabled.")
+    except Exception as e:
+        logger.error(f"Failed to load similar-products graph from '{SIMILAR_DIR}': {e}")
+    return None
+
+
+similar_graph = load_similar_graph()
+
+
+# Label prototypes for /classify are embedded once, right after the model is
+# loaded, and kept as one normalized matrix. They bypass the embedding cache,
+# so they neither count as request misses nor push real traffic out of it.
+classifier = None
+
+
+async def build_classifier():
+    global classifier
+    try:
+        taxonomy = load_taxonomy(CLASSIFIER_TAXONOMY)
+        prompts, _ = LabelClassifier.prompts(taxonomy)
+        classifier = LabelClassifier.from_prompt_vectors(taxonomy, np.stack(await encode_uncached(prompts)))
+        logger.info(f"Classifier ready: {len(classifier.labels)} labels in {list(classifier.facets)}")
+    except Exception as e:
+        logger.error(f"Failed to build the label classifier: {e}")
+
+
+async def start_model():
+    try:
+        await run_in_threadpool(load_model)
+        if BATCHING_ENABLED:
+            await batcher.start()
+        with loader.step("classifier"):
+            await build_classifier()
+        loader.mark_ready()
+    except Exception as e:
+        loader.fail(e)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if LOAD_IN_BACKGROUND:
+        loading = asyncio.create_task(start_model())
+    else:
+        loading = None
+        await start_model()
+    if cache is not None and cache.store is not None:
+        loaded = cache.warm_from_store()
+        logger.info(f"Loaded {loaded} cached embeddings from {cache.store.path}")
+    yield
+    if loading is not None and not loading.done():
+        loading.cancel()
+    await batcher.stop()
+    await run_in_threadpool(inference_pool.stop)
+    if cache is not None and cache.store is not None:
+        cache.store.close()
+
+
+# Results of two-step Gradio calls, waiting for the client's follow-up GET.
+gradio_events = EventStore(ttl_seconds=GRADIO_EVENT_TTL_SECONDS, max_events=MAX_PENDING)
+
+
+# --- 5. Initialize FastAPI App ---
 # This is the main entry point for our API.
 app = FastAPI(
     title="Text Embedding Service",
@@ -16,25 +306,45 @@ app = FastAPI(
         "sentence-transformer model."
     ),
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 
-# --- 2. Load the AI Model ---
-# We load the model here, ONCE, when the application starts up. This is a
-# critical optimization. If we loaded it inside the endpoint function, it
-# would reload from disk on every single API call, which is very slow.
-try:
-    logger.info("Loading the sentence-transformer model...")
-    # 'all-MiniLM-L6-v2' is a great, lightweight model. It creates
-    # 384-dimensional vectors.
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    logger.info("Model loaded successfully.")
-except Exception as e:
-    logger.error(f"Failed to load model: {e}")
-    model = None
+# Every request is timed, and 5xx answers are counted per endpoint. The
+# route template is used as the label so ids in the path don't create
+# a new time series each.
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    endpoint = route.path if route is not None else "unmatched"
+    REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+    if response.status_code >= 500:
+        ERRORS.inc(endpoint=endpoint, status=response.status_code)
+    return response
+
+
+def collect_component_metrics():
+    """Counters kept by the cache and the inference pool, read at scrape time."""
+    samples = []
+    if cache is not None:
+        stats = cache.stats()
+        for name in ("hits", "misses", "coalesced", "evictions", "expirations", "persistent_hits"):
+            samples.append((f"embedding_cache_{name}_total", "counter", f"Embedding cache {name}.", stats[name]))
+        samples.append(("embedding_cache_bytes", "gauge", "Bytes held by the embedding cache.", stats["bytes_used"]))
+    stats = inference_pool.stats()
+    samples.append(("embedding_inference_queue_depth", "gauge", "Batches waiting for a replica.", stats["queue_depth"]))
+    samples.append(("embedding_inference_busy", "gauge", "Replicas currently encoding.", stats["busy"]))
+    samples.append(("embedding_inference_rejected_total", "counter", "Batches rejected by a full queue.", stats["rejected"]))
+    samples.append(("embedding_model_ready", "gauge", "1 once the model is loaded and warmed up.", int(loader.ready)))
+    return samples
 
 
-# --- 3. Define Request Body Structure ---
+metrics.register_collector(collect_component_metrics)
+
+
+# --- 6. Define Request Body Structure ---
 # Using Pydantic's BaseModel ensures that the incoming request data
 # is valid. We expect a JSON object with a single key "text".
 # e.g., { "text": "Cream or Off-white Kurta" }
@@ -42,37 +352,498 @@ class TextInput(BaseModel):
     text: str
 
 
-# --- 4. Create the API Endpoint ---
+# e.g., { "texts": ["Kurta", "Lehenga"], "encoding": "f32" }
+class BatchTextInput(BaseModel):
+    texts: List[str]
+    encoding: Literal["json", "base64", "f32", "f16", "msgpack"] = "json"
+
+
+# e.g., { "queries": ["Cream or Off-white Kurta"], "k": 10 }
+# "ids" optionally restricts the search to the given product ids.
+# "mode" picks exact or approximate (IVF) search; "auto" uses the ANN index
+# when one is loaded. "nprobe" trades recall for speed on approximate search.
+class SearchInput(BaseModel):
+    queries: List[str]
+    k: int = Field(10, ge=1, le=1000)
+    ids: Optional[List[str]] = None
+    mode: Literal["auto", "exact", "ann"] = "auto"
+    nprobe: Optional[int] = Field(None, ge=1)
+
+
+# e.g., { "items": [{ "id": "64f1...", "text": "Cream Kurta" }] }
+class IndexItem(BaseModel):
+    id: str
+    text: str
+
+
+class IndexUpsertInput(BaseModel):
+    items: List[IndexItem]
+
+
+class IndexDeleteInput(BaseModel):
+    ids: List[str]
+
+
+# Request body of the Gradio API, e.g. { "data": ["Cream or Off-white Kurta"] }
+class GradioInput(BaseModel):
+    data: List[str]
+
+
+# e.g., { "texts": ["Maroon embroidered lehenga choli"], "k": 3, "facets": ["category"] }
+class ClassifyInput(BaseModel):
+    texts: List[str]
+    k: int = Field(3, ge=1, le=20)
+    facets: Optional[List[str]] = None
+
+
+# e.g., { "batch_size": 32, "repeats": 20, "profiler": "pyinstrument" }
+class ProfileInput(BaseModel):
+    texts: Optional[List[str]] = None
+    batch_size: int = Field(32, ge=1, le=1024)
+    repeats: int = Field(10, ge=1, le=1000)
+    profiler: Literal["cprofile", "pyinstrument"] = "cprofile"
+
+
+async def encode_uncached(texts):
+    """Encodes texts with the model, batched with other callers if enabled."""
+    if BATCHING_ENABLED:
+        return np.stack(await asyncio.gather(*(batcher.submit(text) for text in texts)))
+    return await encode_batch(texts)
+
+
+async def embed_texts(texts):
+    """Returns one embedding per text, served from the cache where possible."""
+    if cache is None:
+        return await encode_uncached(texts)
+    return await cache.get_many(texts, encode_uncached)
+
+
+async def embed_text(text):
+    """Returns the embedding of one text."""
+    return (await embed_texts([text]))[0]
+
+
+def not_ready_response():
+    return JSONResponse(
+        {"error": "Model is not ready", **loader.status()},
+        status_code=503,
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+    )
+
+
+def overloaded_response():
+    return JSONResponse(
+        {"error": "Service is overloaded, please retry"},
+        status_code=503,
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+    )
+
+
+# --- 7. Create the API Endpoints ---
 # This decorator tells FastAPI to create an endpoint that listens for
 # POST requests at the path '/embed'.
 @app.post("/embed")
-def get_embedding(text_input: TextInput):
+async def get_embedding(text_input: TextInput):
     """
     Receives text input and returns its vector embedding.
     """
-    if model is None:
-        return {"error": "Model is not available"}, 503  # Service Unavailable
+    if not loader.ready:
+        return not_ready_response()
 
     try:
         # The core logic: take the text from the validated request body.
         text_to_embed = text_input.text
-        logger.info(f"Generating embedding for: '{text_to_embed}'")
+        log_text = random.random() < LOG_SAMPLE_RATE
+        if log_text:
+            logger.info(f"Generating embedding for: '{text_to_embed}'")
 
-        # Use the pre-loaded model to encode the text into a vector.
-        embedding = model.encode(text_to_embed)
+        # The model runs on a worker thread, so the event loop stays free to
+        # accept (and batch) other requests in the meantime.
+        embedding = await embed_text(text_to_embed)
 
         # Convert the NumPy array to a list to make it JSON-serializable.
+        started = time.perf_counter()
         embedding_list = embedding.tolist()
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="serialize")
 
-        logger.info("Embedding generated successfully.")
+        if log_text:
+            logger.info("Embedding generated successfully.")
         return {"text": text_to_embed, "vector": embedding_list}
 
+    except Overloaded:
+        return overloaded_response()
+    except Exception as e:
+        logger.error(f"An error occurred during embedding: {e}")
+        return JSONResponse({"error": "Failed to generate embedding"}, status_code=500)
+
+
+@app.post("/embed_batch")
+async def get_embeddings_batch(batch_input: BatchTextInput):
+    """
+    Embeds many texts in one call.
+
+    The response is built straight from the NumPy array in the encoding the
+    client asks for: JSON, base64 float32, raw float32/float16 bytes or
+    msgpack. See serialization.py for the exact layouts.
+    """
+    if not loader.ready:
+        return not_ready_response()
+
+    texts = batch_input.texts
+    if not texts:
+        return JSONResponse({"error": "No texts provided"}, status_code=400)
+    if len(texts) > EMBED_BATCH_MAX_TEXTS:
+        return JSONResponse(
+            {"error": f"At most {EMBED_BATCH_MAX_TEXTS} texts per request"},
+            status_code=413,
+        )
+
+    try:
+        vectors = np.stack(await embed_texts(texts))
+        started = time.perf_counter()
+        body, media_type, headers = encode_vectors(vectors, batch_input.encoding)
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="serialize")
+        return Response(content=body, media_type=media_type, headers=headers)
+
+    except Overloaded:
+        return overloaded_response()
+    except Exception as e:
+        logger.error(f"An error occurred during batch embedding: {e}")
+        return JSONResponse({"error": "Failed to generate embeddings"}, status_code=500)
+
+
+# --- Gradio-compatible routes ---
+# The backend controllers speak the two-step Gradio protocol: POST returns an
+# event id, a GET on that id returns the result as server-sent events. The
+# pair below is a drop-in replacement backed by the same batched model;
+# /gradio_api/run/generate_embedding answers in a single round trip.
+async def gradio_payload(text):
+    embedding = await embed_text(text)
+    return [{"text": text, "vector": embedding}]
+
+
+@app.post("/gradio_api/call/generate_embedding")
+async def gradio_call(gradio_input: GradioInput):
+    """Starts embedding the text and returns the event id to fetch it with."""
+    if not loader.ready:
+        return not_ready_response()
+    if not gradio_input.data:
+        return JSONResponse({"error": "No text provided"}, status_code=400)
+
+    try:
+        event_id = gradio_events.add(gradio_payload(gradio_input.data[0]))
+    except Overloaded:
+        return overloaded_response()
+    return {"event_id": event_id}
+
+
+@app.get("/gradio_api/call/generate_embedding/{event_id}")
+async def gradio_result(event_id: str):
+    """Waits for the embedding of a previous call and returns it as SSE."""
+    try:
+        payload = await gradio_events.pop(event_id)
+        body = encode_sse("complete", payload)
+    except KeyError:
+        return JSONResponse({"error": "Unknown or expired event id"}, status_code=404)
+    except Exception as e:
+        # Gradio reports failures as an "error" event with null data.
+        logger.error(f"Gradio event {event_id} failed: {e}")
+        body = encode_sse("error", None)
+    return Response(content=body, media_type="text/event-stream")
+
+
+@app.post("/gradio_api/run/generate_embedding")
+async def gradio_run(gradio_input: GradioInput):
+    """One round trip: returns {"data": [{"text", "vector"}]} directly."""
+    if not loader.ready:
+        return not_ready_response()
+    if not gradio_input.data:
+        return JSONResponse({"error": "No text provided"}, status_code=400)
+
+    try:
+        payload = await gradio_payload(gradio_input.data[0])
+        started = time.perf_counter()
+        body = encode_json({"data": payload})
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="serialize")
+        return Response(content=body, media_type="application/json")
+    except Overloaded:
+        return overloaded_response()
     except Exception as e:
         logger.error(f"An error occurred during embedding: {e}")
-        return {"error": "Failed to generate embedding"}, 500
+        return JSONResponse({"error": "Failed to generate embedding"}, status_code=500)
+
+
+@app.post("/classify")
+async def classify_texts(classify_input: ClassifyInput):
+    """
+    Tags each text with the most likely labels of every taxonomy facet, with
+    softmax probabilities. "confident" is false when the best label is under
+    the facet's threshold; only those need the external LLM.
+    """
+    if not loader.ready:
+        return not_ready_response()
+    if classifier is None:
+        return JSONResponse({"error": "Classifier is not available"}, status_code=503)
+
+    texts = classify_input.texts
+    if not texts:
+        return JSONResponse({"error": "No texts provided"}, status_code=400)
+    if len(texts) > EMBED_BATCH_MAX_TEXTS:
+        return JSONResponse({"error": f"At most {EMBED_BATCH_MAX_TEXTS} texts per request"}, status_code=413)
+    unknown = [name for name in classify_input.facets or [] if name not in classifier.facets]
+    if unknown:
+        return JSONResponse({"error": f"Unknown facets {unknown}, expected {list(classifier.facets)}"}, status_code=400)
+
+    try:
+        vectors = np.stack(await embed_texts(texts))
+        results = classifier.classify(vectors, classify_input.k, classify_input.facets)
+        return {
+            "results": [
+                {
+                    name: {
+                        "labels": [{"label": label, "score": score} for label, score in facet["labels"]],
+                        "confident": facet["confident"],
+                    }
+                    for name, facet in result.items()
+                }
+                for result in results
+            ]
+        }
+
+    except Overloaded:
+        return overloaded_response()
+    except Exception as e:
+        logger.error(f"An error occurred during classification: {e}")
+        return JSONResponse({"error": "Classification failed"}, status_code=500)
+
+
+@app.post("/search")
+async def search_catalog(search_input: SearchInput):
+    """
+    Embeds the queries and returns the k most similar catalog products for
+    each, by cosine similarity.
+
+    Searches with an id allow-list are always exact.
+    """
+    if not loader.ready:
+        return not_ready_response()
+    if not search_input.queries:
+        return JSONResponse({"error": "No queries provided"}, status_code=400)
+
+    # Take local references so a concurrent reload can't swap them mid-search.
+    current_catalog, current_index = catalog, ann_index
+    use_ann = search_input.ids is None and (
+        search_input.mode == "ann" or (search_input.mode == "auto" and current_index is not None)
+    )
+    if use_ann and current_index is None:
+        return JSONResponse({"error": "ANN index is not loaded"}, status_code=503)
+    if not use_ann and current_catalog is None:
+        return JSONResponse({"error": "Catalog is not loaded"}, status_code=503)
+
+    try:
+        vectors = np.stack(await embed_texts(search_input.queries))
+        if use_ann:
+            results = await run_in_threadpool(
+                current_index.search, vectors, search_input.k, search_input.nprobe
+            )
+        else:
+            results = await run_in_threadpool(
+                current_catalog.search, vectors, search_input.k, search_input.ids
+            )
+        if use_ann:
+            mode = "ann"
+        elif current_catalog.quantizer is not None and search_input.ids is None:
+            mode = current_catalog.quantizer.kind
+        else:
+            mode = "exact"
+        return {
+            "mode": mode,
+            "results": [
+                [{"id": product_id, "score": score} for product_id, score in hits]
+                for hits in results
+            ]
+        }
+
+    except Overloaded:
+        return overloaded_response()
+    except Exception as e:
+        logger.error(f"An error occurred during search: {e}")
+        return JSONResponse({"error": "Search failed"}, status_code=500)
+
+
+@app.post("/search/reload")
+async def reload_catalog():
+    """Re-reads the catalog from disk and swaps it in without a restart."""
+    global catalog
+    try:
+        new_catalog = await run_in_threadpool(open_catalog)
+    except Exception as e:
+        logger.error(f"Failed to reload catalog from '{CATALOG_DIR}': {e}")
+        return JSONResponse({"error": f"Failed to reload catalog: {e}"}, status_code=500)
+
+    catalog = new_catalog
+    return {"status": "reloaded", "size": catalog.size, "dim": catalog.dim}
+
+
+@app.get("/search/stats")
+def search_stats():
+    """Size of the catalog and memory saved by the compressed codes."""
+    if catalog is None:
+        return {"loaded": False}
+    return {"loaded": True, **catalog.memory_stats()}
+
+
+@app.post("/index/upsert")
+async def index_upsert(upsert_input: IndexUpsertInput):
+    """Embeds the given products and inserts (or moves) them in the ANN index."""
+    if not loader.ready:
+        return not_ready_response()
+    if ann_index is None:
+        return JSONResponse({"error": "ANN index is not available"}, status_code=503)
+
+    try:
+        items = upsert_input.items
+        vectors = np.stack(await embed_texts([item.text for item in items]))
+        await run_in_threadpool(ann_index.add, [item.id for item in items], vectors)
+        return {"upserted": len(items), "size": ann_index.size}
+
+    except Overloaded:
+        return overloaded_response()
+    except Exception as e:
+        logger.error(f"An error occurred while updating the ANN index: {e}")
+        return JSONResponse({"error": "Failed to update index"}, status_code=500)
+
+
+@app.post("/index/delete")
+async def index_delete(delete_input: IndexDeleteInput):
+    """Removes products from the ANN index."""
+    if ann_index is None:
+        return JSONResponse({"error": "ANN index is not available"}, status_code=503)
+    removed = await run_in_threadpool(ann_index.remove, delete_input.ids)
+    return {"deleted": removed, "size": ann_index.size}
+
+
+@app.post("/index/save")
+async def index_save():
+    """Writes the ANN index, including inserts and deletes, back to ANN_INDEX_DIR."""
+    if ann_index is None:
+        return JSONResponse({"error": "ANN index is not available"}, status_code=503)
+    try:
+        await run_in_threadpool(ann_index.save, ANN_INDEX_DIR)
+    except Exception as e:
+        logger.error(f"Failed to save ANN index to '{ANN_INDEX_DIR}': {e}")
+        return JSONResponse({"error": f"Failed to save index: {e}"}, status_code=500)
+    return {"status": "saved", **ann_index.stats()}
+
+
+@app.get("/index/stats")
+def index_stats():
+    if ann_index is None:
+        return {"loaded": False}
+    return {"loaded": True, **ann_index.stats()}
+
+
+@app.post("/similar/reload")
+async def reload_similar():
+    """Swaps in the graph last written by `python similar.py build/update`."""
+    global similar_graph
+    try:
+        new_graph = await run_in_threadpool(SimilarityGraph.load, SIMILAR_DIR)
+    except Exception as e:
+        logger.error(f"Failed to reload similar-products graph from '{SIMILAR_DIR}': {e}")
+        return JSONResponse({"error": f"Failed to reload graph: {e}"}, status_code=500)
+
+    similar_graph = new_graph
+    return {"status": "reloaded", **similar_graph.stats()}
+
+
+@app.get("/similar/stats")
+def similar_stats():
+    if similar_graph is None:
+        return {"loaded": False}
+    return {"loaded": True, **similar_graph.stats()}
+
+
+@app.get("/similar/{product_id}")
+def get_similar(product_id: str, k: int = Query(10, ge=1, le=1000)):
+    """The precomputed most similar products for `product_id`, best first."""
+    current_graph = similar_graph
+    if current_graph is None:
+        return JSONResponse({"error": "Similar-products graph is not loaded"}, status_code=503)
+    try:
+        hits = current_graph.similar(product_id, k)
+    except KeyError:
+        return JSONResponse({"error": f"Unknown product id '{product_id}'"}, status_code=404)
+    return {"id": product_id, "results": [{"id": hit_id, "score": score} for hit_id, score in hits]}
+
+
+@app.get("/inference/stats")
+def inference_stats():
+    """Queue depth and per-replica activity of the inference pool."""
+    return {"backend": model.name if model is not None else None, **inference_pool.stats()}
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit, miss and eviction counters of the embedding cache."""
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Stage latencies, batch sizes, cache and error counters for Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/debug/profile")
+async def debug_profile(profile_input: ProfileInput):
+    """
+    Profiles the encode path (tokenize + forward) on one inference replica
+    and returns the report. Enabled with EMBED_PROFILING=1.
+    """
+    if not PROFILING_ENABLED:
+        return JSONResponse({"error": "Profiling is disabled, set EMBED_PROFILING=1"}, status_code=404)
+    if not loader.ready:
+        return not_ready_response()
+
+    texts = profile_input.texts or sample_texts(profile_input.batch_size)
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    extension = "html" if profile_input.profiler == "pyinstrument" else "prof"
+    out_path = os.path.join(PROFILE_DIR, f"encode_{time.strftime('%Y%m%d_%H%M%S')}.{extension}")
+
+    def profile_on(replica):
+        def encode_repeatedly():
+            for _ in range(profile_input.repeats):
+                inference_pool.encode_on(replica, texts)
+        return run_profiled(encode_repeatedly, profile_input.profiler, out_path)
+
+    try:
+        report = await asyncio.wrap_future(inference_pool.call(profile_on))
+    except Overloaded:
+        return overloaded_response()
+    except RuntimeError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    logger.info(f"Wrote {profile_input.profiler} profile to {out_path}")
+    return PlainTextResponse(report, headers={"X-Profile-Path": out_path})
+
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and the event loop is responding."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: 200 once the model is loaded and warmed up, 503 before that."""
+    if not loader.ready:
+        return JSONResponse(loader.status(), status_code=503)
+    return loader.status()
 
 
 # A simple root endpoint to check if the service is running
 @app.get("/")
 def read_root():
-    return {"status": "Embedding service is running."}
+    return {"status": "Embedding service is running.", "model": loader.state}
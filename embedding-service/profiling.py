@@ -0,0 +1,51 @@
+"""
+On-demand profiling of the encode path.
+
+The profiler is switched on inside an inference replica's own thread (see
+InferencePool.call), because both cProfile and pyinstrument only see the
+thread they were started on. pyinstrument is optional.
+"""
+import cProfile
+import io
+import pstats
+
+try:
+    import pyinstrument
+except ImportError:
+    # Only needed for profiler="pyinstrument".
+    pyinstrument = None
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+def run_profiled(fn, profiler="cprofile", out_path=None, top=40):
+    """
+    Calls `fn()` under the chosen profiler and returns a text report. With
+    `out_path`, also writes the raw profile there (a pstats file for
+    cProfile, an HTML page for pyinstrument).
+    """
+    if profiler == "pyinstrument":
+        if pyinstrument is None:
+            raise RuntimeError("pyinstrument is not installed")
+        session = pyinstrument.Profiler(interval=0.0005)
+        session.start()
+        try:
+            fn()
+        finally:
+            session.stop()
+        if out_path is not None:
+            with open(out_path, "w", encoding="utf-8") as f:
+                f.write(session.output_html())
+        return session.output_text(unicode=False, color=False)
+
+    session = cProfile.Profile()
+    session.enable()
+    try:
+        fn()
+    finally:
+        session.disable()
+    if out_path is not None:
+        session.dump_stats(out_path)
+    report = io.StringIO()
+    pstats.Stats(session, stream=report).sort_stats("cumulative").print_stats(top)
+    return report.getvalue()
@@ -0,0 +1,235 @@
+"""
+Compressed storage for catalog vectors.
+
+- "int8": scalar quantization. Each dimension is mapped linearly from its
+  [min, max] range onto 256 levels. 1 byte per dimension, 4x smaller.
+- "pq":   product quantization. The vector is cut into `m` sub-vectors and
+  each is replaced by the id of its nearest centroid in a 256-entry codebook
+  trained for that subspace. `m` bytes per vector; with m=48 a 384-dim
+  MiniLM vector takes 48 bytes instead of 1536.
+
+Codes are kept in RAM and scanned for every query. The float32 matrix stays
+on disk (memory-mapped) and is only read for the shortlist that gets
+re-ranked, see VectorCatalog.score_quantized.
+
+Train the codes for a catalog directory once, after every catalog export:
+
+    python quantization.py train --catalog catalog --kind int8
+    python quantization.py train --catalog catalog --kind pq --m 48
+"""
+import argparse
+import logging
+import os
+
+import numpy as np
+
+from catalog import ROWS_PER_BLOCK, VectorCatalog, resolve_catalog
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("int8", "pq")
+
+
+def _codes_path(path, kind):
+    return os.path.join(path, f"codes_{kind}.npy")
+
+
+def _params_path(path, kind):
+    return os.path.join(path, f"quantizer_{kind}.npz")
+
+
+def _training_sample(vectors, max_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    if vectors.shape[0] <= max_rows:
+        return np.asarray(vectors, dtype=np.float32)
+    rows = np.sort(rng.choice(vectors.shape[0], max_rows, replace=False))
+    return np.asarray(vectors[rows], dtype=np.float32)
+
+
+def kmeans_l2(points, n_clusters, iterations=15, seed=0):
+    """Plain (Euclidean) k-means, used to train the PQ codebooks."""
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, points.shape[0])
+    centroids = points[rng.choice(points.shape[0], n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = nearest_l2(points, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, points)
+        counts = np.bincount(labels, minlength=n_clusters)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+def nearest_l2(points, centroids):
+    """Index of the nearest centroid (Euclidean) for every point."""
+    # |p - c|^2 = |p|^2 - 2 p.c + |c|^2, and |p|^2 doesn't change the argmin.
+    distances = (centroids ** 2).sum(axis=1)[None, :] - 2.0 * points @ centroids.T
+    return np.argmin(distances, axis=1)
+
+
+class ScalarQuantizer:
+    """Per-dimension int8 quantization."""
+
+    kind = "int8"
+
+    def __init__(self, low, scale, codes=None):
+        self.low = np.asarray(low, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.codes = codes
+
+    @classmethod
+    def train(cls, vectors, **_):
+        low = np.full(vectors.shape[1], np.inf, dtype=np.float32)
+        high = np.full(vectors.shape[1], -np.inf, dtype=np.float32)
+        for start in range(0, vectors.shape[0], ROWS_PER_BLOCK):
+            block = np.asarray(vectors[start:start + ROWS_PER_BLOCK])
+            low = np.minimum(low, block.min(axis=0))
+            high = np.maximum(high, block.max(axis=0))
+        scale = np.maximum(high - low, 1e-12) / 255.0
+        return cls(low, scale)
+
+    def encode(self, vectors):
+        levels = np.rint((np.asarray(vectors, dtype=np.float32) - self.low) / self.scale)
+        return (np.clip(levels, 0, 255) - 128).astype(np.int8)
+
+    def prepare(self, queries):
+        # x ~= low + (code + 128) * scale, so
+        # q.x ~= q.(low + 128 * scale) + (q * scale).code
+        return queries * self.scale, queries @ (self.low + 128.0 * self.scale)
+
+    def score_block(self, state, start, end):
+        scaled_queries, offset = state
+        return scaled_queries @ self.codes[start:end].astype(np.float32).T + offset[:, None]
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.low.nbytes + self.scale.nbytes
+
+    def save_params(self, path):
+        np.savez(path, low=self.low, scale=self.scale)
+
+    @classmethod
+    def load_params(cls, path):
+        params = np.load(path)
+        return cls(params["low"], params["scale"])
+
+
+class ProductQuantizer:
+    """Product quantization with 256 centroids per subspace."""
+
+    kind = "pq"
+
+    def __init__(self, codebooks, codes=None):
+        self.codebooks = np.asarray(codebooks, dtype=np.float32)  # (m, 256, dim / m)
+        self.codes = codes
+
+    @property
+    def m(self):
+        return self.codebooks.shape[0]
+
+    @property
+    def sub_dim(self):
+        return self.codebooks.shape[2]
+
+    @classmethod
+    def train(cls, vectors, m=48, iterations=15, max_training_rows=65536, **_):
+        if vectors.shape[1] % m:
+            raise ValueError(f"Dimension {vectors.shape[1]} is not divisible by m={m}")
+        sample = _training_sample(vectors, max_training_rows)
+        sub_dim = vectors.shape[1] // m
+        codebooks = np.stack([
+            kmeans_l2(np.ascontiguousarray(sample[:, j * sub_dim:(j + 1) * sub_dim]), 256, iterations, seed=j)
+            for j in range(m)
+        ])
+        return cls(codebooks)
+
+    def encode(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = np.empty((vectors.shape[0], self.m), dtype=np.uint8)
+        for j in range(self.m):
+            sub = vectors[:, j * self.sub_dim:(j + 1) * self.sub_dim]
+            codes[:, j] = nearest_l2(sub, self.codebooks[j])
+        return codes
+
+    def prepare(self, queries):
+        # Lookup table of every query sub-vector against every centroid,
+        # flattened so a code row can be scored with one np.take.
+        tables = np.einsum("qjd,jcd->qjc", queries.reshape(queries.shape[0], self.m, self.sub_dim), self.codebooks)
+        offsets = (np.arange(self.m) * self.codebooks.shape[1]).astype(np.int64)
+        return tables.reshape(queries.shape[0], -1), offsets
+
+    def score_block(self, state, start, end):
+        tables, offsets = state
+        flat_codes = self.codes[start:end].astype(np.int64) + offsets
+        return np.stack([np.take(table, flat_codes).sum(axis=1) for table in tables])
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.codebooks.nbytes
+
+    def save_params(self, path):
+        np.savez(path, codebooks=self.codebooks)
+
+    @classmethod
+    def load_params(cls, path):
+        return cls(np.load(path)["codebooks"])
+
+
+QUANTIZERS = {"int8": ScalarQuantizer, "pq": ProductQuantizer}
+
+
+def train_quantizer(catalog_dir, kind, **options):
+    """Trains a quantizer on a catalog and writes its parameters and codes next to it."""
+    catalog = VectorCatalog(catalog_dir)
+    # Codes belong to one catalog version, so they are stored inside it.
+    catalog_dir = catalog.path
+    quantizer = QUANTIZERS[kind].train(catalog.vectors, **options)
+
+    codes = None
+    for start in range(0, catalog.size, ROWS_PER_BLOCK):
+        block_codes = quantizer.encode(catalog.vectors[start:start + ROWS_PER_BLOCK])
+        if codes is None:
+            codes = np.empty((catalog.size,) + block_codes.shape[1:], dtype=block_codes.dtype)
+        codes[start:start + ROWS_PER_BLOCK] = block_codes
+    quantizer.codes = codes
+
+    with open(_params_path(catalog_dir, kind) + ".tmp", "wb") as f:
+        quantizer.save_params(f)
+    with open(_codes_path(catalog_dir, kind) + ".tmp", "wb") as f:
+        np.save(f, codes)
+    os.replace(_params_path(catalog_dir, kind) + ".tmp", _params_path(catalog_dir, kind))
+    os.replace(_codes_path(catalog_dir, kind) + ".tmp", _codes_path(catalog_dir, kind))
+    return quantizer
+
+
+def load_quantizer(catalog_dir, kind, expected_rows=None):
+    """Loads a trained quantizer and its codes into memory."""
+    catalog_dir = resolve_catalog(catalog_dir)
+    quantizer = QUANTIZERS[kind].load_params(_params_path(catalog_dir, kind))
+    quantizer.codes = np.load(_codes_path(catalog_dir, kind))
+    if expected_rows is not None and quantizer.codes.shape[0] != expected_rows:
+        raise ValueError(
+            f"{kind} codes cover {quantizer.codes.shape[0]} rows but the catalog has "
+            f"{expected_rows}; re-run `python quantization.py train`"
+        )
+    return quantizer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    train = sub.add_parser("train")
+    train.add_argument("--catalog", default="catalog")
+    train.add_argument("--kind", choices=KINDS, default="int8")
+    train.add_argument("--m", type=int, default=48, help="PQ sub-vectors per vector")
+    train.add_argument("--iterations", type=int, default=15, help="PQ k-means iterations")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    quantizer = train_quantizer(args.catalog, args.kind, m=args.m, iterations=args.iterations)
+    logger.info(f"Wrote {args.kind} codes for {quantizer.codes.shape[0]} vectors ({quantizer.nbytes} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Response encodings for batches of embedding vectors.
+
+Every encoder takes a 2-D float32 NumPy array (one row per text) and works on
+the array's buffer directly, so no per-float Python objects are created.
+
+- "json":    {"count", "dim", "vectors": [[...], ...]}
+- "base64":  {"count", "dim", "dtype": "float32", "data": "<base64>"}
+- "f32":     raw little-endian float32 bytes, row-major
+- "f16":     raw little-endian float16 bytes, row-major
+- "msgpack": {"count", "dim", "dtype": "float32", "data": <bin>}
+
+The binary formats carry the shape in X-Embedding-Count / X-Embedding-Dim /
+X-Embedding-Dtype response headers.
+"""
+import base64
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # orjson is listed in requirements.txt, but keep working without it
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack is listed in requirements.txt, but keep working without it
+    msgpack = None
+
+
+ENCODINGS = ("json", "base64", "f32", "f16", "msgpack")
+
+
+def _shape_headers(vectors, dtype):
+    count, dim = vectors.shape
+    return {
+        "X-Embedding-Count": str(count),
+        "X-Embedding-Dim": str(dim),
+        "X-Embedding-Dtype": dtype,
+    }
+
+
+def _dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    # Slow path, only hit when orjson is not installed.
+    return json.dumps(
+        payload, default=lambda obj: obj.tolist() if isinstance(obj, np.ndarray) else obj
+    ).encode()
+
+
+def encode_json(payload):
+    """JSON bytes of `payload`; NumPy arrays inside it are written as lists."""
+    return _dumps(payload)
+
+
+def encode_sse(event, payload):
+    """One server-sent event whose data line is `payload` as JSON."""
+    return b"event: " + event.encode() + b"\ndata: " + _dumps(payload) + b"\n\n"
+
+
+def encode_vectors(vectors, encoding):
+    """
+    Serializes `vectors` in the requested encoding.
+
+    Returns a (body bytes, media type, extra headers) tuple.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="<f4")
+    if vectors.ndim != 2:
+        raise ValueError(f"Expected a 2-D array of vectors, got shape {vectors.shape}")
+    count, dim = vectors.shape
+
+    if encoding == "json":
+        body = _dumps({"count": count, "dim": dim, "vectors": vectors})
+        return body, "application/json", {}
+
+    if encoding == "base64":
+        data = base64.b64encode(vectors.data).decode("ascii")
+        body = _dumps({"count": count, "dim": dim, "dtype": "float32", "data": data})
+        return body, "application/json", {}
+
+    if encoding == "f32":
+        return vectors.tobytes(), "application/octet-stream", _shape_headers(vectors, "float32")
+
+    if encoding == "f16":
+        half = vectors.astype("<f2")
+        return half.tobytes(), "application/octet-stream", _shape_headers(vectors, "float16")
+
+    if encoding == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("msgpack is not installed")
+        body = msgpack.packb(
+            {"count": count, "dim": dim, "dtype": "float32", "data": vectors.tobytes()},
+            use_bin_type=True,
+        )
+        return body, "application/msgpack", _shape_headers(vectors, "float32")
+
+    raise ValueError(f"Unknown encoding '{encoding}', expected one of {ENCODINGS}")
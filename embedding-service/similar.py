@@ -0,0 +1,263 @@
+"""
+Precomputed "similar products" graph.
+
+For every catalog product the k most similar other products are computed
+once, offline, and stored as two (products x k) arrays:
+
+- neighbours.npy: int32 row numbers of the neighbours, best first; -1 pads
+  rows of catalogs with fewer than k + 1 products
+- scores.npy:     float16 cosine similarities, same layout
+- ids.json:       product id of every row
+
+/similar/{product_id} is then one dict lookup plus one row read from the
+memory-mapped arrays, instead of an embedding and a catalog scan per page
+view.
+
+The build scores blocks of products against blocks of the catalog with
+matrix multiplies on a thread pool (NumPy releases the GIL in BLAS), so the
+working memory is about workers x query block x catalog block floats no
+matter how large the catalog is:
+
+    python similar.py build --catalog catalog --out similar --k 50
+    python similar.py update --catalog catalog --out similar   # after an export
+
+`update` reuses the existing graph: only new products get a full scan, old
+products are only scored against the new ones, and products whose lists
+pointed at a removed product are recomputed. Products whose vector changed
+in place are not detected; run `build` after re-embedding existing texts.
+"""
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from catalog import IDS_FILE, blocked_top_k, top_k, VectorCatalog
+
+logger = logging.getLogger(__name__)
+
+NEIGHBOURS_FILE = "neighbours.npy"
+SCORES_FILE = "scores.npy"
+
+# Products scored together against the catalog, per worker.
+QUERY_ROWS_PER_BLOCK = 256
+
+
+def _catalog_block_rows(memory_mb, workers, query_rows):
+    # Each worker holds a (query_rows x catalog block) score matrix plus
+    # about as much again for argpartition.
+    rows = int(memory_mb * 1024 * 1024 / (workers * query_rows * 4 * 2))
+    return max(1024, rows)
+
+
+def _neighbours_of(vectors, rows, k, catalog_block_rows):
+    """Top-k neighbours of `rows` against every catalog row, excluding themselves."""
+    queries = np.asarray(vectors[rows], dtype=np.float32)
+    local = np.arange(len(rows))
+
+    def score_block(start, end):
+        scores = queries @ np.asarray(vectors[start:end]).T
+        inside = (rows >= start) & (rows < end)
+        scores[local[inside], rows[inside] - start] = -np.inf
+        return scores
+
+    return blocked_top_k(vectors.shape[0], len(rows), score_block, k, rows_per_block=catalog_block_rows)
+
+
+def _fill_rows(vectors, rows, k, neighbours, scores, workers, memory_mb):
+    """Computes full neighbour lists for `rows` and writes them into the output arrays."""
+    block_rows = _catalog_block_rows(memory_mb, workers, QUERY_ROWS_PER_BLOCK)
+    chunks = [rows[i:i + QUERY_ROWS_PER_BLOCK] for i in range(0, len(rows), QUERY_ROWS_PER_BLOCK)]
+
+    def run(chunk):
+        idx, vals = _neighbours_of(vectors, chunk, k, block_rows)
+        found = idx.shape[1]
+        vals = vals.astype(np.float32)
+        # The product itself was masked with -inf; it only survives when the
+        # catalog has fewer than k + 1 products.
+        idx = np.where(np.isfinite(vals), idx, -1)
+        neighbours[chunk, :found] = idx
+        scores[chunk, :found] = vals
+        neighbours[chunk, found:] = -1
+        scores[chunk, found:] = -np.inf
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        for done, _ in enumerate(pool.map(run, chunks), start=1):
+            if done % 50 == 0 or done == len(chunks):
+                logger.info(f"Neighbour lists: {min(done * QUERY_ROWS_PER_BLOCK, len(rows))}/{len(rows)} products")
+
+
+def _merge_new_rows(vectors, old_rows, new_rows, k, neighbours, scores, workers):
+    """Lets the products in `new_rows` into the existing lists of `old_rows`."""
+    new_vectors = np.asarray(vectors[new_rows], dtype=np.float32)
+    chunks = [old_rows[i:i + QUERY_ROWS_PER_BLOCK] for i in range(0, len(old_rows), QUERY_ROWS_PER_BLOCK)]
+
+    def run(chunk):
+        chunk_vectors = np.asarray(vectors[chunk], dtype=np.float32)
+        current = np.asarray(neighbours[chunk])
+        # The stored float16 scores are too coarse to rank against fresh
+        # float32 ones, so the current neighbours are re-scored exactly.
+        current_scores = np.einsum("qd,qkd->qk", chunk_vectors, np.asarray(vectors[np.maximum(current, 0)]))
+        current_scores[current < 0] = -np.inf
+        candidate_scores = chunk_vectors @ new_vectors.T
+        merged_idx = np.concatenate([current, np.broadcast_to(new_rows, candidate_scores.shape)], axis=1)
+        merged_vals = np.concatenate([current_scores, candidate_scores], axis=1)
+        keep, vals = top_k(merged_vals, k)
+        idx = np.take_along_axis(merged_idx, keep, axis=1)
+        neighbours[chunk] = np.where(np.isfinite(vals), idx, -1)
+        scores[chunk] = vals
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(run, chunks))
+
+
+def _open_output(path, shape):
+    os.makedirs(path, exist_ok=True)
+    neighbours = np.lib.format.open_memmap(
+        os.path.join(path, NEIGHBOURS_FILE + ".tmp"), mode="w+", dtype=np.int32, shape=shape
+    )
+    scores = np.lib.format.open_memmap(
+        os.path.join(path, SCORES_FILE + ".tmp"), mode="w+", dtype=np.float16, shape=shape
+    )
+    return neighbours, scores
+
+
+def _commit_output(path, ids, neighbours, scores):
+    """Flushes the temporary files and renames them into place together with ids.json."""
+    neighbours.flush()
+    scores.flush()
+    with open(os.path.join(path, IDS_FILE + ".tmp"), "w") as f:
+        json.dump(ids, f)
+    for name in (NEIGHBOURS_FILE, SCORES_FILE, IDS_FILE):
+        os.replace(os.path.join(path, name + ".tmp"), os.path.join(path, name))
+
+
+def build_graph(catalog_dir, out_dir, k=50, workers=None, memory_mb=1024):
+    """Computes the neighbour lists of every catalog product from scratch."""
+    started = time.perf_counter()
+    catalog = VectorCatalog(catalog_dir)
+    workers = workers or os.cpu_count() or 1
+    neighbours, scores = _open_output(out_dir, (catalog.size, k))
+    _fill_rows(catalog.vectors, np.arange(catalog.size), k, neighbours, scores, workers, memory_mb)
+    _commit_output(out_dir, catalog.ids, neighbours, scores)
+    logger.info(f"Built similar-products graph for {catalog.size} products in {time.perf_counter() - started:.1f}s")
+
+
+def update_graph(catalog_dir, graph_dir, workers=None, memory_mb=1024):
+    """
+    Brings an existing graph in line with the current catalog: adds new
+    products, drops removed ones and repairs lists that referenced them.
+    """
+    started = time.perf_counter()
+    old = SimilarityGraph.load(graph_dir)
+    catalog = VectorCatalog(catalog_dir)
+    workers = workers or os.cpu_count() or 1
+    k = old.k
+
+    # Old row -> new row, -1 for products that left the catalog.
+    old_to_new = np.array([catalog.id_to_row.get(product_id, -1) for product_id in old.ids], dtype=np.int64)
+    old_to_new = np.append(old_to_new, -1)  # so that -1 padding maps to -1
+    old_rows_of_new = np.array([old.id_to_row.get(product_id, -1) for product_id in catalog.ids], dtype=np.int64)
+
+    kept = np.flatnonzero(old_rows_of_new >= 0)
+    added = np.flatnonzero(old_rows_of_new < 0)
+    neighbours, scores = _open_output(graph_dir, (catalog.size, k))
+
+    lost = []
+    for start in range(0, len(kept), QUERY_ROWS_PER_BLOCK):
+        rows = kept[start:start + QUERY_ROWS_PER_BLOCK]
+        previous = np.asarray(old.neighbours[old_rows_of_new[rows]])
+        translated = old_to_new[previous]
+        neighbours[rows] = translated
+        scores[rows] = np.where(translated >= 0, old.scores[old_rows_of_new[rows]], -np.inf)
+        # A list that lost a neighbour may be missing its real k-th
+        # neighbour, so those products are recomputed, like the new ones.
+        lost.append(rows[((translated < 0) & (previous >= 0)).any(axis=1)])
+    lost = np.concatenate(lost) if lost else np.empty(0, dtype=np.int64)
+    recompute = np.union1d(added, lost)
+    unchanged = np.setdiff1d(kept, lost)
+
+    if len(added) and len(unchanged):
+        _merge_new_rows(catalog.vectors, unchanged, added, k, neighbours, scores, workers)
+    if len(recompute):
+        _fill_rows(catalog.vectors, recompute, k, neighbours, scores, workers, memory_mb)
+
+    removed = len(old.ids) - len(kept)
+    del old  # release the memory maps before replacing the files
+    _commit_output(graph_dir, catalog.ids, neighbours, scores)
+    logger.info(
+        f"Updated similar-products graph in {time.perf_counter() - started:.1f}s: "
+        f"{len(added)} added, {removed} removed, {len(lost)} lists repaired"
+    )
+
+
+class SimilarityGraph:
+    """Read-only, memory-mapped neighbour lists."""
+
+    def __init__(self, ids, neighbours, scores):
+        if neighbours.shape != scores.shape or neighbours.shape[0] != len(ids):
+            raise ValueError(f"Graph arrays {neighbours.shape}/{scores.shape} don't match {len(ids)} ids")
+        self.ids = ids
+        self.neighbours = neighbours
+        self.scores = scores
+        self.id_to_row = {product_id: row for row, product_id in enumerate(ids)}
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, IDS_FILE)) as f:
+            ids = json.load(f)
+        neighbours = np.load(os.path.join(path, NEIGHBOURS_FILE), mmap_mode="r")
+        scores = np.load(os.path.join(path, SCORES_FILE), mmap_mode="r")
+        graph = cls(ids, neighbours, scores)
+        logger.info(f"Loaded similar-products graph {path}: {graph.size} products, k={graph.k}")
+        return graph
+
+    @property
+    def size(self):
+        return self.neighbours.shape[0]
+
+    @property
+    def k(self):
+        return self.neighbours.shape[1]
+
+    def similar(self, product_id, k=None):
+        """(product id, score) pairs of the stored neighbours, best first. Raises KeyError."""
+        row = self.id_to_row[product_id]
+        limit = self.k if k is None else min(k, self.k)
+        neighbours = self.neighbours[row, :limit]
+        scores = self.scores[row, :limit]
+        return [(self.ids[j], float(score)) for j, score in zip(neighbours.tolist(), scores) if j >= 0]
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "k": self.k,
+            "bytes": self.neighbours.nbytes + self.scores.nbytes,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("build", "update"):
+        command = sub.add_parser(name)
+        command.add_argument("--catalog", default="catalog", help="Catalog directory (vectors.npy + ids.json)")
+        command.add_argument("--out", default="similar", help="Graph directory")
+        command.add_argument("--workers", type=int, default=None, help="Threads (default: all cores)")
+        command.add_argument("--memory-mb", type=float, default=1024, help="Approximate working memory")
+        if name == "build":
+            command.add_argument("--k", type=int, default=50, help="Neighbours stored per product")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "build":
+        build_graph(args.catalog, args.out, k=args.k, workers=args.workers, memory_mb=args.memory_mb)
+    else:
+        update_graph(args.catalog, args.out, workers=args.workers, memory_mb=args.memory_mb)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Readiness tracking for the background model load.
+
+The server accepts connections straight away; the model is imported, loaded
+and warmed up afterwards. ModelLoader records which step it is in, how long
+each step took and why it failed, for /readyz and the startup log.
+"""
+import contextlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Short category strings and a long product description, so warm-up covers
+# both short and padded long sequences.
+WARMUP_TEXTS = [
+    "Kurta",
+    "Cream or Off-white Kurta",
+    "Women Cream-Coloured Ethnic Motifs Embroidered Straight Kurta with Thread "
+    "Work, round neck, three-quarter regular sleeves, calf length, machine wash",
+]
+
+
+class ModelLoader:
+    """States: starting -> loading -> ready, or failed."""
+
+    def __init__(self):
+        self.state = "starting"
+        self.step_name = None
+        self.error = None
+        self.timings = {}
+        self._started = time.perf_counter()
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    @contextlib.contextmanager
+    def step(self, name):
+        self.state = "loading"
+        self.step_name = name
+        started = time.perf_counter()
+        yield
+        self.timings[f"{name}_s"] = round(time.perf_counter() - started, 3)
+        logger.info(f"Startup step '{name}' took {self.timings[f'{name}_s']:.2f}s")
+
+    def mark_ready(self):
+        self.state = "ready"
+        self.step_name = None
+        self.timings["total_s"] = round(time.perf_counter() - self._started, 3)
+        logger.info(f"Model ready after {self.timings['total_s']:.2f}s: {self.timings}")
+
+    def fail(self, error):
+        self.state = "failed"
+        self.error = str(error)
+        logger.error(f"Model failed to load during '{self.step_name}': {error}")
+
+    def status(self):
+        status = {"status": self.state, "timings": self.timings}
+        if self.step_name is not None:
+            status["step"] = self.step_name
+        if self.error is not None:
+            status["error"] = self.error
+        return status
+
+
+def sample_texts(count):
+    """`count` texts cycling through WARMUP_TEXTS."""
+    return [WARMUP_TEXTS[i % len(WARMUP_TEXTS)] for i in range(count)]
+
+
+def warm_up(encoder, batch_sizes):
+    """
+    Encodes one batch of every size in `batch_sizes`, so allocator pools,
+    kernel selection and lazy initialisation happen before real traffic.
+    """
+    started = time.perf_counter()
+    for size in batch_sizes:
+        encoder.encode(sample_texts(size))
+    return time.perf_counter() - started
@@ -0,0 +1,75 @@
+import numpy as np
+
+from ann import IVFIndex
+
+
+def random_vectors(n, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build(n=200, nlist=8, nprobe=8):
+    return IVFIndex.build([f"p{i}" for i in range(n)], random_vectors(n), nlist=nlist, nprobe=nprobe)
+
+
+def all_ids(index):
+    return sorted(product_id for ids, _ in index.lists for product_id in ids)
+
+
+def test_search_finds_each_vector_itself():
+    vectors = random_vectors(200)
+    index = build()
+    # Probing every list makes the search exact.
+    results = index.search(vectors[:5], k=1, nprobe=index.nlist)
+    assert [result[0][0] for result in results] == ["p0", "p1", "p2", "p3", "p4"]
+    assert all(abs(result[0][1] - 1.0) < 1e-5 for result in results)
+
+
+def test_add_replaces_an_existing_id():
+    index = build()
+    new_vector = random_vectors(1, seed=1)
+    index.add(["p3"], new_vector)
+
+    assert index.size == 200 and all_ids(index).count("p3") == 1
+    best = index.search(new_vector, k=1, nprobe=index.nlist)[0][0]
+    assert best[0] == "p3" and abs(best[1] - 1.0) < 1e-5
+
+
+def test_repeated_id_in_one_batch_keeps_the_last_vector():
+    index = build()
+    vectors = random_vectors(3, seed=2)
+    index.add(["new", "other", "new"], vectors)
+
+    assert all_ids(index).count("new") == 1
+    best = index.search(vectors[2:], k=1, nprobe=index.nlist)[0][0]
+    assert best[0] == "new" and abs(best[1] - 1.0) < 1e-5
+
+    # Removing it leaves no stray copy behind to show up in results.
+    assert index.remove(["new"]) == 1
+    assert "new" not in all_ids(index)
+    hits = index.search(vectors[:1], k=10, nprobe=index.nlist)[0]
+    assert "new" not in [product_id for product_id, _ in hits]
+
+
+def test_remove():
+    index = build()
+    assert index.remove(["p0", "p1", "missing"]) == 2
+    assert index.size == 198 and "p0" not in all_ids(index)
+
+
+def test_save_and_load(tmp_path):
+    index = build(nprobe=3)
+    index.remove(["p7"])
+    index.save(str(tmp_path))
+
+    loaded = IVFIndex.load(str(tmp_path))
+    assert loaded.nprobe == 3
+    assert loaded.size == index.size and all_ids(loaded) == all_ids(index)
+    queries = random_vectors(4, seed=3)
+    assert loaded.search(queries, k=5) == index.search(queries, k=5)
+
+    # Adding to a loaded index replaces as usual.
+    loaded.add(["p8"], random_vectors(1, seed=4))
+    assert all_ids(loaded).count("p8") == 1
+
+    assert IVFIndex.load(str(tmp_path), nprobe=5).nprobe == 5
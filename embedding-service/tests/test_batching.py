@@ -0,0 +1,160 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from batching import MicroBatcher
+from inference import Overloaded
+
+DIM = 4
+
+
+def vector_for(text):
+    return np.full(DIM, float(len(text)), dtype=np.float32)
+
+
+class Encoder:
+    """Async encode_batch stub that records each batch and can be held open or made to fail."""
+
+    def __init__(self, error=None):
+        self.batches = []
+        self.error = error
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def __call__(self, texts):
+        self.batches.append(list(texts))
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return np.stack([vector_for(text) for text in texts])
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def started(encoder, **kwargs):
+    batcher = MicroBatcher(encoder, **kwargs)
+    await batcher.start()
+    return batcher
+
+
+def test_concurrent_submits_are_batched_up_to_max_batch_size():
+    async def scenario():
+        encoder = Encoder()
+        batcher = await started(encoder, max_batch_size=4, max_wait_ms=50)
+        texts = ["x" * length for length in range(1, 11)]
+        vectors = await asyncio.gather(*(batcher.submit(text) for text in texts))
+        await batcher.stop()
+        return encoder, texts, vectors
+
+    encoder, texts, vectors = run(scenario())
+    assert [len(batch) for batch in encoder.batches] == [4, 4, 2]
+    assert [text for batch in encoder.batches for text in batch] == texts
+    # Each caller gets the row for its own text.
+    for text, vector in zip(texts, vectors):
+        assert np.array_equal(vector, vector_for(text))
+
+
+def test_a_lone_request_waits_at_most_max_wait():
+    async def scenario():
+        encoder = Encoder()
+        batcher = await started(encoder, max_batch_size=32, max_wait_ms=50)
+        began = time.perf_counter()
+        vector = await batcher.submit("abc")
+        elapsed = time.perf_counter() - began
+        await batcher.stop()
+        return encoder, vector, elapsed
+
+    encoder, vector, elapsed = run(scenario())
+    assert encoder.batches == [["abc"]] and np.array_equal(vector, vector_for("abc"))
+    assert 0.04 <= elapsed < 1.0
+
+
+def test_a_full_batch_goes_out_without_waiting():
+    async def scenario():
+        encoder = Encoder()
+        batcher = await started(encoder, max_batch_size=3, max_wait_ms=5000)
+        began = time.perf_counter()
+        await asyncio.gather(*(batcher.submit(text) for text in ["a", "bb", "ccc"]))
+        elapsed = time.perf_counter() - began
+        await batcher.stop()
+        return encoder, elapsed
+
+    encoder, elapsed = run(scenario())
+    assert encoder.batches == [["a", "bb", "ccc"]]
+    assert elapsed < 1.0
+
+
+def test_requests_queue_while_the_replica_is_busy_and_go_out_together():
+    async def scenario():
+        encoder = Encoder()
+        encoder.release.clear()
+        batcher = await started(encoder, max_batch_size=8, max_wait_ms=0, max_inflight=1)
+        first = asyncio.create_task(batcher.submit("first"))
+        await asyncio.sleep(0.01)  # the first batch is now being encoded
+        rest = [asyncio.create_task(batcher.submit(text)) for text in ["a", "bb", "ccc"]]
+        await asyncio.sleep(0.01)
+        encoder.release.set()
+        vectors = await asyncio.gather(first, *rest)
+        await batcher.stop()
+        return encoder, vectors
+
+    encoder, vectors = run(scenario())
+    assert encoder.batches == [["first"], ["a", "bb", "ccc"]]
+    for text, vector in zip(["first", "a", "bb", "ccc"], vectors):
+        assert np.array_equal(vector, vector_for(text))
+
+
+def test_an_encode_error_reaches_every_waiter():
+    async def scenario():
+        encoder = Encoder(error=ValueError("model failed"))
+        batcher = await started(encoder, max_batch_size=4, max_wait_ms=20)
+        results = await asyncio.gather(*(batcher.submit(text) for text in ["a", "b", "c"]), return_exceptions=True)
+        # The batcher keeps serving after a failed batch.
+        encoder.error = None
+        vector = await batcher.submit("dd")
+        await batcher.stop()
+        return encoder, results, vector
+
+    encoder, results, vector = run(scenario())
+    assert encoder.batches[0] == ["a", "b", "c"]
+    assert all(isinstance(result, ValueError) and str(result) == "model failed" for result in results)
+    assert np.array_equal(vector, vector_for("dd"))
+
+
+def test_submit_raises_overloaded_beyond_max_pending():
+    async def scenario():
+        encoder = Encoder()
+        encoder.release.clear()
+        batcher = await started(encoder, max_batch_size=1, max_wait_ms=0, max_pending=2)
+        busy = asyncio.create_task(batcher.submit("busy"))
+        await asyncio.sleep(0.01)
+        queued = [asyncio.create_task(batcher.submit(text)) for text in ["a", "b"]]
+        await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded):
+            await batcher.submit("c")
+        encoder.release.set()
+        await asyncio.gather(busy, *queued)
+        await batcher.stop()
+
+    run(scenario())
+
+
+def test_stop_fails_queued_and_in_flight_requests():
+    async def scenario():
+        encoder = Encoder()
+        encoder.release.clear()
+        batcher = await started(encoder, max_batch_size=1, max_wait_ms=0)
+        busy = asyncio.create_task(batcher.submit("busy"))
+        await asyncio.sleep(0.01)
+        queued = asyncio.create_task(batcher.submit("queued"))
+        await asyncio.sleep(0.01)
+        await batcher.stop()
+        return await asyncio.gather(busy, queued, return_exceptions=True)
+
+    busy, queued = run(scenario())
+    assert isinstance(queued, RuntimeError)
+    assert isinstance(busy, RuntimeError)
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from cache import ENTRY_OVERHEAD_BYTES, EmbeddingCache, PersistentStore, normalize_text
+
+DIM = 4
+
+
+def vector_for(text):
+    return np.full(DIM, float(len(text)), dtype=np.float32)
+
+
+class Model:
+    """Async compute stub that records its calls and can be held open."""
+
+    def __init__(self):
+        self.calls = []
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def __call__(self, texts):
+        self.calls.append(list(texts))
+        await self.release.wait()
+        return np.stack([vector_for(text) for text in texts])
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_normalize_text():
+    assert normalize_text("  Red \t kurta\n") == "Red kurta"
+    assert normalize_text("  Red \t kurta\n", lowercase=True) == "red kurta"
+    # No Unicode folding: the tokenizer doesn't do it either.
+    assert normalize_text("ﬁt") == "ﬁt"
+
+
+def test_hit_after_miss_and_original_text_is_encoded():
+    async def main():
+        cache = EmbeddingCache(max_bytes=1 << 20)
+        model = Model()
+        first = await cache.get_many(["  Red   kurta "], model)
+        second = await cache.get_many(["Red kurta"], model)
+        return cache, model, first, second
+
+    cache, model, first, second = run(main())
+    assert model.calls == [["  Red   kurta "]]
+    np.testing.assert_array_equal(first[0], second[0])
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_case_is_kept_unless_lowercase():
+    async def main(lowercase):
+        cache = EmbeddingCache(max_bytes=1 << 20, lowercase=lowercase)
+        model = Model()
+        await cache.get_many(["Kurta", "kurta"], model)
+        return model.calls
+
+    assert run(main(False)) == [["Kurta", "kurta"]]
+    assert run(main(True)) == [["Kurta"]]
+
+
+def test_concurrent_callers_share_one_encode():
+    async def main():
+        cache = EmbeddingCache(max_bytes=1 << 20)
+        model = Model()
+        model.release.clear()
+        tasks = [asyncio.create_task(cache.get_many(["saree"], model)) for _ in range(3)]
+        await asyncio.sleep(0)
+        model.release.set()
+        return cache, model, await asyncio.gather(*tasks)
+
+    cache, model, results = run(main())
+    assert model.calls == [["saree"]]
+    for result in results:
+        np.testing.assert_array_equal(result[0], vector_for("saree"))
+    assert cache.stats()["misses"] == 1 and cache.stats()["coalesced"] == 2
+    assert not cache._inflight
+
+
+@pytest.mark.parametrize("cancelled", [0, 1, 2])
+def test_cancelled_caller_does_not_fail_the_others(cancelled):
+    async def main():
+        cache = EmbeddingCache(max_bytes=1 << 20)
+        model = Model()
+        model.release.clear()
+        tasks = []
+        for _ in range(3):
+            tasks.append(asyncio.create_task(cache.get_many(["saree"], model)))
+            await asyncio.sleep(0)
+        tasks[cancelled].cancel()
+        await asyncio.sleep(0)
+        model.release.set()
+        return model, await asyncio.gather(*tasks, return_exceptions=True)
+
+    model, results = run(main())
+    assert model.calls == [["saree"]]
+    for i, result in enumerate(results):
+        if i == cancelled:
+            assert isinstance(result, asyncio.CancelledError)
+        else:
+            np.testing.assert_array_equal(result[0], vector_for("saree"))
+
+
+def test_compute_error_reaches_every_caller():
+    async def failing(texts):
+        await asyncio.sleep(0)
+        raise ValueError("model failed")
+
+    async def main():
+        cache = EmbeddingCache(max_bytes=1 << 20)
+        tasks = [asyncio.create_task(cache.get_many(["saree"], failing)) for _ in range(2)]
+        return cache, await asyncio.gather(*tasks, return_exceptions=True)
+
+    cache, results = run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert not cache._inflight
+
+
+def test_lru_eviction_respects_the_byte_bound():
+    entry = DIM * 4 + 1 + ENTRY_OVERHEAD_BYTES
+
+    async def main():
+        cache = EmbeddingCache(max_bytes=2 * entry)
+        model = Model()
+        await cache.get_many(["a", "b"], model)
+        await cache.get_many(["a"], model)  # "b" is now least recently used
+        await cache.get_many(["c"], model)
+        await cache.get_many(["a", "b"], model)
+        return cache, model
+
+    cache, model = run(main())
+    assert model.calls == [["a", "b"], ["c"], ["b"]]
+    assert cache.bytes_used <= cache.max_bytes
+    assert cache.stats()["evictions"] == 2
+
+
+def test_persistent_store_is_read_off_the_event_loop(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    loop_thread = threading.get_ident()
+    read_threads = []
+
+    async def main():
+        store = PersistentStore(path, "model-a")
+        await EmbeddingCache(max_bytes=1 << 20, store=store).get_many(["saree", "kurta"], Model())
+        store.close()
+
+        store = PersistentStore(path, "model-a")
+        get_many = store.get_many
+        store.get_many = lambda *args: read_threads.append(threading.get_ident()) or get_many(*args)
+        cache = EmbeddingCache(max_bytes=1 << 20, store=store)
+        model = Model()
+        result = await cache.get_many(["saree", "kurta", "lehenga"], model)
+        store.close()
+        return cache, model, result
+
+    cache, model, result = run(main())
+    assert model.calls == [["lehenga"]]
+    np.testing.assert_array_equal(result[0], vector_for("saree"))
+    assert cache.stats()["persistent_hits"] == 2
+    assert read_threads and loop_thread not in read_threads
+
+
+def test_persistent_store_is_cleared_for_another_model(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    store = PersistentStore(path, "model-a")
+    store.put_many([("saree", vector_for("saree"))], created=1.0)
+    store.close()
+
+    store = PersistentStore(path, "model-b")
+    assert store.get_many(["saree"]) == {}
+    store.close()
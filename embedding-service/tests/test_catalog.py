@@ -0,0 +1,43 @@
+import json
+import os
+
+import numpy as np
+
+from catalog import CURRENT_FILE, IDS_FILE, VECTORS_FILE, VERSIONS_DIR, VectorCatalog, write_catalog
+
+
+def random_vectors(n, dim=8, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def test_rewrite_switches_versions_atomically(tmp_path):
+    path = str(tmp_path / "catalog")
+    write_catalog(path, ["a", "b", "c"], random_vectors(3))
+    old = VectorCatalog(path)
+
+    write_catalog(path, ["d", "e"], random_vectors(2, seed=1))
+    new = VectorCatalog(path)
+
+    assert new.ids == ["d", "e"] and new.size == 2
+    # The instance loaded before the rewrite still has a consistent pair.
+    assert old.ids == ["a", "b", "c"] and old.size == 3
+    assert old.search(np.asarray(old.vectors[1]), k=1)[0][0][0] == "b"
+
+
+def test_old_versions_are_pruned(tmp_path):
+    path = str(tmp_path / "catalog")
+    for seed in range(4):
+        write_catalog(path, ["a"], random_vectors(1, seed=seed))
+    with open(os.path.join(path, CURRENT_FILE)) as f:
+        current = json.load(f)["version"]
+    versions = sorted(os.listdir(os.path.join(path, VERSIONS_DIR)))
+    assert len(versions) == 2 and versions[-1] == current
+
+
+def test_flat_catalog_directory_still_loads(tmp_path):
+    vectors = random_vectors(2)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.save(tmp_path / VECTORS_FILE, vectors)
+    (tmp_path / IDS_FILE).write_text(json.dumps(["x", "y"]))
+    catalog = VectorCatalog(str(tmp_path))
+    assert catalog.ids == ["x", "y"] and catalog.path == str(tmp_path)